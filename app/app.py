@@ -1,68 +1,147 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 from datetime import datetime
-import pandas as pd
 from typing import Dict, List
 import os
-import csv
+import sys
+import json
+import math
 
-from routing.dijkstra import ChargingRouter, Station
-from ml.load_predictor import LoadPredictor
+# Settings live in config/config.py at the repository root
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from config.config import Config
+from routing.cache import TTLCache
+from routing.dijkstra import ChargingRouter, SEARCH_METHODS
+from routing.loader import load_stations
+from routing.matrix import DistanceMatrix
+from ml.load_snapshot import LoadRefresher
+from ml.training import ModelStore
 
 app = Flask(__name__)
 CORS(app)
 
-# Initialize components
-router = ChargingRouter()
-load_predictor = LoadPredictor()
+# Initialize components; frequently queried origins keep shortest path trees
+# that are repaired, not recomputed, when stations change status
+router = ChargingRouter(hot_trees=int(os.getenv('HOT_ORIGIN_TREES', 32)))
 
-# Load historical data for ML predictions
-HISTORICAL_DATA_PATH = 'data/historical_loads.csv'
-if os.path.exists(HISTORICAL_DATA_PATH):
-    historical_data = pd.read_csv(HISTORICAL_DATA_PATH)
-    historical_data['timestamp'] = pd.to_datetime(historical_data['timestamp'])
-    load_predictor.train(historical_data)
+# The load model is never trained here: python -m utils.update_load_model
+# publishes versioned models to MODEL_DIR and the load refresher swaps a new
+# (or rolled back) version in as soon as it notices the switch. A model saved
+# before versioning is migrated with an index of the training data.
+# LOAD_MODEL_BACKEND=flat predicts on a flattened NumPy forest: faster, but
+# every worker holds its own copy of the forest's node arrays (about 40 bytes
+# per node, up to about 25 MB per worker for 300 trees of depth 10) while the
+# default scikit-learn backend shares the memory-mapped model
+MODEL_DIR = 'models'
+model_store = ModelStore(MODEL_DIR, backend=os.getenv('LOAD_MODEL_BACKEND', 'sklearn'),
+                         data_path=Config.TRAINING_DATA_PATH)
+if model_store.active.version is None:
+    app.logger.warning('No trained load model in %s; run python -m utils.update_load_model',
+                       MODEL_DIR)
 
-# Load saved model if available
-MODEL_PATH = 'models/load_predictor.joblib'
-SCALER_PATH = 'models/scaler.joblib'
-if os.path.exists(MODEL_PATH) and os.path.exists(SCALER_PATH):
-    load_predictor.load_model(MODEL_PATH, SCALER_PATH)
+# Route results keyed on request, load-snapshot version and graph version;
+# status updates evict the entries they affect
+route_cache = TTLCache(maxsize=int(os.getenv('ROUTE_CACHE_SIZE', 1024)),
+                         ttl=float(os.getenv('ROUTE_CACHE_TTL', 300)))
 
 # Serve frontend static files and HTML
 FRONTEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../frontend'))
 
-def load_stations_from_csv(csv_path):
-    with open(csv_path, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        station_id = 1
-        for row in reader:
-            # Parse coordinates from 'New Georeferenced Column'
-            try:
-                point = row['New Georeferenced Column']
-                lng, lat = point.replace('POINT (', '').replace(')', '').split()
-                lat, lng = float(lat), float(lng)
-            except Exception:
-                continue  # skip if coordinates are invalid
-
-            name = row['Station Name']
-            # Use Level 2 chargers as capacity, fallback to 1 if NONE
-            capacity = int(row['EV Level2 EVSE Num']) if row['EV Level2 EVSE Num'] != 'NONE' and row['EV Level2 EVSE Num'].isdigit() else 1
-            current_load = 0.0  # Assume empty for now
-            status = 'available'
-            charging_rate = 50  # Default value
-
-            router.add_station(Station(
-                station_id, name, lat, lng, capacity, current_load, status, charging_rate
-            ))
-            station_id += 1
-
-    # Optionally, add connections (for demo, connect each to the next)
-    for i in range(1, station_id - 1):
-        router.add_connection(i, i + 1, 1.0)  # Dummy distance
-
-# Call the loader function after router is initialized
-load_stations_from_csv('../Electric_Vehicle_Charging_Stations.csv')
+# Road graph: k nearest neighbours per station, optionally capped by radius (km)
+# (Config defaults, overridable through the environment)
+GRAPH_NEIGHBORS = int(os.getenv('GRAPH_NEIGHBORS', Config.GRAPH_NEIGHBORS))
+GRAPH_RADIUS_KM = float(os.getenv('GRAPH_RADIUS_KM')) if os.getenv('GRAPH_RADIUS_KM') \
+    else Config.GRAPH_RADIUS_KM
+
+# The parsed graph is kept as a memory-mapped binary snapshot and only rebuilt
+# from the CSV when the file's checksum or the neighbour settings change
+STATIONS_CSV_PATH = '../Electric_Vehicle_Charging_Stations.csv'
+GRAPH_SNAPSHOT_DIR = 'models/graph_snapshot'
+load_stations(router, STATIONS_CSV_PATH, GRAPH_SNAPSHOT_DIR,
+              k=GRAPH_NEIGHBORS, radius_km=GRAPH_RADIUS_KM)
+
+# Load a precomputed contraction hierarchy for search_method='ch' if one
+# matches the current station set
+HIERARCHY_PATH = 'models/contraction_hierarchy.npz'
+if os.path.exists(HIERARCHY_PATH):
+    try:
+        router.load_contraction_hierarchy(HIERARCHY_PATH)
+    except ValueError:
+        app.logger.warning('Ignoring stale contraction hierarchy at %s', HIERARCHY_PATH)
+
+# Precomputed station distance matrices (python -m utils.build_distance_matrix),
+# memory-mapped so all workers share one copy
+DISTANCE_MATRIX_DIR = 'models/distance_matrix'
+distance_matrix = None
+if os.path.exists(os.path.join(DISTANCE_MATRIX_DIR, 'station_ids.npy')):
+    distance_matrix = DistanceMatrix(DISTANCE_MATRIX_DIR)
+    if not distance_matrix.matches(router.graph, k=GRAPH_NEIGHBORS, radius_km=GRAPH_RADIUS_KM):
+        app.logger.warning('Ignoring stale distance matrix at %s', DISTANCE_MATRIX_DIR)
+        distance_matrix = None
+
+# Hours of per-station load profile precomputed for time-dependent routing
+LOAD_PROFILE_HOURS = int(os.getenv('LOAD_PROFILE_HOURS', Config.LOAD_PROFILE_HOURS))
+# Alternative routes: upper bound on k and on nodes settled to find them
+MAX_ALTERNATIVE_ROUTES = int(os.getenv('MAX_ALTERNATIVE_ROUTES', Config.MAX_ALTERNATIVE_ROUTES))
+ALTERNATIVE_MAX_SETTLED = int(os.getenv('ALTERNATIVE_MAX_SETTLED', Config.ALTERNATIVE_MAX_SETTLED))
+DEPARTURE_BUCKET_MINUTES = 5  # departure times are rounded down for caching
+
+# Predicted loads of every station for the current and following hours are
+# computed in the background and published as an immutable snapshot, so
+# request handlers never call the model (refresh check every
+# Config.UPDATE_INTERVAL unless LOAD_REFRESH_SECONDS is set)
+LOAD_REFRESH_SECONDS = float(os.getenv('LOAD_REFRESH_SECONDS',
+                                       Config.UPDATE_INTERVAL.total_seconds()))
+load_refresher = LoadRefresher(
+    model_store,
+    station_ids=lambda: router.graph.ids,
+    hours=LOAD_PROFILE_HOURS,
+    interval=LOAD_REFRESH_SECONDS
+)
+load_refresher.start()
+
+def get_load_profiles(snapshot):
+    """
+    Hourly predicted loads of the snapshot with rows aligned with
+    router.graph.ids; bucket 0 is the hour starting at snapshot.start.
+    """
+    return snapshot.profiles(router.graph.ids)
+
+def battery_params(source: Dict, defaults: Dict) -> tuple:
+    """
+    battery_capacity, current_charge and vehicle_efficiency of a request as
+    floats, falling back to defaults; raises ValueError naming the bad field.
+    """
+    params = []
+    for name in ('battery_capacity', 'current_charge', 'vehicle_efficiency'):
+        value = source.get(name, defaults[name])
+        try:
+            value = math.nan if isinstance(value, bool) else float(value)
+        except (TypeError, ValueError):
+            value = math.nan
+        if name == 'current_charge':
+            if not 0 <= value <= 100:
+                raise ValueError('current_charge must be a percentage')
+        elif not 0 < value < math.inf:
+            raise ValueError(f'{name} must be a positive number')
+        params.append(value)
+    return tuple(params)
+
+def describe_route(route: List[int], loads: List[float]) -> List[Dict]:
+    """Station details for every stop of a route."""
+    route_details = []
+    for i, (station_id, predicted_load) in enumerate(zip(route, loads)):
+        station_info = router.get_station_info(station_id)
+        route_details.append({
+            'id': station_id,
+            'name': station_info['name'],
+            'lat': station_info['lat'],
+            'lng': station_info['lng'],
+            'charging_rate': station_info['charging_rate'],
+            'predicted_load': predicted_load,
+            'is_final': i == len(route) - 1
+        })
+    return route_details
 
 @app.route('/')
 def serve_index():
@@ -106,49 +185,257 @@ def get_route():
     battery_capacity = data.get('battery_capacity', 75)  # kWh
     current_charge = data.get('current_charge', 20)  # percentage
     vehicle_efficiency = data.get('vehicle_efficiency', 0.2)  # kWh/km
+    search_method = data.get('search_method', 'astar')
+    if search_method == 'ch' and router.hierarchy is None:
+        search_method = 'astar'
+    plan_charging = data.get('plan_charging', False)  # track charge and add charging stops
+    min_charge = data.get('min_charge', 0)  # reserve percentage
+    time_dependent = data.get('time_dependent', False)  # loads at actual arrival times
+    k = data.get('k', 1)  # number of alternative routes
+    if search_method not in SEARCH_METHODS:
+        return jsonify({
+            'error': f'Unknown search method: {search_method}'
+        }), 400
+    try:
+        k = min(int(k), MAX_ALTERNATIVE_ROUTES)
+    except (TypeError, ValueError):
+        return jsonify({
+            'error': 'k must be an integer'
+        }), 400
+    if k < 1:
+        return jsonify({
+            'error': 'k must be at least 1'
+        }), 400
+    try:
+        known = start_id in router.graph and end_id in router.graph
+    except TypeError:  # unhashable id
+        known = False
+    if not known:
+        return jsonify({
+            'error': 'Station not found'
+        }), 404
     
-    # Get predicted loads for all stations
-    predicted_loads = load_predictor.predict_loads_for_route(
-        list(router.graph.nodes()),
-        datetime.now(),
-        historical_data
-    )
+    # Identical requests against the same graph and load snapshot share a
+    # result. Without charging stops a route depends on the vehicle only
+    # through its longest possible hop; a charging plan on the exact battery
+    vehicle = (battery_capacity, current_charge, vehicle_efficiency) if plan_charging \
+        else (router.max_hop(battery_capacity, current_charge, vehicle_efficiency),)
+    snapshot = load_refresher.snapshot
+    start_minute = None
+    if time_dependent and not plan_charging:
+        # Minutes into the snapshot's first hour bucket
+        elapsed = (datetime.now() - snapshot.start).total_seconds() / 60
+        start_minute = max(0, int(elapsed)) // DEPARTURE_BUCKET_MINUTES * DEPARTURE_BUCKET_MINUTES
+    cache_key = (start_id, end_id, vehicle,
+                 search_method, bool(plan_charging), min_charge, start_minute, k,
+                 snapshot.version, router.version)
+    cached = route_cache.get(cache_key)
+    if cached is not None:
+        _, payload, status_code = cached
+        return jsonify(payload), status_code
     
-    # Find optimal route
-    route, total_distance = router.find_optimal_route(
-        start_id,
-        end_id,
-        battery_capacity,
-        current_charge,
-        vehicle_efficiency,
-        predicted_loads
-    )
+    # Get predicted loads for all stations; time-dependent routes use profiles
+    predicted_loads = {} if start_minute is not None else snapshot.current
+    
+    # Find optimal route, planning charging stops if requested
+    charging_plan = None
+    timed_route = None
+    alternatives = None
+    if plan_charging:
+        charging_plan = router.plan_charging_route(
+            start_id,
+            end_id,
+            battery_capacity,
+            current_charge,
+            vehicle_efficiency,
+            predicted_loads,
+            min_charge=min_charge
+        )
+        route, total_distance = charging_plan.route, charging_plan.total_distance
+    elif start_minute is not None:
+        load_profiles = get_load_profiles(snapshot)
+        timed_route = router.find_time_dependent_route(
+            start_id,
+            end_id,
+            battery_capacity,
+            current_charge,
+            vehicle_efficiency,
+            load_profiles,
+            start_minute=start_minute
+        )
+        route, total_distance = timed_route.route, timed_route.total_distance
+    elif k > 1:
+        alternatives = router.find_alternative_routes(
+            start_id,
+            end_id,
+            battery_capacity,
+            current_charge,
+            vehicle_efficiency,
+            predicted_loads,
+            k=k,
+            max_settled=ALTERNATIVE_MAX_SETTLED
+        )
+        route, total_distance = [], float('inf')
+        if alternatives:
+            route, total_distance = alternatives[0].route, alternatives[0].total_distance
+    else:
+        route, total_distance = router.find_optimal_route(
+            start_id,
+            end_id,
+            battery_capacity,
+            current_charge,
+            vehicle_efficiency,
+            predicted_loads,
+            method=search_method
+        )
     
     if not route:
-        return jsonify({
+        payload = {
             'error': 'No feasible route found'
-        }), 404
+        }
+        route_cache.put(cache_key, (frozenset(), payload, 404))
+        return jsonify(payload), 404
     
     # Prepare route details
-    route_details = []
-    for i, station_id in enumerate(route):
-        station_info = router.get_station_info(station_id)
-        predicted_load = predicted_loads.get(station_id, 0)
-        
-        route_details.append({
-            'id': station_id,
-            'name': station_info['name'],
-            'lat': station_info['lat'],
-            'lng': station_info['lng'],
-            'charging_rate': station_info['charging_rate'],
-            'predicted_load': predicted_load,
-            'is_final': i == len(route) - 1
-        })
+    loads = [predicted_loads.get(station_id, 0) for station_id in route]
+    if timed_route is not None:
+        # Load for the hour the vehicle actually reaches the station
+        loads = []
+        for station_id, arrival in zip(route, timed_route.arrival_minutes):
+            bucket = min(int((start_minute + arrival) // 60), snapshot.hours - 1)
+            loads.append(float(load_profiles[router.graph.index_of(station_id), bucket]))
+    route_details = describe_route(route, loads)
     
-    return jsonify({
+    response = {
         'route': route_details,
         'total_distance': total_distance,
         'estimated_time': total_distance * 2  # Rough estimate: 2 minutes per km
+    }
+    if timed_route is not None:
+        response['arrival_minutes'] = timed_route.arrival_minutes
+    if alternatives is not None:
+        # Every candidate, best first, so clients can switch without a new request
+        response['alternatives'] = [{
+            'route': describe_route(alternative.route,
+                                    [predicted_loads.get(station_id, 0)
+                                     for station_id in alternative.route]),
+            'total_distance': alternative.total_distance,
+            'estimated_time': alternative.total_distance * 2
+        } for alternative in alternatives]
+    if charging_plan is not None:
+        response['estimated_time'] = charging_plan.total_minutes
+        response['charging_stops'] = charging_plan.charging_stops
+        response['arrival_charge'] = charging_plan.arrival_charge
+    stations = set(route)
+    for alternative in alternatives or []:
+        stations.update(alternative.route)
+    route_cache.put(cache_key, (frozenset(stations), response, 200))
+    return jsonify(response)
+
+@app.route('/api/routes/batch', methods=['POST'])
+def get_routes_batch():
+    """
+    Get optimal routes for many origin/destination pairs.
+    
+    Pairs are grouped by origin (and battery parameters) and each group is
+    answered from one shared one-to-many search; predicted loads come from one
+    load snapshot for the whole batch. Results stream back as one JSON object per line,
+    tagged with the index of the pair in the request.
+    """
+    data = request.json or {}
+    pairs = data.get('pairs')
+    if not pairs:
+        return jsonify({
+            'error': 'Missing required field: pairs'
+        }), 400
+    if not isinstance(pairs, list) or not all(isinstance(pair, dict) for pair in pairs):
+        return jsonify({
+            'error': 'pairs must be a list of objects'
+        }), 400
+    
+    defaults = {
+        'battery_capacity': 75,  # kWh
+        'current_charge': 20,  # percentage
+        'vehicle_efficiency': 0.2  # kWh/km
+    }
+    # Everything is validated before the first line is streamed, since an
+    # error after the 200 header could only cut the response short
+    groups: Dict[tuple, List] = {}
+    try:
+        defaults = dict(zip(defaults, battery_params(data, defaults)))
+        for index, pair in enumerate(pairs):
+            try:
+                params = battery_params(pair, defaults)
+            except ValueError as e:
+                raise ValueError(f'pairs[{index}]: {e}')
+            start_id, end_id = pair.get('start_id'), pair.get('end_id')
+            for value in (start_id, end_id):
+                try:
+                    hash(value)
+                except TypeError:
+                    raise ValueError(f'pairs[{index}]: station ids must be scalars')
+            groups.setdefault((start_id,) + params, []).append((index, end_id))
+    except ValueError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+    
+    predicted_loads = load_refresher.snapshot.current
+    
+    def generate():
+        for (start_id, *params), members in groups.items():
+            # Unknown stations fail only their own pairs
+            known = [(index, end_id) for index, end_id in members
+                     if start_id in router.graph and end_id in router.graph]
+            results = {}
+            if known:
+                routes = router.find_routes_from(start_id, [end_id for _, end_id in known],
+                                                 *params, predicted_loads=predicted_loads)
+                results = {index: route for (index, _), route in zip(known, routes)}
+            for index, end_id in members:
+                result = results.get(index)
+                line = {'index': index, 'start_id': start_id, 'end_id': end_id}
+                if result is None:
+                    line['error'] = 'Station not found'
+                elif not result.route:
+                    line['error'] = 'No feasible route found'
+                else:
+                    line.update({
+                        'route': result.route,
+                        'total_distance': result.total_distance,
+                        'estimated_time': result.total_distance * 2  # 2 minutes per km
+                    })
+                yield json.dumps(line) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/stations/<int:station1_id>/distance/<int:station2_id>', methods=['GET'])
+def get_station_distance(station1_id, station2_id):
+    """Get precomputed road and great-circle distance between two stations."""
+    if distance_matrix is None:
+        return jsonify({
+            'error': 'Distance matrix not available'
+        }), 503
+    try:
+        road_distance = distance_matrix.road_distance(station1_id, station2_id)
+        great_circle = distance_matrix.great_circle_distance(station1_id, station2_id)
+    except KeyError:
+        return jsonify({
+            'error': 'Station not found'
+        }), 404
+    return jsonify({
+        'road_distance': road_distance if road_distance != float('inf') else None,
+        'great_circle_distance': great_circle
+    })
+
+@app.route('/api/route/cache', methods=['GET'])
+def get_route_cache_stats():
+    """Get counters of the route cache, load snapshot refresher and tree cache."""
+    return jsonify({
+        'routes': route_cache.stats(),
+        'predictions': load_refresher.stats(),
+        'hot_trees': router.trees.stats(),
+        'graph_version': router.version
     })
 
 @app.route('/api/station/<int:station_id>/status', methods=['GET'])
@@ -156,11 +443,7 @@ def get_station_status(station_id):
     """Get current status of a specific station."""
     try:
         station_info = router.get_station_info(station_id)
-        predicted_load = load_predictor.predict_load(
-            station_id,
-            datetime.now(),
-            historical_data
-        )
+        predicted_load = load_refresher.snapshot.load(station_id)
         
         return jsonify({
             'id': station_id,
@@ -187,7 +470,12 @@ def update_station_status(station_id):
             'error': 'Missing required fields'
         }), 400
     
-    router.update_station_status(station_id, current_load, status)
+    if router.update_station_status(station_id, current_load, status):
+        if router.get_station_info(station_id)['status'] == 'available':
+            # A reopened station can shorten any route or make one feasible
+            route_cache.clear()
+        else:
+            route_cache.evict(lambda key, entry: station_id in entry[0])
     return jsonify({
         'message': 'Station status updated successfully'
     })
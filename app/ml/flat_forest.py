@@ -0,0 +1,53 @@
+import numpy as np
+
+class FlatForest:
+    """
+    A fitted RandomForestRegressor flattened into packed node arrays.
+
+    All trees share one set of arrays; ``roots`` holds the first node of
+    each tree and ``children[2 * node + went_left]`` the next node. Leaves
+    point at themselves and test feature 0, so every (tree, row) pair takes
+    the same number of steps (the forest's depth) and the whole batch is
+    traversed with a handful of vectorized gathers, without scikit-learn's
+    validation and thread dispatch.
+    """
+
+    def __init__(self, model):
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        sizes = np.array([tree.node_count for tree in trees], dtype=np.int64)
+        self.roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+        self.n_features = model.n_features_in_
+
+        feature, threshold, children, value = [], [], [], []
+        for tree, root in zip(trees, self.roots.tolist()):
+            nodes = np.arange(tree.node_count) + root
+            leaf = tree.children_left < 0
+            feature.append(np.where(leaf, 0, tree.feature))
+            threshold.append(np.where(leaf, 0.0, tree.threshold))
+            children.append(np.column_stack([np.where(leaf, nodes, tree.children_right + root),
+                                             np.where(leaf, nodes, tree.children_left + root)]))
+            value.append(tree.value[:, 0, 0])
+        self.feature = np.concatenate(feature).astype(np.intp)
+        self.threshold = np.concatenate(threshold).astype(np.float64)
+        self.children = np.concatenate(children).ravel().astype(np.intp)
+        self.value = np.concatenate(value).astype(np.float64)
+        self.depth = max(tree.max_depth for tree in trees)
+
+    def __len__(self) -> int:
+        return len(self.roots)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Mean leaf value over all trees for every row of X"""
+        # scikit-learn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got shape {X.shape}")
+        n = len(X)
+        values = X.ravel()
+        # Tree-major order keeps each step's gathers within one tree's nodes
+        offsets = np.tile(np.arange(n, dtype=np.intp) * self.n_features, len(self.roots))
+        node = np.repeat(self.roots, n)
+        for _ in range(self.depth):
+            went_left = values[offsets + self.feature[node]] <= self.threshold[node]
+            node = self.children[2 * node + went_left]
+        return self.value[node].reshape(len(self.roots), n).mean(axis=0)
@@ -1,21 +1,170 @@
+import hashlib
+import json
+import os
+import shutil
 import numpy as np
+import sklearn
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import StandardScaler
 import joblib
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import pandas as pd
 from datetime import datetime, timedelta
 
+from .flat_forest import FlatForest
+
+class LoadIndex:
+    """
+    Mean historical load per (station, weekday, hour), as a dense
+    (stations x 7 x 24) array. Slots without history hold 0.
+    
+    The index keeps load sums and record counts, so new records can be
+    folded in with add() without revisiting older history.
+    """
+    
+    def __init__(self, historical_data: pd.DataFrame, target_column: str = 'load'):
+        station_ids = np.unique(historical_data['station_id'].to_numpy())
+        sums, counts = self._totals(station_ids, historical_data, target_column)
+        self._set(station_ids, sums, counts)
+    
+    @staticmethod
+    def _totals(station_ids: np.ndarray, records: pd.DataFrame,
+                target_column: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Load sums and record counts of records per (station, weekday, hour).
+        Records with a missing or non-finite load are left out.
+        """
+        timestamps = records['timestamp'].dt
+        rows = np.searchsorted(station_ids, records['station_id'].to_numpy())
+        slots = (rows * 7 + timestamps.weekday.to_numpy()) * 24 + timestamps.hour.to_numpy()
+        loads = records[target_column].to_numpy(dtype=np.float64)
+        finite = np.isfinite(loads)
+        size = len(station_ids) * 7 * 24
+        sums = np.bincount(slots[finite], weights=loads[finite], minlength=size)
+        counts = np.bincount(slots[finite], minlength=size)
+        return sums.reshape(-1, 7, 24), counts.reshape(-1, 7, 24)
+    
+    def _set(self, station_ids: np.ndarray, sums: np.ndarray, counts: np.ndarray):
+        self.station_ids = station_ids
+        self.sums = sums
+        self.counts = counts
+        # One extra all-zero row for stations without history
+        means = np.divide(sums, counts, out=np.zeros(sums.shape), where=counts > 0)
+        self.mean_load = np.concatenate([means, np.zeros((1, 7, 24))])
+    
+    def add(self, records: pd.DataFrame, target_column: str = 'load') -> 'LoadIndex':
+        """New index with records folded in; this index is left unchanged"""
+        station_ids = np.union1d(self.station_ids, records['station_id'].to_numpy())
+        sums, counts = self._totals(station_ids, records, target_column)
+        rows = np.searchsorted(station_ids, self.station_ids)
+        sums[rows] += self.sums
+        counts[rows] += self.counts
+        
+        index = LoadIndex.__new__(LoadIndex)
+        index._set(station_ids, sums, counts)
+        return index
+    
+    def save(self, path: str):
+        """Write station ids, sums and counts to an .npz file"""
+        with open(path, 'wb') as f:
+            np.savez(f, station_ids=self.station_ids, sums=self.sums, counts=self.counts)
+    
+    @classmethod
+    def load(cls, path: str) -> 'LoadIndex':
+        with np.load(path) as data:
+            index = cls.__new__(cls)
+            index._set(data['station_ids'], data['sums'], data['counts'])
+        return index
+    
+    def rows(self, station_ids: np.ndarray) -> np.ndarray:
+        """Index row of every station; unknown stations map to the zero row"""
+        rows = np.searchsorted(self.station_ids, station_ids)
+        found = rows < len(self.station_ids)
+        found[found] = self.station_ids[rows[found]] == station_ids[found]
+        return np.where(found, rows, len(self.station_ids))
+    
+    def lookup(self, rows: np.ndarray, weekdays: np.ndarray, hours: np.ndarray) -> np.ndarray:
+        """Mean load at each (row, weekday, hour)"""
+        return self.mean_load[rows, weekdays, hours]
+
+N_ESTIMATORS = 100  # trees fitted by a full train()
+UPDATE_ESTIMATORS = 10  # trees added per incremental update()
+MAX_ESTIMATORS = 300  # oldest trees are dropped beyond this
+FEATURES_VERSION = 1  # bump when build_features changes, invalidates cached artifacts
+KEEP_ARTIFACTS = 5  # trained artifacts kept in a train() cache_dir
+# Inference backends: scikit-learn's predict, or the forest flattened into
+# NumPy node arrays (FlatForest), which skips per-call validation overhead.
+# The flat arrays are built in each process's own memory (about 40 bytes
+# per tree node, on top of the memory-mapped model), so 'flat' is opt-in
+BACKENDS = ('sklearn', 'flat')
+
 class LoadPredictor:
-    def __init__(self):
+    def __init__(self, backend: str = 'sklearn'):
         self.model = RandomForestRegressor(
-            n_estimators=100,
+            n_estimators=N_ESTIMATORS,
             max_depth=10,
             random_state=42
         )
         self.scaler = StandardScaler()
         self.is_trained = False
+        self.set_backend(backend)
+        # Load index of the last historical_data seen, rebuilt for a new frame
+        # object (see load_index)
+        self._index_data = None
+        self._index = None
+    
+    def set_backend(self, backend: str):
+        """Select the inference backend, one of BACKENDS"""
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend: {backend}")
+        self.backend = backend
+        self._flat = None
+    
+    def flat_forest(self) -> FlatForest:
+        """The trained forest as a FlatForest, rebuilt after the model changed"""
+        if self._flat is None or self._flat_source is not self.model:
+            self._flat = FlatForest(self.model)
+            self._flat_source = self.model
+        return self._flat
+    
+    def load_index(self, historical_data) -> LoadIndex:
+        """
+        The (station x weekday x hour) mean-load index of historical_data.
         
+        Every method taking historical_data also accepts a prebuilt LoadIndex.
+        The index of the last frame is cached by identity (``is``), not by
+        content: after changing a frame in place, pass a new frame or a
+        LoadIndex, or the stale index keeps being used.
+        """
+        if isinstance(historical_data, LoadIndex):
+            return historical_data
+        if historical_data is not self._index_data:
+            self._index = LoadIndex(historical_data)
+            self._index_data = historical_data
+        return self._index
+    
+    def build_features(self,
+                       station_ids: np.ndarray,
+                       timestamps,
+                       historical_data: pd.DataFrame) -> np.ndarray:
+        """
+        prepare_features for many (station, timestamp) pairs at once.
+        
+        Returns:
+            Array of shape (len(station_ids), 11)
+        """
+        timestamps = pd.DatetimeIndex(timestamps)
+        index = self.load_index(historical_data)
+        rows = index.rows(np.asarray(station_ids))
+        hours = timestamps.hour.to_numpy()
+        weekdays = timestamps.weekday.to_numpy()
+        
+        features = [hours, weekdays, timestamps.month.to_numpy(), timestamps.day.to_numpy()]
+        # Historical load at this hour on each of the last 7 weekdays
+        for i in range(1, 8):
+            features.append(index.lookup(rows, (weekdays - i) % 7, hours))
+        return np.column_stack(features).astype(np.float64)
+    
     def prepare_features(self, 
                         station_id: int,
                         timestamp: datetime,
@@ -27,35 +176,40 @@ class LoadPredictor:
         - Historical load at this time
         - Current weather conditions
         - Special events
-        """
-        features = []
-        
-        # Time features
-        features.extend([
-            timestamp.hour,
-            timestamp.weekday(),
-            timestamp.month,
-            timestamp.day
-        ])
-        
-        # Historical load features
-        for i in range(1, 8):  # Last 7 days
-            prev_time = timestamp - timedelta(days=i)
-            prev_load = historical_data[
-                (historical_data['station_id'] == station_id) &
-                (historical_data['timestamp'].dt.hour == prev_time.hour) &
-                (historical_data['timestamp'].dt.weekday == prev_time.weekday())
-            ]['load'].mean()
-            features.append(prev_load if not np.isnan(prev_load) else 0)
         
+        Historical loads are read from the mean-load index of historical_data,
+        which is built once per frame.
+        """
         # Add weather features if available
         # TODO: Integrate with weather API
         
-        return np.array(features).reshape(1, -1)
+        return self.build_features(np.array([station_id]), [timestamp], historical_data)
+    
+    def fingerprint(self,
+                    historical_data: pd.DataFrame,
+                    target_column: str = 'load') -> str:
+        """
+        Content hash of everything train() depends on: the training columns
+        of historical_data, the model and scaler configuration, the feature
+        layout and the scikit-learn version.
+        """
+        columns = historical_data[['station_id', 'timestamp', target_column]]
+        digest = hashlib.sha256(
+            pd.util.hash_pandas_object(columns, index=False).to_numpy().tobytes())
+        config = dict(self._config(), features=FEATURES_VERSION, sklearn=sklearn.__version__)
+        digest.update(json.dumps(config, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+    
+    def _config(self) -> Dict:
+        """Model and scaler configuration, as hashed by fingerprint()"""
+        params = self.model.get_params()
+        params.update(n_estimators=N_ESTIMATORS, warm_start=False)
+        return {'model': params, 'scaler': self.scaler.get_params()}
     
     def train(self, 
              historical_data: pd.DataFrame,
-             target_column: str = 'load'):
+             target_column: str = 'load',
+             cache_dir: Optional[str] = None) -> bool:
         """
         Train the model on historical data.
         
@@ -65,31 +219,143 @@ class LoadPredictor:
                 - timestamp
                 - load
                 - weather_conditions (optional)
+            cache_dir: directory of trained artifacts keyed by fingerprint();
+                a matching artifact is loaded instead of training, and a
+                new one is stored after training
+        
+        Returns:
+            True if the model was trained, False if loaded from cache_dir
         """
-        X = []
-        y = []
+        artifact_dir = None
+        if cache_dir is not None:
+            artifact_dir = os.path.join(cache_dir, self.fingerprint(historical_data, target_column))
+            if os.path.isdir(artifact_dir):
+                self.load_model(os.path.join(artifact_dir, 'model.joblib'),
+                                os.path.join(artifact_dir, 'scaler.joblib'))
+                os.utime(artifact_dir)  # most recently used, kept longest
+                return False
         
-        for station_id in historical_data['station_id'].unique():
-            station_data = historical_data[historical_data['station_id'] == station_id]
-            
-            for _, row in station_data.iterrows():
-                features = self.prepare_features(
-                    station_id,
-                    row['timestamp'],
-                    historical_data
-                )
-                X.append(features[0])
-                y.append(row[target_column])
+        # Rows grouped by station in order of first appearance, as before
+        station_ids = historical_data['station_id'].to_numpy()
+        _, first, inverse = np.unique(station_ids, return_index=True, return_inverse=True)
+        appearance = np.argsort(np.argsort(first))
+        order = np.argsort(appearance[inverse.ravel()], kind='stable')
         
-        X = np.array(X)
-        y = np.array(y)
+        X = self.build_features(station_ids[order],
+                                historical_data['timestamp'].to_numpy()[order],
+                                historical_data)
+        y = historical_data[target_column].to_numpy()[order]
+        self._fit(station_ids[order], X, y)
         
+        if artifact_dir is not None:
+            self._store_artifact(artifact_dir)
+        return True
+    
+    def _fit(self, station_ids: np.ndarray, X: np.ndarray, y: np.ndarray):
+        """Fit scaler and model to a feature matrix"""
         # Scale features
         X = self.scaler.fit_transform(X)
         
         # Train model
+        self.model.set_params(n_estimators=N_ESTIMATORS, warm_start=False)
         self.model.fit(X, y)
         self.is_trained = True
+        self._flat = None
+    
+    def _store_artifact(self, artifact_dir: str):
+        """Save model and scaler to artifact_dir and prune old artifacts"""
+        tmp_dir = f"{artifact_dir}.{os.getpid()}.tmp"
+        os.makedirs(tmp_dir, exist_ok=True)
+        self.save_model(os.path.join(tmp_dir, 'model.joblib'),
+                        os.path.join(tmp_dir, 'scaler.joblib'))
+        try:
+            os.rename(tmp_dir, artifact_dir)
+        except OSError:
+            # Another process stored the same artifact first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        
+        cache_dir = os.path.dirname(artifact_dir)
+        artifacts = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir)
+                     if not name.endswith('.tmp')]
+        artifacts.sort(key=os.path.getmtime)
+        for old in artifacts[:-KEEP_ARTIFACTS]:
+            shutil.rmtree(old, ignore_errors=True)
+    
+    def update(self,
+               new_data: pd.DataFrame,
+               historical_data: pd.DataFrame,
+               target_column: str = 'load',
+               n_estimators: int = UPDATE_ESTIMATORS) -> int:
+        """
+        Fold new records into the trained model without revisiting history.
+        
+        n_estimators trees are fitted on new_data alone and added to the
+        forest (warm start); beyond MAX_ESTIMATORS the oldest trees are
+        dropped, so the forest tracks recent load patterns. The scaler
+        fitted by train() is kept so all trees see the same feature scale.
+        
+        Args:
+            new_data: records not seen by the model yet
+            historical_data: history (or its LoadIndex) including new_data,
+                used for the historical-load features
+        
+        Returns:
+            Number of trees in the forest
+        """
+        if not self.is_trained:
+            raise ValueError("Model needs to be trained before it can be updated")
+        
+        X = self.build_features(new_data['station_id'].to_numpy(),
+                                new_data['timestamp'].to_numpy(),
+                                historical_data)
+        y = new_data[target_column].to_numpy()
+        return self._update(new_data['station_id'].to_numpy(), X, y, n_estimators)
+    
+    def _update(self, station_ids: np.ndarray, X: np.ndarray, y: np.ndarray,
+                n_estimators: int) -> int:
+        """Add n_estimators trees fitted to a feature matrix"""
+        self.model.set_params(n_estimators=len(self.model.estimators_) + n_estimators,
+                              warm_start=True)
+        self.model.fit(self.scaler.transform(X), y)
+        if len(self.model.estimators_) > MAX_ESTIMATORS:
+            self.model.estimators_ = self.model.estimators_[-MAX_ESTIMATORS:]
+            self.model.set_params(n_estimators=MAX_ESTIMATORS)
+        self._flat = None
+        return len(self.model.estimators_)
+    
+    def predict_loads(self,
+                      station_ids,
+                      timestamps,
+                      historical_data: pd.DataFrame) -> np.ndarray:
+        """
+        Predict the load of many (station, timestamp) pairs with one feature
+        build, one scaler transform and one model call.
+        
+        Args:
+            station_ids: sequence of station ids
+            timestamps: one timestamp for all stations, or one per station
+        
+        Returns:
+            Predicted loads (0-1 scale), aligned with station_ids
+        """
+        if not self.is_trained:
+            raise ValueError("Model needs to be trained before making predictions")
+        
+        station_ids = np.asarray(station_ids)
+        if isinstance(timestamps, (datetime, pd.Timestamp, np.datetime64)):
+            timestamps = [timestamps] * len(station_ids)
+        if not len(station_ids):
+            return np.zeros(0)
+        
+        features = self.build_features(station_ids, timestamps, historical_data)
+        predictions = self._predict(station_ids, features)
+        return np.clip(predictions, 0, 1)  # Ensure predictions are between 0 and 1
+    
+    def _predict(self, station_ids: np.ndarray, features: np.ndarray) -> np.ndarray:
+        """Raw model output for a feature matrix"""
+        if self.backend == 'flat':
+            return self.flat_forest().predict((features - self.scaler.mean_) / self.scaler.scale_)
+        return self.model.predict(self.scaler.transform(features))
     
     def predict_load(self,
                     station_id: int,
@@ -101,14 +367,7 @@ class LoadPredictor:
         Returns:
             Predicted load (0-1 scale)
         """
-        if not self.is_trained:
-            raise ValueError("Model needs to be trained before making predictions")
-        
-        features = self.prepare_features(station_id, timestamp, historical_data)
-        features = self.scaler.transform(features)
-        
-        prediction = self.model.predict(features)[0]
-        return max(0, min(1, prediction))  # Ensure prediction is between 0 and 1
+        return float(self.predict_loads([station_id], timestamp, historical_data)[0])
     
     def predict_loads_for_route(self,
                               station_ids: List[int],
@@ -120,19 +379,33 @@ class LoadPredictor:
         Returns:
             Dictionary mapping station IDs to predicted loads
         """
-        predictions = {}
-        current_time = start_time
+        # Add estimated travel time to each next station
+        offsets = pd.to_timedelta(np.arange(len(station_ids)) * 30, unit='m')  # TODO: Use actual travel time
+        predictions = self.predict_loads(station_ids, pd.Timestamp(start_time) + offsets,
+                                         historical_data)
+        return dict(zip(station_ids, predictions.tolist()))
+    
+    def predict_load_profiles(self,
+                              station_ids: List[int],
+                              start_time: datetime,
+                              hours: int,
+                              historical_data: pd.DataFrame) -> np.ndarray:
+        """
+        Predict hourly load profiles for many stations in one model call.
         
-        for station_id in station_ids:
-            predictions[station_id] = self.predict_load(
-                station_id,
-                current_time,
-                historical_data
-            )
-            # Add estimated travel time to next station
-            current_time += timedelta(minutes=30)  # TODO: Use actual travel time
+        Bucket 0 is the hour containing start_time, bucket h the h-th hour
+        after it.
         
-        return predictions
+        Returns:
+            Array of shape (len(station_ids), hours), clipped to 0-1
+        """
+        window_start = pd.Timestamp(start_time).floor('h')
+        predictions = self.predict_loads(
+            np.repeat(np.asarray(station_ids), hours),
+            np.tile(window_start + pd.to_timedelta(np.arange(hours), unit='h'), len(station_ids)),
+            historical_data
+        )
+        return predictions.reshape(len(station_ids), hours)
     
     def save_model(self, model_path: str, scaler_path: str):
         """Save the trained model and scaler."""
@@ -142,8 +415,15 @@ class LoadPredictor:
         joblib.dump(self.model, model_path)
         joblib.dump(self.scaler, scaler_path)
     
-    def load_model(self, model_path: str, scaler_path: str):
-        """Load a trained model and scaler."""
-        self.model = joblib.load(model_path)
-        self.scaler = joblib.load(scaler_path)
-        self.is_trained = True 
\ No newline at end of file
+    def load_model(self, model_path: str, scaler_path: str,
+                   mmap_mode: Optional[str] = None):
+        """
+        Load a trained model and scaler.
+        
+        With mmap_mode ('r' or 'c') the NumPy arrays in the files are memory
+        mapped instead of read, see joblib.load.
+        """
+        self.model = joblib.load(model_path, mmap_mode=mmap_mode)
+        self.scaler = joblib.load(scaler_path, mmap_mode=mmap_mode)
+        self.is_trained = True
+        self._flat = None 
\ No newline at end of file
@@ -0,0 +1,203 @@
+import logging
+import threading
+import time
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass, field
+from datetime import datetime
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, NamedTuple, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+class ActiveModel(NamedTuple):
+    """A predictor together with the history its features are built from"""
+    version: Optional[str]
+    predictor: Any
+    historical_data: Any
+
+class StaticModel:
+    """Model source that always serves the same predictor (see ModelStore)"""
+
+    def __init__(self, predictor, historical_data):
+        self.active = ActiveModel(None, predictor, historical_data)
+
+    def poll(self) -> bool:
+        return False
+
+@dataclass(frozen=True)
+class LoadSnapshot:
+    """
+    Predicted loads of every station for the hour containing ``start`` and
+    the following hours, as published by LoadRefresher. Never modified after
+    creation; a refresh publishes a new snapshot with a new version.
+    """
+    version: str
+    start: datetime
+    station_ids: np.ndarray
+    loads: np.ndarray  # (stations x hours), column 0 is the hour containing start
+    created_at: float = 0.0
+    model_version: Optional[str] = None
+    current: Mapping[int, float] = field(init=False)
+
+    def __post_init__(self):
+        self.station_ids.flags.writeable = False
+        self.loads.flags.writeable = False
+        current = dict(zip(self.station_ids.tolist(), self.loads[:, 0].tolist())) \
+            if self.loads.size else {}
+        object.__setattr__(self, 'current', MappingProxyType(current))
+
+    @classmethod
+    def empty(cls, start: datetime, hours: int) -> 'LoadSnapshot':
+        """Snapshot without stations, used until the first refresh succeeds"""
+        return cls('empty', start, np.zeros(0, dtype=np.int64), np.zeros((0, hours)))
+
+    @property
+    def hours(self) -> int:
+        return self.loads.shape[1]
+
+    def load(self, station_id: int, hour: int = 0) -> Optional[float]:
+        """Predicted load of a station ``hour`` hours after start, None if unknown"""
+        if hour == 0:
+            return self.current.get(station_id)
+        row = np.searchsorted(self.station_ids, station_id)
+        if row == len(self.station_ids) or self.station_ids[row] != station_id:
+            return None
+        return float(self.loads[row, min(hour, self.hours - 1)])
+
+    def profiles(self, station_ids: Sequence[int]) -> np.ndarray:
+        """Load rows for station_ids in that order; unknown stations are all zero"""
+        station_ids = np.asarray(station_ids)
+        rows = np.searchsorted(self.station_ids, station_ids)
+        found = rows < len(self.station_ids)
+        found[found] = self.station_ids[rows[found]] == station_ids[found]
+        profiles = np.zeros((len(station_ids), self.hours))
+        profiles[found] = self.loads[rows[found]]
+        return profiles
+
+class LoadRefresher:
+    """
+    Keeps a LoadSnapshot of every station's predicted load up to date off
+    the request path.
+
+    A background thread calls refresh() every ``interval`` seconds, which
+    first polls ``models`` (a ModelStore or StaticModel) for a new model
+    version. A new snapshot is only computed when the hour rolls over, the
+    station set or model version changes or invalidate() was called, so
+    requests keep hitting the same version (and the caches keyed on it)
+    within an hour. Failed refreshes are logged and leave the previous
+    snapshot in place; until a trained model is available, refreshes are
+    skipped quietly.
+    """
+
+    def __init__(self,
+                 models,
+                 station_ids: Callable[[], Sequence[int]],
+                 hours: int = 6,
+                 interval: float = 30.0,
+                 clock: Callable[[], datetime] = datetime.now):
+        self.models = models
+        self.station_ids = station_ids
+        self.hours = hours
+        self.interval = interval
+        self._clock = clock
+        self._snapshot = LoadSnapshot.empty(pd.Timestamp(clock()).floor('h').to_pydatetime(), hours)
+        self._key = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.refreshes = 0
+        self.failures = 0
+        self.last_duration = 0.0
+
+    @property
+    def snapshot(self) -> LoadSnapshot:
+        """The latest published snapshot; safe to read from any thread"""
+        return self._snapshot
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Compute and publish a new snapshot if it is due.
+
+        Returns:
+            True if a new snapshot was published
+        """
+        with self._lock:
+            self.models.poll()
+            model = self.models.active
+            if not model.predictor.is_trained:
+                # Nothing published yet; not a failure, keep the empty snapshot
+                return False
+            start = pd.Timestamp(self._clock()).floor('h')
+            ids = np.unique(np.asarray(self.station_ids()))
+            key = (start, len(ids), hash(ids.tobytes()), model.version)
+            if not force and key == self._key:
+                return False
+
+            began = time.perf_counter()
+            try:
+                loads = model.predictor.predict_load_profiles(
+                    ids.tolist(), start.to_pydatetime(), self.hours, model.historical_data)
+            except Exception:
+                self.failures += 1
+                logger.exception('Load snapshot refresh failed; keeping version %s',
+                                 self._snapshot.version)
+                return False
+
+            self._generation += 1
+            self._snapshot = LoadSnapshot(
+                version=f"{start.strftime('%Y-%m-%dT%H')}.{self._generation}",
+                start=start.to_pydatetime(),
+                station_ids=ids,
+                loads=np.array(loads, dtype=np.float64).reshape(len(ids), self.hours),
+                created_at=time.time(),
+                model_version=model.version
+            )
+            self._key = key
+            self.refreshes += 1
+            self.last_duration = time.perf_counter() - began
+            return True
+
+    def invalidate(self):
+        """Recompute at the next opportunity, e.g. after the model changed"""
+        with self._lock:
+            self._key = None
+        self._wake.set()
+
+    def start(self):
+        """Publish a first snapshot, then keep refreshing in a daemon thread"""
+        self.refresh()
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='load-refresher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if not self._stopped.is_set():
+                self.refresh()
+
+    def stats(self) -> Dict:
+        snapshot = self._snapshot
+        return {
+            'version': snapshot.version,
+            'model_version': snapshot.model_version,
+            'start': snapshot.start.isoformat(),
+            'stations': len(snapshot.station_ids),
+            'hours': snapshot.hours,
+            'age_seconds': time.time() - snapshot.created_at if snapshot.created_at else None,
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+            'last_duration': self.last_duration
+        }
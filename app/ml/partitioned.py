@@ -0,0 +1,154 @@
+import os
+import numpy as np
+import joblib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Hashable, List, Mapping, Optional
+
+from .load_predictor import N_ESTIMATORS, LoadPredictor
+
+DEFAULT_PARTITION = '__default__'
+MIN_PARTITION_ROWS = 24 * 7 * 4  # four weeks of hourly records
+
+def _fit_partition(predictor: LoadPredictor, X: np.ndarray, y: np.ndarray,
+                   n_estimators: Optional[int] = None) -> LoadPredictor:
+    """Fit (or, with n_estimators, warm-start) one partition; runs in a worker process"""
+    if n_estimators is None:
+        predictor._fit(None, X, y)
+    else:
+        predictor._update(None, X, y, n_estimators)
+    return predictor
+
+class ModelRegistry:
+    """
+    Sub-models by partition key and the partition of every known station.
+    Stations without a partition of their own use the default partition.
+    """
+
+    def __init__(self, models: Dict[Hashable, LoadPredictor],
+                 station_partitions: Mapping[int, Hashable], default: Hashable):
+        self.models = models
+        self.keys: List[Hashable] = list(models)
+        self.default = default
+        position = {key: i for i, key in enumerate(self.keys)}
+        self.station_ids = np.array(sorted(station_partitions), dtype=np.int64)
+        self.partition = np.array([position[station_partitions[station_id]]
+                                   for station_id in self.station_ids.tolist()], dtype=np.int64)
+
+    def route(self, station_ids: np.ndarray) -> np.ndarray:
+        """Position in ``keys`` of the sub-model for every station"""
+        rows = np.searchsorted(self.station_ids, station_ids)
+        found = rows < len(self.station_ids)
+        found[found] = self.station_ids[rows[found]] == station_ids[found]
+        routed = np.full(len(station_ids), self.keys.index(self.default), dtype=np.int64)
+        routed[found] = self.partition[rows[found]]
+        return routed
+
+    def __len__(self) -> int:
+        return len(self.models)
+
+class PartitionedLoadPredictor(LoadPredictor):
+    """
+    LoadPredictor made of one forest per station or region, fitted in
+    parallel.
+
+    ``regions`` maps station ids to region keys; without it every station is
+    its own partition. Partitions with fewer than ``min_rows`` training rows
+    are pooled into DEFAULT_PARTITION, which also serves stations the
+    registry has never seen (the largest partition does if nothing was
+    pooled). Features are built once in the parent process; the partitions
+    are fitted by a process pool of ``workers`` processes (all cores by
+    default), largest first. After training ``model`` is a ModelRegistry.
+    """
+
+    def __init__(self, regions: Optional[Mapping[int, Hashable]] = None,
+                 min_rows: int = MIN_PARTITION_ROWS, workers: Optional[int] = None,
+                 backend: str = 'sklearn'):
+        super().__init__(backend)
+        self.regions = dict(regions) if regions else None
+        self.min_rows = min_rows
+        self.workers = workers
+        # Every partition is fitted with the configuration of this forest
+        self.params = self.model.get_params()
+
+    def _config(self) -> Dict:
+        return {'model': dict(self.params, n_estimators=N_ESTIMATORS, warm_start=False),
+                'scaler': self.scaler.get_params(),
+                'partitions': sorted((str(station_id), str(region))
+                                     for station_id, region in (self.regions or {}).items()),
+                'min_rows': self.min_rows}
+
+    def set_backend(self, backend: str):
+        super().set_backend(backend)
+        if isinstance(self.model, ModelRegistry):
+            for model in self.model.models.values():
+                model.set_backend(backend)
+
+    def _new_partition(self) -> LoadPredictor:
+        predictor = LoadPredictor(self.backend)
+        predictor.model.set_params(**dict(self.params, n_jobs=1))
+        return predictor
+
+    def _run(self, jobs: Dict[Hashable, tuple]) -> Dict[Hashable, LoadPredictor]:
+        """Run _fit_partition for every job, in a process pool if more than one"""
+        order = sorted(jobs, key=lambda key: -len(jobs[key][2]))
+        workers = self.workers or os.cpu_count() or 1
+        if workers == 1 or len(jobs) == 1:
+            return {key: _fit_partition(*jobs[key]) for key in order}
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            futures = {key: executor.submit(_fit_partition, *jobs[key]) for key in order}
+            return {key: future.result() for key, future in futures.items()}
+
+    def _fit(self, station_ids: np.ndarray, X: np.ndarray, y: np.ndarray):
+        ids, inverse, counts = np.unique(station_ids, return_inverse=True, return_counts=True)
+        labels = [self.regions.get(station_id, station_id) if self.regions else station_id
+                  for station_id in ids.tolist()]
+        rows_per_label: Dict[Hashable, int] = {}
+        for label, count in zip(labels, counts.tolist()):
+            rows_per_label[label] = rows_per_label.get(label, 0) + count
+        labels = [label if rows_per_label[label] >= self.min_rows else DEFAULT_PARTITION
+                  for label in labels]
+        station_partitions = dict(zip(ids.tolist(), labels))
+
+        row_labels = np.array(labels, dtype=object)[inverse.ravel()]
+        jobs = {}
+        for label in dict.fromkeys(labels):
+            rows = np.flatnonzero(row_labels == label)
+            jobs[label] = (self._new_partition(), X[rows], y[rows])
+        models = self._run(jobs)
+
+        default = DEFAULT_PARTITION if DEFAULT_PARTITION in models else \
+            max(jobs, key=lambda key: len(jobs[key][2]))
+        self.model = ModelRegistry(models, station_partitions, default)
+        self.is_trained = True
+
+    def _update(self, station_ids: np.ndarray, X: np.ndarray, y: np.ndarray,
+                n_estimators: int) -> int:
+        registry = self.model
+        routed = registry.route(station_ids)
+        jobs = {}
+        for position in np.unique(routed).tolist():
+            rows = np.flatnonzero(routed == position)
+            key = registry.keys[position]
+            jobs[key] = (registry.models[key], X[rows], y[rows], n_estimators)
+        registry.models.update(self._run(jobs))
+        return sum(len(model.model.estimators_) for model in registry.models.values())
+
+    def _predict(self, station_ids: np.ndarray, features: np.ndarray) -> np.ndarray:
+        registry = self.model
+        routed = registry.route(station_ids)
+        predictions = np.empty(len(station_ids))
+        for position in np.unique(routed).tolist():
+            rows = np.flatnonzero(routed == position)
+            model = registry.models[registry.keys[position]]
+            predictions[rows] = model._predict(station_ids[rows], features[rows])
+        return predictions
+
+def load_predictor(model_path: str, scaler_path: str,
+                   mmap_mode: Optional[str] = None) -> LoadPredictor:
+    """Saved LoadPredictor or PartitionedLoadPredictor, whichever was saved"""
+    model = joblib.load(model_path, mmap_mode=mmap_mode)
+    predictor = PartitionedLoadPredictor() if isinstance(model, ModelRegistry) else LoadPredictor()
+    predictor.model = model
+    predictor.scaler = joblib.load(scaler_path, mmap_mode=mmap_mode)
+    predictor.is_trained = True
+    return predictor
@@ -0,0 +1,329 @@
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import pandas as pd
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from .load_predictor import LoadIndex, LoadPredictor
+from .load_snapshot import ActiveModel
+from .partitioned import load_predictor
+
+logger = logging.getLogger(__name__)
+
+# Every training run writes a complete version directory under
+# <model_dir>/versions/; <model_dir>/CURRENT names the one being served
+VERSIONS_DIR = 'versions'
+CURRENT_FILE = 'CURRENT'
+# Full trainings are cached by data fingerprint (LoadPredictor.train)
+ARTIFACTS_DIR = 'artifacts'
+KEEP_VERSIONS = 5
+VERSION_FORMAT = '%Y%m%dT%H%M%S%f'
+MODEL_FILE = 'load_predictor.joblib'
+SCALER_FILE = 'scaler.joblib'
+INDEX_FILE = 'load_index.npz'
+CHECKPOINT_FILE = 'training_checkpoint.json'
+
+@dataclass
+class TrainingCheckpoint:
+    """
+    How much of an append-only load record CSV the saved model has consumed.
+
+    ``offset`` is the byte position after the last record folded in, so the
+    next update reads only what was appended since. ``header`` identifies
+    the file; a changed header or a file shorter than ``offset`` means it
+    was rewritten and training starts over. ``parent`` is the version the
+    model was updated from, the target of a rollback.
+    """
+    data_path: str
+    offset: int = 0
+    header: str = ''
+    rows: int = 0
+    updates: int = 0
+    updated_at: Optional[str] = None
+    parent: Optional[str] = None
+
+    @classmethod
+    def load(cls, path: str, data_path: str) -> 'TrainingCheckpoint':
+        """Checkpoint at path, or an empty one for data_path if there is none"""
+        if not os.path.exists(path):
+            return cls(data_path)
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    def save(self, path: str):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(asdict(self), f, indent=2)
+        os.replace(tmp_path, path)
+
+def read_new_records(checkpoint: TrainingCheckpoint) -> Tuple[pd.DataFrame, int, str]:
+    """
+    Records appended to checkpoint.data_path since checkpoint.offset.
+
+    Only complete lines are returned, so a line still being written is
+    picked up by the next update.
+
+    Returns:
+        (records, offset after the last complete line, header line)
+    """
+    with open(checkpoint.data_path, 'rb') as f:
+        header = f.readline()
+        size = os.fstat(f.fileno()).st_size
+        offset = checkpoint.offset
+        if header.decode() != checkpoint.header or offset > size:
+            offset = 0
+        f.seek(max(offset, len(header)))
+        data = f.read()
+
+    complete = data.rfind(b'\n') + 1
+    end = max(offset, len(header)) + complete
+    if not data[:complete].strip():
+        return pd.DataFrame(), end, header.decode()
+    records = pd.read_csv(io.BytesIO(header + data[:complete]))
+    records['timestamp'] = pd.to_datetime(records['timestamp'])
+    return records, end, header.decode()
+
+def version_dir(model_dir: str, version: str) -> str:
+    return os.path.join(model_dir, VERSIONS_DIR, version)
+
+def list_versions(model_dir: str) -> List[str]:
+    """Complete model versions in model_dir, oldest first"""
+    versions_dir = os.path.join(model_dir, VERSIONS_DIR)
+    if not os.path.isdir(versions_dir):
+        return []
+    return sorted(name for name in os.listdir(versions_dir) if not name.endswith('.tmp'))
+
+def current_version(model_dir: str) -> Optional[str]:
+    """Version named by model_dir/CURRENT, None if nothing was published"""
+    path = os.path.join(model_dir, CURRENT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read().strip() or None
+
+def set_current_version(model_dir: str, version: str):
+    """Atomically point model_dir/CURRENT at an existing version"""
+    if not os.path.isdir(version_dir(model_dir, version)):
+        raise ValueError(f"Unknown model version: {version}")
+    path = os.path.join(model_dir, CURRENT_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+
+def migrate_baseline_model(model_dir: str, data_path: Optional[str]) -> Optional[str]:
+    """
+    Publish a model saved by releases before versioning (load_predictor.joblib
+    and scaler.joblib directly in model_dir, no load index) as the first
+    version, so upgrading needs no retrain. The load index is rebuilt from
+    data_path and the checkpoint marks all of it as consumed, so later
+    updates only read records appended after the migration. Without the
+    training data the model cannot be served and a retrain is required.
+
+    The version is named after the saved model's modification time, so
+    concurrent callers agree on it; the old files are copied, not moved, and
+    can be deleted afterwards.
+
+    Returns:
+        The current version, None if nothing was published or migrated
+    """
+    version = current_version(model_dir)
+    saved = [os.path.join(model_dir, name) for name in (MODEL_FILE, SCALER_FILE)]
+    if version is not None or not all(os.path.exists(path) for path in saved):
+        return version
+    if data_path is None or not os.path.exists(data_path):
+        logger.warning('%s holds a model without a load index and the training data %s '
+                       'is missing; run python -m utils.update_load_model --retrain',
+                       model_dir, data_path)
+        return None
+    records, offset, header = read_new_records(TrainingCheckpoint(data_path))
+    if records.empty:
+        logger.warning('No records in %s to index the model in %s with; '
+                       'run python -m utils.update_load_model --retrain', data_path, model_dir)
+        return None
+
+    version = datetime.fromtimestamp(os.path.getmtime(saved[0])).strftime(VERSION_FORMAT)
+    directory = version_dir(model_dir, version)
+    if not os.path.isdir(directory):
+        os.makedirs(os.path.dirname(directory), exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(suffix='.tmp', dir=os.path.dirname(directory))
+        for path in saved:
+            shutil.copy2(path, tmp_dir)
+        LoadIndex(records).save(os.path.join(tmp_dir, INDEX_FILE))
+        TrainingCheckpoint(data_path, offset=offset, header=header, rows=len(records),
+                           updated_at=datetime.now().isoformat()).save(
+            os.path.join(tmp_dir, CHECKPOINT_FILE))
+        try:
+            os.rename(tmp_dir, directory)
+        except OSError:
+            # Another process migrated the same model first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    set_current_version(model_dir, version)
+    logger.info('Migrated the model in %s to version %s', model_dir, version)
+    return version
+
+def load_model(model_dir: str,
+               version: Optional[str] = None,
+               mmap_mode: Optional[str] = None) -> Tuple[LoadPredictor, Optional[LoadIndex], Optional[str]]:
+    """
+    Predictor and load index of a version (the current one by default),
+    with the model's arrays memory mapped if mmap_mode is given.
+
+    Returns:
+        (predictor, index, version); untrained, None and None if no version
+        was published
+    """
+    version = version or current_version(model_dir)
+    if version is None:
+        return LoadPredictor(), None, None
+    directory = version_dir(model_dir, version)
+    predictor = load_predictor(os.path.join(directory, MODEL_FILE),
+                               os.path.join(directory, SCALER_FILE), mmap_mode=mmap_mode)
+    return predictor, LoadIndex.load(os.path.join(directory, INDEX_FILE)), version
+
+def _publish(model_dir: str, predictor: LoadPredictor, index: LoadIndex,
+             checkpoint: TrainingCheckpoint) -> str:
+    """Write a new version directory, then make it current"""
+    version = datetime.now().strftime(VERSION_FORMAT)
+    directory = version_dir(model_dir, version)
+    tmp_dir = directory + '.tmp'
+    os.makedirs(tmp_dir)
+    predictor.save_model(os.path.join(tmp_dir, MODEL_FILE),
+                         os.path.join(tmp_dir, SCALER_FILE))
+    index.save(os.path.join(tmp_dir, INDEX_FILE))
+    checkpoint.save(os.path.join(tmp_dir, CHECKPOINT_FILE))
+    os.rename(tmp_dir, directory)
+    set_current_version(model_dir, version)
+
+    # Drop old versions, never the one being served
+    for old in list_versions(model_dir)[:-KEEP_VERSIONS]:
+        if old != version:
+            shutil.rmtree(version_dir(model_dir, old), ignore_errors=True)
+    return version
+
+def update_model(data_path: str, model_dir: str = 'models',
+                 retrain: bool = False,
+                 new_predictor: Callable[[], LoadPredictor] = LoadPredictor) -> int:
+    """
+    Publish a new model version that is up to date with data_path.
+
+    Only records appended since the current version's checkpoint are read.
+    They are folded into the load index and, through LoadPredictor.update,
+    into the model; without a current version (or after the file was
+    rewritten) the model is trained from scratch once, or loaded from the
+    artifact cache if the same history was trained on before. The version
+    directory is complete before CURRENT is switched to it, so servers
+    never load a partially written model.
+
+    Args:
+        retrain: train from the complete history even if the current
+            version could be updated, e.g. for a nightly retrain
+        new_predictor: factory of the predictor trained from scratch, such
+            as a PartitionedLoadPredictor; updates keep the saved kind
+
+    Returns:
+        Number of records consumed; 0 means no version was published
+    """
+    migrate_baseline_model(model_dir, data_path)
+    predictor, index, parent = load_model(model_dir)
+    checkpoint = TrainingCheckpoint(data_path)
+    if parent is not None:
+        checkpoint = TrainingCheckpoint.load(
+            os.path.join(version_dir(model_dir, parent), CHECKPOINT_FILE), data_path)
+        if checkpoint.data_path != data_path:
+            checkpoint = TrainingCheckpoint(data_path)
+
+    records, offset, header = read_new_records(checkpoint)
+    # Rewritten file, or nothing to update: start from the complete history
+    retrain = (retrain or header != checkpoint.header or offset < checkpoint.offset
+               or index is None or not predictor.is_trained)
+    if retrain and checkpoint.offset:
+        checkpoint = TrainingCheckpoint(data_path)
+        records, offset, header = read_new_records(checkpoint)
+    if records.empty:
+        return 0
+
+    if retrain:
+        index = LoadIndex(records)
+        predictor = new_predictor()
+        predictor.train(records, cache_dir=os.path.join(model_dir, ARTIFACTS_DIR))
+        checkpoint = TrainingCheckpoint(data_path, header=header)
+    else:
+        index = index.add(records)
+        predictor.update(records, index)
+
+    checkpoint.offset = offset
+    checkpoint.rows += len(records)
+    checkpoint.updates += 1
+    checkpoint.updated_at = datetime.now().isoformat()
+    checkpoint.parent = parent
+    _publish(model_dir, predictor, index, checkpoint)
+    return len(records)
+
+def rollback(model_dir: str) -> str:
+    """
+    Make the version the current one was trained from current again.
+
+    Returns:
+        The version now being served
+    """
+    version = current_version(model_dir)
+    if version is None:
+        raise ValueError("No model version has been published")
+    parent = TrainingCheckpoint.load(
+        os.path.join(version_dir(model_dir, version), CHECKPOINT_FILE), '').parent
+    if parent is None or not os.path.isdir(version_dir(model_dir, parent)):
+        raise ValueError(f"No earlier model version to roll back to from {version}")
+    set_current_version(model_dir, parent)
+    return parent
+
+class ModelStore:
+    """
+    Serving side of the versioned model artifacts in model_dir.
+
+    poll() notices when CURRENT names a different version, loads that
+    version completely and only then replaces ``active`` in one assignment,
+    so a reader sees either the old or the new model, never a mix. A
+    version that fails to load is logged and the old model kept. A model
+    saved by releases before versioning is migrated on construction, with
+    its load index rebuilt from data_path (see migrate_baseline_model).
+    Loaded predictors use the inference ``backend`` (see
+    LoadPredictor.set_backend).
+    """
+
+    def __init__(self, model_dir: str, backend: str = 'sklearn',
+                 data_path: Optional[str] = None):
+        self.model_dir = model_dir
+        self.backend = backend
+        self.active = ActiveModel(None, LoadPredictor(backend), None)
+        self.swaps = 0
+        self.failures = 0
+        self._failed_version = None
+        try:
+            migrate_baseline_model(model_dir, data_path)
+        except Exception:
+            logger.exception('Could not migrate the model in %s', model_dir)
+        self.poll()
+
+    def poll(self) -> bool:
+        """Swap in the current version if it changed; True if it was swapped"""
+        version = current_version(self.model_dir)
+        if version in (None, self.active.version, self._failed_version):
+            return False
+        try:
+            predictor, index, version = load_model(self.model_dir, version, mmap_mode='r')
+            predictor.set_backend(self.backend)
+        except Exception:
+            self.failures += 1
+            self._failed_version = version
+            logger.exception('Could not load model version %s; keeping %s',
+                             version, self.active.version)
+            return False
+        self.active = ActiveModel(version, predictor, index)
+        self.swaps += 1
+        return True
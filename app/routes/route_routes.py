@@ -1,17 +1,51 @@
 from flask import Blueprint, jsonify, request
 from ..models import db, Route, Station
-from ..services.route_optimizer import find_optimal_station
+from ..services.route_optimizer import corridor_bounds, corridor_filter, find_top_stations
+from ..services.traffic import GoogleMapsTrafficProvider, StubTrafficProvider, TrafficService
+from config.config import Config
+from concurrent.futures import ThreadPoolExecutor
 import googlemaps
+import math
 import os
+import time
 from datetime import datetime
 
 route_bp = Blueprint('route_bp', __name__)
 gmaps = googlemaps.Client(key=os.getenv('GOOGLE_MAPS_API_KEY'))
 
+# Bounded pools shared by all requests for Google Maps calls, and the time
+# budget (seconds) a route request may spend waiting on them. Directions get
+# their own pool so a backlog of traffic batches cannot starve them
+external_calls = ThreadPoolExecutor(max_workers=int(os.getenv('EXTERNAL_CALL_WORKERS', 8)))
+directions_calls = ThreadPoolExecutor(max_workers=int(os.getenv('DIRECTIONS_CALL_WORKERS', 2)))
+ROUTE_DEADLINE_SECONDS = float(os.getenv('ROUTE_DEADLINE_SECONDS', 3.0))
+# Directions can only be requested once traffic has picked the station, so
+# traffic may use this share of the budget and directions always get at
+# least MIN_DIRECTIONS_SECONDS, even if that overruns the budget
+TRAFFIC_BUDGET_SHARE = float(os.getenv('TRAFFIC_BUDGET_SHARE', 0.6))
+MIN_DIRECTIONS_SECONDS = float(os.getenv('MIN_DIRECTIONS_SECONDS', 1.0))
+
+# Traffic durations are batched per request and cached across requests;
+# TRAFFIC_PROVIDER=stub scores offline from great-circle distance
+if os.getenv('TRAFFIC_PROVIDER') == 'stub':
+    traffic = TrafficService(StubTrafficProvider(), executor=external_calls)
+else:
+    traffic = TrafficService(GoogleMapsTrafficProvider(gmaps), executor=external_calls)
+
+# Stations needing a longer detour than this (km) are never scored
+MAX_DETOUR_KM = float(os.getenv('MAX_DETOUR_KM', Config.MAX_DETOUR_KM))
+# Upper bound on the number of ranked stations a route request may ask for
+MAX_STATION_LIMIT = int(os.getenv('MAX_STATION_LIMIT', 20))
+
 @route_bp.route('/route', methods=['POST'])
 def optimize_route():
     """Find the optimal charging station based on source and destination"""
     data = request.get_json()
+    # Traffic lookups still running at their deadline score 1.0, and the
+    # directions are left out if they are not back in time
+    start = time.monotonic()
+    deadline = start + ROUTE_DEADLINE_SECONDS
+    traffic_deadline = start + ROUTE_DEADLINE_SECONDS * TRAFFIC_BUDGET_SHARE
     
     # Extract coordinates
     source_lat = data['source_lat']
@@ -20,22 +54,65 @@ def optimize_route():
     dest_lng = data['dest_lng']
     user_id = data.get('user_id')  # Optional
     
-    # Get all available stations
-    stations = Station.query.filter(Station.current_availability > 0).all()
+    try:
+        max_detour = float(data.get('max_detour', MAX_DETOUR_KM))
+    except (TypeError, ValueError):
+        max_detour = math.nan
+    if not max_detour >= 0:
+        return jsonify({
+            'error': 'max_detour must be a non-negative number of km'
+        }), 400
+    max_detour = min(max_detour, MAX_DETOUR_KM)
+    try:
+        limit = min(int(data.get('limit', 1)), MAX_STATION_LIMIT)  # ranked fallback stations
+    except (TypeError, ValueError):
+        return jsonify({
+            'error': 'limit must be an integer'
+        }), 400
+    if limit < 1:
+        return jsonify({
+            'error': 'limit must be at least 1'
+        }), 400
+    
+    # Get available stations in the trip's bounding box, then keep those
+    # within the detour corridor
+    min_lat, max_lat, min_lng, max_lng = corridor_bounds(
+        (source_lat, source_lng), (dest_lat, dest_lng), max_detour)
+    stations = Station.query.filter(
+        Station.current_availability > 0,
+        Station.latitude.between(min_lat, max_lat),
+        Station.longitude.between(min_lng, max_lng)
+    ).all()
+    # Pruned candidates are those in the box but outside the corridor
+    stations, pruned = corridor_filter(
+        stations, (source_lat, source_lng), (dest_lat, dest_lng), max_detour)
     
-    # Find optimal station using our optimization service
-    optimal_station = find_optimal_station(
+    # Rank the best stations using our optimization service
+    ranked = find_top_stations(
         source=(source_lat, source_lng),
         destination=(dest_lat, dest_lng),
         stations=stations,
-        gmaps_client=gmaps
+        traffic=traffic,
+        limit=limit,
+        deadline=traffic_deadline
     )
     
-    if not optimal_station:
+    if not ranked:
         return jsonify({
-            'error': 'No available charging stations found'
+            'error': 'No available charging stations found',
+            'pruned_candidates': pruned
         }), 404
     
+    optimal_station = ranked[0][0]
+    
+    # Request directions to the optimal station while the route is saved
+    directions_call = directions_calls.submit(
+        gmaps.directions,
+        origin=f"{source_lat},{source_lng}",
+        destination=f"{optimal_station.latitude},{optimal_station.longitude}",
+        mode="driving"
+    )
+    
     # If user is logged in, save the route
     if user_id:
         route = Route(
@@ -49,12 +126,12 @@ def optimize_route():
         db.session.add(route)
         db.session.commit()
     
-    # Get directions to the optimal station
-    directions = gmaps.directions(
-        origin=f"{source_lat},{source_lng}",
-        destination=f"{optimal_station.latitude},{optimal_station.longitude}",
-        mode="driving"
-    )
+    try:
+        directions = directions_call.result(
+            timeout=max(MIN_DIRECTIONS_SECONDS, deadline - time.monotonic()))
+    except Exception:  # timed out or failed upstream
+        directions_call.cancel()
+        directions = None
     
     return jsonify({
         'station': {
@@ -64,7 +141,21 @@ def optimize_route():
             'longitude': optimal_station.longitude,
             'current_availability': optimal_station.current_availability
         },
-        'route': directions[0] if directions else None
+        'route': directions[0] if directions else None,
+        # Ranked fallbacks with component scores; directions only for the first
+        'stations': [{
+            'id': station.id,
+            'name': station.name,
+            'latitude': station.latitude,
+            'longitude': station.longitude,
+            'current_availability': station.current_availability,
+            'score': scores['score'],
+            'detour_km': scores['detour'],
+            'availability': scores['availability'],
+            'traffic': scores['traffic']
+        } for station, scores in ranked],
+        'candidates': len(stations),
+        'pruned_candidates': pruned
     })
 
 @route_bp.route('/routes/user/<int:user_id>', methods=['GET'])
@@ -0,0 +1,81 @@
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from .graph import StationGraph
+from .search import INF, SearchResult, astar
+
+PENALTY = 1.5  # factor multiplied onto the stations of every route found
+MAX_OVERLAP = 0.7  # largest share of a route's distance shared with an accepted one
+MAX_STRETCH = 1.5  # largest cost of an alternative relative to the best route
+
+
+def _edge_lengths(graph: StationGraph, path: List[int]) -> Dict[Tuple[int, int], float]:
+    """Undirected edges of a path mapped to their distance."""
+    lengths = {}
+    for u, v in zip(path[:-1], path[1:]):
+        lengths[(min(u, v), max(u, v))] = float(graph.distance[graph.find_edge(u, v)])
+    return lengths
+
+
+def alternative_routes(graph: StationGraph,
+                       source: int,
+                       target: int,
+                       node_factor: np.ndarray,
+                       max_edge_distance: float = INF,
+                       k: int = 3,
+                       penalty: float = PENALTY,
+                       max_overlap: float = MAX_OVERLAP,
+                       max_stretch: float = MAX_STRETCH,
+                       max_settled: Optional[int] = None) -> List[SearchResult]:
+    """
+    Up to k meaningfully different routes by iterative penalties.
+
+    The first route is the A* optimum. After every search the factors of the
+    intermediate stations on the found route are multiplied by ``penalty``
+    and A* runs again. A candidate is accepted if at most ``max_overlap`` of
+    its distance is shared with any accepted route and its unpenalized cost
+    is within ``max_stretch`` of the optimum.
+
+    At most 3 * k searches run, together settling at most ``max_settled``
+    nodes: every search, the optimum included, gets what is left of it as
+    its own settle limit and is cut off when that runs out, so the result
+    may hold fewer than k routes, or none if the optimum is not found within
+    the budget. Results are ordered by unpenalized cost, the optimum first,
+    and report their unpenalized cost; ``settled`` is the running total.
+    """
+    best = astar(graph, source, target, node_factor, max_edge_distance, max_settled=max_settled)
+    if not best.path or k <= 1:
+        return [best] if best.path else []
+
+    accepted = [best]
+    accepted_edges = [_edge_lengths(graph, best.path)]
+    penalized = node_factor.copy()
+    settled = best.settled
+    last = best
+
+    for _ in range(3 * k - 1):
+        budget = None if max_settled is None else max_settled - settled
+        if len(accepted) >= k or (budget is not None and budget <= 0):
+            break
+        penalized[last.path[1:-1]] *= penalty
+        last = astar(graph, source, target, penalized, max_edge_distance, max_settled=budget)
+        settled += last.settled
+        if not last.path:
+            break
+
+        edges = _edge_lengths(graph, last.path)
+        positions = [graph.find_edge(u, v) for u, v in zip(last.path[:-1], last.path[1:])]
+        cost = float((graph.weight[positions] * node_factor[last.path[1:]]).sum())
+        if cost > best.cost * max_stretch:
+            continue
+        shared = max(sum(length for edge, length in edges.items() if edge in other)
+                     for other in accepted_edges)
+        overlap = shared / last.distance if last.distance else 1.0
+        if overlap <= max_overlap:
+            accepted.append(SearchResult(last.path, last.distance, cost, settled))
+            accepted_edges.append(edges)
+
+    accepted.sort(key=lambda result: result.cost)
+    for result in accepted:
+        result.settled = settled
+    return accepted
@@ -0,0 +1,76 @@
+import numpy as np
+from scipy.spatial import cKDTree
+from typing import Optional, Tuple
+
+from .geo import EARTH_RADIUS_KM, haversine
+from .graph import StationGraph
+
+def _unit_vectors(lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+    """Project coordinates onto the unit sphere so Euclidean KD-tree
+    distances are monotone in great-circle distance."""
+    lat, lng = np.radians(lat), np.radians(lng)
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)))
+
+
+def _chord(radius_km: float) -> float:
+    return 2 * np.sin(min(radius_km / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def spatial_edges(lat: np.ndarray, lng: np.ndarray,
+                  k: Optional[int] = 6,
+                  radius_km: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Build undirected edges between nearby stations using a KD-tree.
+
+    - k only: connect every station to its k nearest neighbours
+    - radius_km only: connect every pair closer than radius_km
+    - both: k nearest neighbours, but none further than radius_km
+
+    Returns:
+        Tuple of (u, v, distance_km) arrays with u < v and no duplicates
+    """
+    if k is None and radius_km is None:
+        raise ValueError("Either k or radius_km must be given")
+    if k is not None and k < 1:
+        raise ValueError(f"k must be at least 1, got {k}")
+
+    n = len(lat)
+    if n < 2:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0)
+
+    points = _unit_vectors(lat, lng)
+    tree = cKDTree(points)
+
+    if k is None:
+        pairs = tree.query_pairs(_chord(radius_km), output_type='ndarray')
+        u, v = pairs[:, 0].astype(np.int64), pairs[:, 1].astype(np.int64)
+    else:
+        k = min(k, n - 1)
+        bound = np.inf if radius_km is None else _chord(radius_km)
+        # k + 1 because every point is its own nearest neighbour
+        _, nbrs = tree.query(points, k=k + 1, distance_upper_bound=bound)
+        u = np.repeat(np.arange(n, dtype=np.int64), k)
+        v = nbrs[:, 1:].ravel().astype(np.int64)
+        found = (v < n) & (v != u)  # missing neighbours are reported as n
+        u, v = u[found], v[found]
+        u, v = np.minimum(u, v), np.maximum(u, v)
+        keys = np.sort(u * n + v)
+        keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+        u, v = keys // n, keys % n
+
+    return u, v, haversine(lat[u], lng[u], lat[v], lng[v])
+
+
+def connect_nearest(graph: StationGraph,
+                    k: Optional[int] = 6,
+                    radius_km: Optional[float] = None) -> int:
+    """Add spatial-index edges between the stations of a graph.
+
+    Returns:
+        Number of edges added
+    """
+    u, v, distance = spatial_edges(graph.lat, graph.lng, k=k, radius_km=radius_km)
+    graph.add_edges(u, v, distance)
+    return len(u)
@@ -0,0 +1,271 @@
+import heapq
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from .graph import StationGraph
+from .search import SearchResult
+
+INF = float('inf')
+FORMAT_VERSION = 2
+
+
+class ContractionHierarchy:
+    """
+    Contraction hierarchy over the static edge weights (distance * traffic
+    factor) of a StationGraph.
+
+    Nodes are contracted in edge-difference order; every contracted node keeps
+    its edges to not-yet-contracted (higher ranked) neighbours, so a query is a
+    bidirectional Dijkstra that only ever moves upwards. Shortcut edges record
+    the node they bypass so paths can be unpacked into original edges.
+
+    The hierarchy knows nothing about station status or predicted loads;
+    callers apply those to the unpacked path afterwards.
+    """
+
+    def __init__(self, ids: np.ndarray, rank: np.ndarray, indptr: np.ndarray,
+                 indices: np.ndarray, weight: np.ndarray, middle: np.ndarray,
+                 fingerprint: str = ''):
+        self.ids = ids
+        self.fingerprint = fingerprint  # StationGraph.edge_fingerprint() of the source graph
+        self.rank = rank
+        self.indptr = indptr
+        self.indices = indices
+        self.weight = weight
+        self.middle = middle  # bypassed node for shortcuts, -1 for original edges
+
+        # Per-node upward adjacency as Python lists: the query loop is pure
+        # Python and small NumPy slices would dominate its cost.
+        nbrs, weights, middles = indices.tolist(), weight.tolist(), middle.tolist()
+        bounds = indptr.tolist()
+        self._up = [list(zip(nbrs[lo:hi], weights[lo:hi], middles[lo:hi]))
+                    for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+    # ------------------------------------------------------------------
+    # Preprocessing
+    # ------------------------------------------------------------------
+    @classmethod
+    def build(cls, graph: StationGraph, witness_limit: int = 64) -> 'ContractionHierarchy':
+        """
+        Contract every node of the graph.
+
+        Args:
+            witness_limit: nodes a witness search may settle before giving up;
+                lower is faster to build but adds more shortcuts
+        """
+        n = graph.number_of_nodes()
+        bounds = graph.indptr.tolist()
+        indices = graph.indices.tolist()
+        weight = graph.weight.tolist()
+
+        adj: List[Dict[int, float]] = [{} for _ in range(n)]
+        for u in range(n):
+            row = adj[u]
+            for e in range(bounds[u], bounds[u + 1]):
+                v = indices[e]
+                if v != u and weight[e] < row.get(v, INF):
+                    row[v] = weight[e]
+
+        middle: Dict[Tuple[int, int], int] = {}
+        deleted = [0] * n
+
+        def witness(source: int, skip: int, max_cost: float) -> Dict[int, float]:
+            dist = {source: 0.0}
+            heap = [(0.0, source)]
+            settled = 0
+            while heap and settled < witness_limit:
+                d, u = heapq.heappop(heap)
+                if d > dist[u]:
+                    continue
+                if d > max_cost:
+                    break
+                settled += 1
+                for v, w in adj[u].items():
+                    if v == skip:
+                        continue
+                    nd = d + w
+                    if nd < dist.get(v, INF):
+                        dist[v] = nd
+                        heapq.heappush(heap, (nd, v))
+            return dist
+
+        def shortcuts(v: int) -> List[Tuple[int, int, float]]:
+            nbrs = list(adj[v].items())
+            needed = []
+            for i, (u, wu) in enumerate(nbrs[:-1]):
+                rest = nbrs[i + 1:]
+                dist = witness(u, v, wu + max(w for _, w in rest))
+                for x, wx in rest:
+                    if dist.get(x, INF) > wu + wx:
+                        needed.append((u, x, wu + wx))
+            return needed
+
+        def priority(v: int) -> Tuple[int, List[Tuple[int, int, float]]]:
+            needed = shortcuts(v)
+            return len(needed) - len(adj[v]) + deleted[v], needed
+
+        heap = [(priority(v)[0], v) for v in range(n)]
+        heapq.heapify(heap)
+        rank = np.empty(n, dtype=np.int64)
+        up: List[List[Tuple[int, float, int]]] = [[] for _ in range(n)]
+        order = 0
+
+        while heap:
+            _, v = heapq.heappop(heap)
+            # Lazy update: re-evaluate and defer if no longer the cheapest
+            current, needed = priority(v)
+            if heap and current > heap[0][0]:
+                heapq.heappush(heap, (current, v))
+                continue
+
+            rank[v] = order
+            order += 1
+            up[v] = [(x, w, middle.get((min(v, x), max(v, x)), -1))
+                     for x, w in adj[v].items()]
+            for u, x, w in needed:
+                if w < adj[u].get(x, INF):
+                    adj[u][x] = w
+                    adj[x][u] = w
+                    middle[(min(u, x), max(u, x))] = v
+            for u in adj[v]:
+                del adj[u][v]
+                deleted[u] += 1
+            adj[v] = {}
+
+        counts = np.array([len(edges) for edges in up], dtype=np.int64)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        flat = [edge for edges in up for edge in edges]
+        return cls(ids=graph.ids.copy(),
+                   rank=rank,
+                   indptr=indptr,
+                   indices=np.array([e[0] for e in flat], dtype=np.int64),
+                   weight=np.array([e[1] for e in flat], dtype=np.float64),
+                   middle=np.array([e[2] for e in flat], dtype=np.int64),
+                   fingerprint=graph.edge_fingerprint())
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def save(self, path: str):
+        """Write the hierarchy to an .npz file."""
+        np.savez(path,
+                 format_version=FORMAT_VERSION,
+                 ids=self.ids,
+                 rank=self.rank,
+                 indptr=self.indptr,
+                 indices=self.indices,
+                 weight=self.weight,
+                 middle=self.middle,
+                 fingerprint=self.fingerprint)
+
+    @classmethod
+    def load(cls, path: str, graph: Optional[StationGraph] = None) -> 'ContractionHierarchy':
+        """
+        Load a hierarchy written by save(). If a graph is given, raise
+        ValueError unless the hierarchy was built for exactly the same
+        stations and edges (neighbour count, radius and weights included).
+        """
+        with np.load(path) as data:
+            if int(data['format_version']) != FORMAT_VERSION:
+                raise ValueError(f"Unsupported hierarchy format in {path}")
+            hierarchy = cls(data['ids'], data['rank'], data['indptr'],
+                            data['indices'], data['weight'], data['middle'],
+                            fingerprint=str(data['fingerprint']))
+        if graph is not None and hierarchy.fingerprint != graph.edge_fingerprint():
+            raise ValueError("Contraction hierarchy does not match the station graph")
+        return hierarchy
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def query(self, source: int, target: int) -> SearchResult:
+        """
+        Shortest path by static weight between two dense node indices.
+
+        The returned SearchResult has ``distance`` left as nan; the hierarchy
+        only stores weights, so the caller fills it in from the graph.
+        """
+        if source == target:
+            return SearchResult([source], 0.0, 0.0, 1)
+
+        up = self._up
+        dist = ({source: 0.0}, {target: 0.0})
+        pred: Tuple[Dict[int, int], Dict[int, int]] = ({}, {})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        done = (set(), set())
+        best = INF
+        meeting = -1
+        count = 0
+
+        while heaps[0] or heaps[1]:
+            # Alternate by smallest key; a side is finished once its key
+            # reaches the best meeting cost
+            if heaps[0] and (not heaps[1] or heaps[0][0][0] <= heaps[1][0][0]):
+                side = 0
+            else:
+                side = 1
+            d, u = heapq.heappop(heaps[side])
+            if d >= best:
+                heaps[side].clear()
+                continue
+            if u in done[side]:
+                continue
+            done[side].add(u)
+            count += 1
+
+            other = dist[1 - side].get(u)
+            if other is not None and d + other < best:
+                best = d + other
+                meeting = u
+
+            own, parents = dist[side], pred[side]
+            # Stall-on-demand: u is reached more cheaply through a higher
+            # neighbour, so nothing relaxed from it can be on a shortest path
+            if any(own.get(v, INF) + w < d for v, w, _ in up[u]):
+                continue
+            for v, w, _ in up[u]:
+                nd = d + w
+                if nd < own.get(v, INF):
+                    own[v] = nd
+                    parents[v] = u
+                    heapq.heappush(heaps[side], (nd, v))
+
+        if meeting < 0:
+            return SearchResult([], INF, INF, count)
+
+        head = [meeting]
+        while head[-1] != source:
+            head.append(pred[0][head[-1]])
+        head.reverse()
+        tail = [meeting]
+        while tail[-1] != target:
+            tail.append(pred[1][tail[-1]])
+
+        path = [source]
+        for a, b in zip(head[:-1] + tail[:-1], head[1:] + tail[1:]):
+            path.extend(self._unpack(a, b)[1:])
+        return SearchResult(path, float('nan'), best, count)
+
+    def _edge(self, a: int, b: int) -> Tuple[float, int]:
+        """(weight, middle) of the hierarchy edge between a and b."""
+        low, high = (a, b) if self.rank[a] < self.rank[b] else (b, a)
+        best = None
+        for v, w, mid in self._up[low]:
+            if v == high and (best is None or w < best[0]):
+                best = (w, mid)
+        return best
+
+    def _unpack(self, a: int, b: int) -> List[int]:
+        """Expand a hierarchy edge into the original nodes from a to b."""
+        path = [a]
+        stack = [(a, b)]
+        while stack:
+            u, v = stack.pop()
+            mid = self._edge(u, v)[1]
+            if mid < 0:
+                path.append(v)
+            else:
+                stack.append((mid, v))
+                stack.append((u, mid))
+        return path
@@ -1,8 +1,27 @@
-import networkx as nx
 import numpy as np
 from typing import List, Dict, Tuple, Optional
 from dataclasses import dataclass
 
+from .alternatives import alternative_routes
+from .builder import connect_nearest
+from .contraction import ContractionHierarchy
+from .dynamic import HotTrees
+from .energy import soc_route
+from .graph import StationGraph
+from .search import SearchResult, astar, bidirectional, dijkstra, one_to_many, time_dependent
+
+SEARCH_METHODS = {
+    'dijkstra': dijkstra,
+    'astar': astar,
+    'bidirectional': bidirectional,
+    'bidirectional_astar': lambda *args: bidirectional(*args, use_heuristic=True),
+    'ch': None,  # uses the router's contraction hierarchy
+}
+
+# A hierarchy route is only accepted if it is provably within this factor of
+# the optimal penalized cost; otherwise the query falls back to A*.
+CH_PENALTY_TOLERANCE = 1.25
+
 @dataclass
 class Station:
     id: int
@@ -14,28 +33,145 @@ class Station:
     status: str
     charging_rate: float  # kW
 
+@dataclass
+class RouteResult:
+    route: List[int]  # station IDs, empty if no feasible route
+    total_distance: float
+    settled: int  # nodes settled by the search, for comparing methods
+    method: str
+    arrival_minutes: Optional[List[float]] = None  # per route station, time-dependent only
+
+@dataclass
+class ChargingPlan:
+    route: List[int]  # station IDs, empty if no feasible route
+    total_distance: float
+    total_minutes: float  # driving plus charging
+    arrival_charge: float  # percentage
+    charging_stops: List[Dict]  # station_id, energy_kwh, minutes
+    settled: int
+
 class ChargingRouter:
-    def __init__(self):
-        self.graph = nx.Graph()
+    def __init__(self, hot_trees: int = 0, hot_threshold: int = 3):
+        """
+        Args:
+            hot_trees: number of shortest path trees kept for frequently
+                queried origins and repaired on status changes (0 disables)
+            hot_threshold: queries from one origin before it gets a tree
+        """
+        self.graph = StationGraph()
+        self.hierarchy: Optional[ContractionHierarchy] = None
+        self.trees = HotTrees(max_trees=hot_trees, threshold=hot_threshold)
+        # Bumped on every change to the stations or connections; part of
+        # cache keys. Status changes are reported by update_station_status
+        self.version = 0
         
     def add_station(self, station: Station):
         """Add a charging station to the graph."""
-        self.graph.add_node(station.id, 
-                          name=station.name,
-                          lat=station.lat,
-                          lng=station.lng,
-                          capacity=station.capacity,
-                          current_load=station.current_load,
-                          status=station.status,
-                          charging_rate=station.charging_rate)
+        self.graph.add_node(station.id,
+                            name=station.name,
+                            lat=station.lat,
+                            lng=station.lng,
+                            capacity=station.capacity,
+                            current_load=station.current_load,
+                            status=station.status,
+                            charging_rate=station.charging_rate)
+        self.hierarchy = None
+        self.trees.clear()
+        self.version += 1
     
     def add_connection(self, station1_id: int, station2_id: int, 
                       distance: float, traffic_factor: float = 1.0):
         """Add a connection between two stations with distance and traffic factor."""
         self.graph.add_edge(station1_id, station2_id,
-                          distance=distance,
-                          traffic_factor=traffic_factor,
-                          weight=distance * traffic_factor)
+                            distance=distance,
+                            traffic_factor=traffic_factor)
+        self.hierarchy = None
+        self.trees.clear()
+        self.version += 1
+    
+    def connect_nearest_stations(self, k: Optional[int] = 6,
+                                 radius_km: Optional[float] = None) -> int:
+        """
+        Connect stations to their geographic neighbours, using the k nearest
+        neighbours and/or every station within radius_km. Edge distances are
+        great-circle kilometres.
+        
+        Returns:
+            Number of connections added
+        """
+        self.hierarchy = None
+        self.trees.clear()
+        self.version += 1
+        return connect_nearest(self.graph, k=k, radius_km=radius_km)
+    
+    def save_snapshot(self, directory: str, metadata: Optional[Dict] = None):
+        """Write the station graph to a binary snapshot directory."""
+        self.graph.save(directory, metadata)
+    
+    def load_snapshot(self, directory: str) -> Dict:
+        """
+        Replace the station graph with a memory-mapped snapshot written by
+        save_snapshot. Returns the metadata saved with it.
+        """
+        self.graph, metadata = StationGraph.load(directory)
+        self.hierarchy = None
+        self.trees.clear()
+        self.version += 1
+        return metadata
+    
+    def build_contraction_hierarchy(self, path: Optional[str] = None,
+                                    witness_limit: int = 64) -> ContractionHierarchy:
+        """
+        Preprocess the current graph into a contraction hierarchy for the
+        'ch' search method, optionally saving it to path (.npz).
+        """
+        self.hierarchy = ContractionHierarchy.build(self.graph, witness_limit=witness_limit)
+        if path:
+            self.hierarchy.save(path)
+        return self.hierarchy
+    
+    def load_contraction_hierarchy(self, path: str) -> ContractionHierarchy:
+        """Load a saved hierarchy; raises ValueError if it belongs to another graph."""
+        self.hierarchy = ContractionHierarchy.load(path, self.graph)
+        return self.hierarchy
+    
+    def _load_factor(self, predicted_loads: Optional[Dict[int, float]]) -> np.ndarray:
+        """Per-node load multiplier (1 + predicted load), ignoring status."""
+        factor = np.ones(self.graph.number_of_nodes())
+        if predicted_loads:
+            index = self.graph.index_of
+            for station_id, load in predicted_loads.items():
+                if station_id in self.graph:
+                    factor[index(station_id)] *= 1 + load
+        return factor
+    
+    def _node_factor(self, predicted_loads: Optional[Dict[int, float]]) -> np.ndarray:
+        """Per-node weight multiplier: (1 + predicted load), inf if unavailable."""
+        return np.where(self.graph.available, self._load_factor(predicted_loads), np.inf)
+    
+    def _tree_routes(self, source: int, targets: List[int],
+                     predicted_loads: Optional[Dict[int, float]],
+                     max_edge_distance: float) -> Optional[List[RouteResult]]:
+        """Exact routes from a hot origin's shortest path tree, if it has one."""
+        results = self.trees.paths(self.graph, source, targets,
+                                   self._load_factor(predicted_loads), max_edge_distance)
+        if results is None:
+            return None
+        ids = self.graph.ids
+        return [RouteResult(route=ids[result.path].tolist(),
+                            total_distance=result.distance,
+                            settled=result.settled,
+                            method='tree')
+                for result in results]
+    
+    @staticmethod
+    def max_hop(battery_capacity: float, current_charge: float,
+                 vehicle_efficiency: float) -> float:
+        """Longest single hop (km) the current charge allows."""
+        usable_energy = current_charge * battery_capacity / 100
+        if vehicle_efficiency > 0:
+            return usable_energy / vehicle_efficiency
+        return float('inf')
     
     def find_optimal_route(self, 
                           start_id: int, 
@@ -43,7 +179,8 @@ class ChargingRouter:
                           battery_capacity: float,
                           current_charge: float,
                           vehicle_efficiency: float,
-                          predicted_loads: Optional[Dict[int, float]] = None) -> Tuple[List[int], float]:
+                          predicted_loads: Optional[Dict[int, float]] = None,
+                          method: str = 'dijkstra') -> Tuple[List[int], float]:
         """
         Find the optimal route between two stations considering:
         - Distance
@@ -52,46 +189,236 @@ class ChargingRouter:
         - Battery constraints
         - Predicted station loads
         
+        Unavailable stations and connections longer than the current charge
+        can cover are treated as impassable.
+        
         Returns:
             Tuple of (route as list of station IDs, total distance)
         """
-        def weight_function(u, v, d):
-            # Base weight is the distance
-            weight = d['weight']
-            
-            # Adjust weight based on predicted load if available
-            if predicted_loads:
-                v_load = predicted_loads.get(v, 0)
-                weight *= (1 + v_load)  # Increase weight for stations with higher predicted load
-            
-            # Check if station is available
-            v_status = self.graph.nodes[v]['status']
-            if v_status != 'available':
-                return float('inf')
-            
-            # Check if we have enough battery to reach the station
-            distance = d['distance']
-            energy_needed = distance * vehicle_efficiency
-            if energy_needed > current_charge * battery_capacity / 100:
-                return float('inf')
-            
-            return weight
-        
-        try:
-            # Find shortest path using Dijkstra's algorithm
-            path = nx.shortest_path(self.graph, 
-                                  start_id, 
-                                  end_id, 
-                                  weight=weight_function)
-            
-            # Calculate total distance
-            total_distance = sum(self.graph[path[i]][path[i+1]]['distance'] 
-                               for i in range(len(path)-1))
-            
-            return path, total_distance
-            
-        except nx.NetworkXNoPath:
-            return [], float('inf')
+        result = self.search_route(start_id, end_id, battery_capacity,
+                                   current_charge, vehicle_efficiency,
+                                   predicted_loads, method)
+        return result.route, result.total_distance
+    
+    def search_route(self,
+                     start_id: int,
+                     end_id: int,
+                     battery_capacity: float,
+                     current_charge: float,
+                     vehicle_efficiency: float,
+                     predicted_loads: Optional[Dict[int, float]] = None,
+                     method: str = 'dijkstra') -> RouteResult:
+        """
+        Same as find_optimal_route, but returns a RouteResult that also reports
+        how many nodes the search settled.
+        
+        method is one of 'dijkstra', 'astar', 'bidirectional' or
+        'bidirectional_astar', which all return the same optimal cost, or 'ch'
+        (see _hierarchy_search). Exact methods are answered from the
+        origin's shortest path tree instead once the origin is hot, in which
+        case the result's method is 'tree'.
+        """
+        if method not in SEARCH_METHODS:
+            raise ValueError(f"Unknown search method: {method}")
+        source = self.graph.index_of(start_id)
+        target = self.graph.index_of(end_id)
+        max_edge_distance = self.max_hop(battery_capacity, current_charge, vehicle_efficiency)
+        
+        if method != 'ch':
+            routes = self._tree_routes(source, [target], predicted_loads, max_edge_distance)
+            if routes is not None:
+                return routes[0]
+        
+        node_factor = self._node_factor(predicted_loads)
+        if method == 'ch':
+            result = self._hierarchy_search(source, target, node_factor, max_edge_distance)
+        else:
+            result = SEARCH_METHODS[method](self.graph,
+                                            source,
+                                            target,
+                                            node_factor,
+                                            max_edge_distance)
+        
+        return RouteResult(route=self.graph.ids[result.path].tolist(),
+                           total_distance=result.distance,
+                           settled=result.settled,
+                           method=method)
+    
+    def find_routes_from(self,
+                         start_id: int,
+                         end_ids: List[int],
+                         battery_capacity: float,
+                         current_charge: float,
+                         vehicle_efficiency: float,
+                         predicted_loads: Optional[Dict[int, float]] = None) -> List[RouteResult]:
+        """
+        Optimal routes from one station to many, sharing a single Dijkstra
+        tree that stops once every destination is settled. Results are aligned
+        with end_ids and match find_optimal_route for each pair.
+        """
+        source = self.graph.index_of(start_id)
+        targets = [self.graph.index_of(end_id) for end_id in end_ids]
+        max_edge_distance = self.max_hop(battery_capacity, current_charge, vehicle_efficiency)
+        routes = self._tree_routes(source, targets, predicted_loads, max_edge_distance)
+        if routes is not None:
+            return routes
+        results = one_to_many(self.graph,
+                              source,
+                              targets,
+                              self._node_factor(predicted_loads),
+                              max_edge_distance)
+        
+        ids = self.graph.ids
+        return [RouteResult(route=ids[result.path].tolist(),
+                            total_distance=result.distance,
+                            settled=result.settled,
+                            method='dijkstra')
+                for result in results]
+    
+    def find_alternative_routes(self,
+                                start_id: int,
+                                end_id: int,
+                                battery_capacity: float,
+                                current_charge: float,
+                                vehicle_efficiency: float,
+                                predicted_loads: Optional[Dict[int, float]] = None,
+                                k: int = 3,
+                                max_settled: Optional[int] = None) -> List[RouteResult]:
+        """
+        Up to k meaningfully different routes, the optimal one first (see
+        alternative_routes). max_settled caps the total search effort, so
+        fewer than k routes may come back.
+        """
+        results = alternative_routes(self.graph,
+                                     self.graph.index_of(start_id),
+                                     self.graph.index_of(end_id),
+                                     self._node_factor(predicted_loads),
+                                     self.max_hop(battery_capacity, current_charge,
+                                                   vehicle_efficiency),
+                                     k=k,
+                                     max_settled=max_settled)
+        
+        ids = self.graph.ids
+        return [RouteResult(route=ids[result.path].tolist(),
+                            total_distance=result.distance,
+                            settled=result.settled,
+                            method='alternatives')
+                for result in results]
+    
+    def find_time_dependent_route(self,
+                                  start_id: int,
+                                  end_id: int,
+                                  battery_capacity: float,
+                                  current_charge: float,
+                                  vehicle_efficiency: float,
+                                  load_profiles: np.ndarray,
+                                  start_minute: float = 0.0,
+                                  bucket_minutes: float = 60.0) -> RouteResult:
+        """
+        Find the optimal route when each station's load is charged at the
+        time the vehicle actually arrives there.
+        
+        Args:
+            load_profiles: predicted loads of shape (stations, buckets), rows
+                aligned with graph.ids, precomputed once for the query window
+            start_minute: departure time in minutes after the window start
+            bucket_minutes: length of one profile bucket
+        """
+        load_profiles = np.asarray(load_profiles, dtype=np.float64)
+        if load_profiles.ndim != 2 or load_profiles.shape[0] != self.graph.number_of_nodes():
+            raise ValueError("load_profiles must have one row per station")
+        result, arrival = time_dependent(self.graph,
+                                         self.graph.index_of(start_id),
+                                         self.graph.index_of(end_id),
+                                         load_profiles,
+                                         start_minute=start_minute,
+                                         max_edge_distance=self.max_hop(
+                                             battery_capacity, current_charge, vehicle_efficiency),
+                                         bucket_minutes=bucket_minutes)
+        
+        return RouteResult(route=self.graph.ids[result.path].tolist(),
+                           total_distance=result.distance,
+                           settled=result.settled,
+                           method='time_dependent',
+                           arrival_minutes=arrival)
+    
+    def _hierarchy_search(self, source: int, target: int,
+                          node_factor: np.ndarray,
+                          max_edge_distance: float) -> SearchResult:
+        """
+        Query the contraction hierarchy, which only knows static weights, then
+        apply this query's status, range and load penalties to the unpacked
+        path. If the path crosses an unavailable station, an out-of-range hop
+        or a hop that is not an edge of the graph, or its penalized cost could
+        be more than CH_PENALTY_TOLERANCE times the optimum, fall back to A*
+        on the full penalized graph.
+        
+        The optimum is bounded below by the static optimum times the smallest
+        node factor, since every edge cost is its static weight times a
+        factor.
+        """
+        if self.hierarchy is None:
+            raise ValueError("No contraction hierarchy; call build_contraction_hierarchy first")
+        result = self.hierarchy.query(source, target)
+        if not result.path:
+            return result
+        
+        path = result.path
+        edges = [self.graph.find_edge(u, v) for u, v in zip(path[:-1], path[1:])]
+        if -1 not in edges:
+            factors = node_factor[path[1:]]
+            distances = self.graph.distance[edges]
+            cost = float((self.graph.weight[edges] * factors).sum())
+            lower_bound = result.cost * node_factor[np.isfinite(node_factor)].min()
+            if (np.all(np.isfinite(factors)) and np.all(distances <= max_edge_distance)
+                    and cost <= lower_bound * CH_PENALTY_TOLERANCE):
+                return SearchResult(path, float(distances.sum()), cost, result.settled)
+        
+        fallback = astar(self.graph, source, target, node_factor, max_edge_distance)
+        fallback.settled += result.settled
+        return fallback
+    
+    def plan_charging_route(self,
+                            start_id: int,
+                            end_id: int,
+                            battery_capacity: float,
+                            current_charge: float,
+                            vehicle_efficiency: float,
+                            predicted_loads: Optional[Dict[int, float]] = None,
+                            min_charge: float = 0.0,
+                            soc_levels: int = 50) -> ChargingPlan:
+        """
+        Find the fastest route that tracks battery state of charge along the
+        way and recharges at intermediate stations when needed.
+        
+        Args:
+            battery_capacity: kWh
+            current_charge: percentage at the start station
+            vehicle_efficiency: kWh/km
+            min_charge: reserve percentage the battery may never drop below
+            soc_levels: number of charge buckets used to prune dominated labels
+        """
+        result = soc_route(self.graph,
+                           self.graph.index_of(start_id),
+                           self.graph.index_of(end_id),
+                           self._node_factor(predicted_loads),
+                           battery_capacity,
+                           current_charge,
+                           vehicle_efficiency,
+                           min_charge=min_charge,
+                           soc_levels=soc_levels)
+        
+        ids = self.graph.ids
+        return ChargingPlan(route=ids[result.path].tolist(),
+                            total_distance=result.distance,
+                            total_minutes=float(result.minutes),
+                            arrival_charge=float(result.arrival_charge),
+                            charging_stops=[{
+                                'station_id': int(ids[stop.node]),
+                                'energy_kwh': float(stop.energy),
+                                'minutes': float(stop.minutes)
+                            } for stop in result.stops],
+                            settled=result.settled)
     
     def get_station_info(self, station_id: int) -> Dict:
         """Get information about a specific station."""
@@ -99,8 +426,21 @@ class ChargingRouter:
     
     def update_station_status(self, station_id: int, 
                             current_load: float, 
-                            status: str):
-        """Update the status and load of a station."""
-        if station_id in self.graph:
-            self.graph.nodes[station_id]['current_load'] = current_load
-            self.graph.nodes[station_id]['status'] = status 
\ No newline at end of file
+                            status: str) -> bool:
+        """
+        Update the status and load of a station. Shortest path trees of hot
+        origins are repaired in place when the station's availability flips.
+        
+        Returns:
+            True if the station's availability changed; only then can a
+            route change, and callers caching routes evict what depends on it
+        """
+        if station_id not in self.graph:
+            return False
+        node = self.graph.index_of(station_id)
+        was_available = bool(self.graph.available[node])
+        self.graph.set_status(station_id, current_load, status)
+        available = bool(self.graph.available[node])
+        if available != was_available:
+            self.trees.set_available(self.graph, node, available)
+        return available != was_available
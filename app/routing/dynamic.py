@@ -0,0 +1,245 @@
+import heapq
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from .graph import StationGraph
+from .search import SearchResult, shortest_path_tree, tree_path
+
+INF = float('inf')
+
+
+class ShortestPathTree:
+    """
+    Complete shortest path tree from one source that can be repaired in place
+    when the factor of a single node changes.
+
+    Node factors are ``load_factor`` (1 + predicted load) for available nodes
+    and inf otherwise, as in the static search. A factor increase only
+    invalidates the subtree below the node: those nodes are reset and
+    re-seeded from their unaffected neighbours. A decrease lowers the node
+    and its subtree by the same amount and then propagates the improvement
+    outwards. Either way only the part of the tree that actually changes is
+    touched.
+    """
+
+    def __init__(self, graph: StationGraph, source: int, load_factor: np.ndarray,
+                 max_edge_distance: float = INF):
+        self.source = source
+        self.load_factor = load_factor.copy()
+        self.node_factor = np.where(graph.available, load_factor, np.inf)
+        self.max_edge_distance = max_edge_distance
+        self.dist, self.pred_edge, _, _ = shortest_path_tree(graph, source, self.node_factor,
+                                                             max_edge_distance)
+        self.parent = np.full(len(self.dist), -1, dtype=np.int64)
+        reached = np.flatnonzero(self.pred_edge >= 0)
+        self.parent[reached] = np.searchsorted(graph.indptr, self.pred_edge[reached],
+                                               side='right') - 1
+
+    def path(self, graph: StationGraph, target: int) -> SearchResult:
+        """Tree path to target; ``settled`` is 0 since no search runs."""
+        return tree_path(graph, self.dist, self.pred_edge, np.isfinite(self.dist),
+                         self.source, target, 0)
+
+    def set_available(self, graph: StationGraph, node: int, available: bool) -> int:
+        """
+        Repair the tree after node changed availability.
+
+        Returns:
+            Number of nodes whose distance was recomputed
+        """
+        factor = self.load_factor[node] if available else INF
+        old = self.node_factor[node]
+        self.node_factor[node] = factor
+        # The source's own factor is never charged
+        if factor == old or node == self.source:
+            return 0
+        if factor > old:
+            return self._raise(graph, node)
+        return self._lower(graph, node)
+
+    # ------------------------------------------------------------------
+    # Repair
+    # ------------------------------------------------------------------
+    def _subtree(self, node: int) -> List[int]:
+        """node and every node whose tree path passes through it."""
+        parent = self.parent
+        children = np.flatnonzero(parent >= 0)
+        children = children[np.argsort(parent[children], kind='stable')]
+        starts = np.searchsorted(parent[children], np.arange(len(parent) + 1))
+        nodes = []
+        stack = [node]
+        while stack:
+            u = stack.pop()
+            nodes.append(u)
+            stack.extend(children[starts[u]:starts[u + 1]].tolist())
+        return nodes
+
+    def _edge_costs(self, graph: StationGraph) -> Tuple[np.ndarray, np.ndarray]:
+        """(source node, cost) of every CSR edge under the current factors."""
+        src = np.repeat(np.arange(len(self.dist)), np.diff(graph.indptr))
+        cost = graph.weight * self.node_factor[graph.indices]
+        if self.max_edge_distance < INF:
+            cost[graph.distance > self.max_edge_distance] = np.inf
+        return src, cost
+
+    def _raise(self, graph: StationGraph, node: int) -> int:
+        if not np.isfinite(self.dist[node]):
+            return 0
+        affected = np.zeros(len(self.dist), dtype=bool)
+        affected[self._subtree(node)] = True
+        self.dist[affected] = np.inf
+        self.pred_edge[affected] = -1
+        self.parent[affected] = -1
+
+        # Seed every affected node with its best edge from the intact tree
+        src, cost = self._edge_costs(graph)
+        edges = np.flatnonzero(affected[graph.indices] & ~affected[src])
+        cand = self.dist[src[edges]] + cost[edges]
+        edges, cand = edges[np.isfinite(cand)], cand[np.isfinite(cand)]
+        heap = []
+        for e, d in zip(edges.tolist(), cand.tolist()):
+            v = int(graph.indices[e])
+            if d < self.dist[v]:
+                self._set(v, d, e, int(src[e]))
+                heap.append((d, v))
+        heapq.heapify(heap)
+        self._propagate(graph, heap)
+        return int(affected.sum())
+
+    def _lower(self, graph: StationGraph, node: int) -> int:
+        src, cost = self._edge_costs(graph)
+        edges = np.flatnonzero(graph.indices == node)
+        cand = self.dist[src[edges]] + cost[edges]
+        if not len(edges) or cand.min() >= self.dist[node]:
+            return 0
+        k = int(np.argmin(cand))
+        new = float(cand[k])
+
+        if np.isfinite(self.dist[node]):
+            # Every path through node gets cheaper by the same amount
+            subtree = self._subtree(node)
+            self.dist[subtree] -= self.dist[node] - new
+            heap = [(float(self.dist[v]), v) for v in subtree]
+            heapq.heapify(heap)
+        else:
+            heap = [(new, node)]
+        self._set(node, new, int(edges[k]), int(src[edges[k]]))
+        touched = len(heap)
+        return touched + self._propagate(graph, heap)
+
+    def _set(self, v: int, dist: float, edge: int, parent: int):
+        self.dist[v] = dist
+        self.pred_edge[v] = edge
+        self.parent[v] = parent
+
+    def _propagate(self, graph: StationGraph, heap: List[Tuple[float, int]]) -> int:
+        """Relax outwards from the queued nodes until no distance improves."""
+        indptr = graph.indptr
+        indices = graph.indices
+        weight = graph.weight
+        distance = graph.distance
+        check_range = self.max_edge_distance < INF
+        improved_count = 0
+
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > self.dist[u]:
+                continue
+            lo, hi = indptr[u], indptr[u + 1]
+            nbrs = indices[lo:hi]
+            cand = d + weight[lo:hi] * self.node_factor[nbrs]
+            if check_range:
+                cand[distance[lo:hi] > self.max_edge_distance] = np.inf
+            improved = np.flatnonzero(cand < self.dist[nbrs])
+            if not len(improved):
+                continue
+            vs = nbrs[improved]
+            self.dist[vs] = cand[improved]
+            self.pred_edge[vs] = lo + improved
+            self.parent[vs] = u
+            improved_count += len(improved)
+            for key, v in zip(cand[improved].tolist(), vs.tolist()):
+                heapq.heappush(heap, (key, v))
+        return improved_count
+
+
+class HotTrees:
+    """
+    Shortest path trees for frequently queried origins.
+
+    An origin (with a given hop range) gets a complete tree once it has been
+    queried ``threshold`` times; at most ``max_trees`` trees are kept in LRU
+    order. Trees are only reused for queries with the same load factors they
+    were built with, and are repaired in place when a station changes
+    availability.
+    """
+
+    def __init__(self, max_trees: int = 32, threshold: int = 3):
+        self.max_trees = max_trees
+        self.threshold = threshold
+        self._trees: 'OrderedDict[Hashable, ShortestPathTree]' = OrderedDict()
+        self._counts: 'OrderedDict[Hashable, int]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+        self.repairs = 0
+        self.repaired_nodes = 0
+
+    def paths(self, graph: StationGraph, source: int, targets: List[int],
+              load_factor: np.ndarray, max_edge_distance: float) -> Optional[List[SearchResult]]:
+        """
+        Paths to targets from the origin's tree, building the tree if the
+        origin just became hot. Returns None if the origin is not hot yet.
+        """
+        if self.max_trees <= 0:
+            return None
+        key = (source, max_edge_distance)
+        with self._lock:
+            tree = self._trees.get(key)
+            if tree is not None and np.array_equal(tree.load_factor, load_factor):
+                self._trees.move_to_end(key)
+                self.hits += 1
+                return [tree.path(graph, target) for target in targets]
+
+            count = self._counts.pop(key, 0) + 1
+            if tree is None and count < self.threshold:
+                self._counts[key] = count
+                while len(self._counts) > self.max_trees * 4:
+                    self._counts.popitem(last=False)
+                return None
+
+            tree = ShortestPathTree(graph, source, load_factor, max_edge_distance)
+            self.builds += 1
+            self._trees[key] = tree
+            self._trees.move_to_end(key)
+            while len(self._trees) > self.max_trees:
+                self._trees.popitem(last=False)
+            return [tree.path(graph, target) for target in targets]
+
+    def set_available(self, graph: StationGraph, node: int, available: bool):
+        """Repair every tree after a station changed availability."""
+        with self._lock:
+            for tree in self._trees.values():
+                self.repaired_nodes += tree.set_available(graph, node, available)
+                self.repairs += 1
+
+    def clear(self):
+        with self._lock:
+            self._trees.clear()
+            self._counts.clear()
+
+    def __len__(self) -> int:
+        return len(self._trees)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'trees': len(self._trees),
+                'max_trees': self.max_trees,
+                'hits': self.hits,
+                'builds': self.builds,
+                'repairs': self.repairs,
+                'repaired_nodes': self.repaired_nodes
+            }
@@ -0,0 +1,205 @@
+import heapq
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from .graph import StationGraph
+from .search import MINUTES_PER_KM, distance_bound, heuristic_scale
+
+INF = float('inf')
+STOP_OVERHEAD_MINUTES = 5.0  # parking and plugging in at each charging stop
+
+
+@dataclass
+class ChargeStop:
+    node: int  # dense node index
+    energy: float  # kWh added
+    minutes: float
+
+
+@dataclass
+class EnergyResult:
+    path: List[int]  # dense node indices, empty if unreachable
+    distance: float
+    minutes: float  # driving plus charging time
+    arrival_charge: float  # percent of battery capacity left at the target
+    stops: List[ChargeStop] = field(default_factory=list)
+    settled: int = 0  # labels settled
+    cost: float = INF  # search cost: minutes with driving scaled by load penalties
+
+
+def soc_route(graph: StationGraph,
+              source: int,
+              target: int,
+              node_factor: np.ndarray,
+              battery_capacity: float,
+              current_charge: float,
+              vehicle_efficiency: float,
+              min_charge: float = 0.0,
+              soc_levels: int = 50,
+              minutes_per_km: float = MINUTES_PER_KM,
+              stop_overhead: float = STOP_OVERHEAD_MINUTES) -> EnergyResult:
+    """
+    Resource-constrained shortest path over (node, state of charge) labels.
+
+    Every label carries the exact kWh left in the battery. State of charge is
+    only bucketed for pruning: labels are keyed by node and one of
+    ``soc_levels`` buckets of battery_capacity / soc_levels kWh, so
+    consumption is never rounded and does not accumulate error over many
+    short edges. Arriving at an available station, the vehicle may charge at
+    that station's charging_rate for stop_overhead extra minutes, either just
+    enough for one of the outgoing connections, enough to reach the target
+    without stopping again, or to full.
+    Charge is never allowed to drop below min_charge percent.
+
+    Labels are expanded A*-style with a scaled haversine bound on the
+    remaining driving time. The bound is the same for every label at a node,
+    so labels at one node still settle in cost order: a label is dominated as
+    soon as its node has settled a label in at least as high a bucket, and
+    dominated labels are never pushed or expanded.
+
+    Labels are ordered by driving minutes scaled by node_factor plus
+    charging minutes; the returned ``minutes`` is the plan's actual driving
+    and charging time, ``cost`` the penalized value it was chosen by.
+    """
+    n = graph.number_of_nodes()
+    indptr = graph.indptr
+    indices = graph.indices
+    weight = graph.weight
+    rate = graph.charging_rate
+    can_charge = graph.available & (rate > 0)
+
+    bucket = battery_capacity / soc_levels
+    start_energy = current_charge / 100 * battery_capacity
+    reserve = min_charge / 100 * battery_capacity
+    if start_energy < reserve - 1e-9:
+        return EnergyResult([], INF, INF, 0.0)
+    # kWh consumed by every CSR edge; edges that can never be driven are masked
+    consumption = graph.distance * vehicle_efficiency
+    drivable = consumption <= battery_capacity - reserve + 1e-9
+    to_target = _energy_to_target(graph, target, node_factor, consumption, drivable)
+
+    def level_of(energy):
+        return np.floor(energy / bucket + 1e-9).astype(np.int64)
+
+    # Lower bound on remaining driving minutes, for every node up front
+    scale = heuristic_scale(graph, node_factor) * minutes_per_km
+    estimate = distance_bound(graph, target, scale)(np.arange(n)).tolist()
+    # best_level[u]: highest charge bucket settled at u so far (dominance)
+    best_level = np.full(n, -1, dtype=np.int64)
+    # label key -> (minutes, kWh left, predecessor key, CSR edge or -1 for a charge stop)
+    start_level = int(level_of(start_energy))
+    labels: Dict[Tuple[int, int], Tuple[float, float, Optional[Tuple[int, int]], int]] = {
+        (source, start_level): (0.0, start_energy, None, -1)
+    }
+    heap = [(float(estimate[source]), 0.0, source, start_level)]
+    count = 0
+    goal = None
+
+    def push(key, new_cost, energy, pred, edge):
+        label = labels.get(key)
+        if label is None or new_cost < label[0] or (new_cost == label[0] and energy > label[1]):
+            labels[key] = (new_cost, energy, pred, edge)
+            heapq.heappush(heap, (new_cost + estimate[key[0]], new_cost, key[0], key[1]))
+
+    while heap:
+        _, cost, u, level = heapq.heappop(heap)
+        if level <= best_level[u] or labels[(u, level)][0] < cost:
+            continue
+        best_level[u] = level
+        count += 1
+        if u == target:
+            goal = (u, level)
+            break
+
+        lo, hi = indptr[u], indptr[u + 1]
+        if lo == hi:
+            continue
+        nbrs = indices[lo:hi]
+        edge_energy = consumption[lo:hi]
+        edge_ok = drivable[lo:hi]
+
+        _, energy, pred, edge = labels[(u, level)]
+        arrived = pred is None or edge >= 0
+        if arrived and can_charge[u] and energy < battery_capacity - 1e-9:
+            # Charge just enough for one of the next hops, for the rest of
+            # the trip, or to full
+            targets = set((edge_energy[edge_ok] + reserve).tolist())
+            targets.add(to_target[u] + reserve)
+            targets.add(battery_capacity)
+            minutes_per_kwh = 60 / rate[u]
+            for new_energy in targets:
+                if energy + 1e-9 < new_energy <= battery_capacity + 1e-9:
+                    new_energy = min(new_energy, battery_capacity)
+                    push((u, int(level_of(new_energy))),
+                         cost + stop_overhead + (new_energy - energy) * minutes_per_kwh,
+                         new_energy, (u, level), -1)
+
+        new_energies = energy - edge_energy
+        new_levels = level_of(new_energies)
+        ok = edge_ok & (new_energies >= reserve - 1e-9) & (new_levels > best_level[nbrs])
+        ok &= np.isfinite(node_factor[nbrs])
+        candidates = np.flatnonzero(ok)
+        if not len(candidates):
+            continue
+        vs = nbrs[candidates]
+        costs = cost + weight[lo + candidates] * node_factor[vs] * minutes_per_km
+        for k, new_cost, v, new_level, new_energy in zip(
+                candidates.tolist(), costs.tolist(), vs.tolist(),
+                new_levels[candidates].tolist(), new_energies[candidates].tolist()):
+            push((v, new_level), new_cost, new_energy, (u, level), lo + k)
+
+    if goal is None:
+        return EnergyResult([], INF, INF, 0.0, settled=count)
+    return _trace_plan(graph, labels, goal, battery_capacity, count,
+                       minutes_per_km, stop_overhead)
+
+
+def _energy_to_target(graph: StationGraph, target: int, node_factor: np.ndarray,
+                      consumption: np.ndarray, drivable: np.ndarray) -> np.ndarray:
+    """
+    kWh needed to drive from every node to the target along the shortest
+    connection-distance path that only enters available stations and uses
+    connections one full battery can cover; inf where there is no such path.
+    """
+    n = graph.number_of_nodes()
+    rows = np.repeat(np.arange(n), np.diff(graph.indptr))
+    keep = drivable & np.isfinite(node_factor[graph.indices])
+    # Reverse the kept edges so a single search from the target reaches every node
+    reverse = csr_matrix((consumption[keep], (graph.indices[keep], rows[keep])), shape=(n, n))
+    return csgraph_dijkstra(reverse, directed=True, indices=target)
+
+
+def _trace_plan(graph: StationGraph, labels: Dict, goal: Tuple[int, int],
+                battery_capacity: float, settled: int,
+                minutes_per_km: float, stop_overhead: float) -> EnergyResult:
+    """Rebuild path, distance, charging stops and actual minutes from the label tree."""
+    path = [goal[0]]
+    edges = []
+    stops: List[ChargeStop] = []
+    rate = graph.charging_rate
+    key = goal
+    while True:
+        _, energy, pred, edge = labels[key]
+        if pred is None:
+            break
+        if edge < 0:
+            added = energy - labels[pred][1]
+            stops.append(ChargeStop(pred[0], added, added / rate[pred[0]] * 60))
+        else:
+            edges.append(edge)
+            path.append(pred[0])
+        key = pred
+    path.reverse()
+    stops.reverse()
+    driving = float(graph.weight[edges].sum()) * minutes_per_km
+    charging = sum(stop.minutes + stop_overhead for stop in stops)
+    return EnergyResult(path=path,
+                        distance=float(graph.distance[edges].sum()),
+                        minutes=driving + charging,
+                        arrival_charge=labels[goal][1] / battery_capacity * 100,
+                        stops=stops,
+                        settled=settled,
+                        cost=labels[goal][0])
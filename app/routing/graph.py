@@ -0,0 +1,442 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .geo import haversine
+
+AVAILABLE = 'available'
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_META_FILE = 'graph.json'
+# Array files of a snapshot, mapped to the attribute they restore
+_SNAPSHOT_ARRAYS = {
+    'ids': '_ids', 'lat': '_lat', 'lng': '_lng', 'capacity': '_capacity',
+    'current_load': '_current_load', 'status': '_status', 'charging_rate': '_charging_rate',
+    'edge_u': '_edge_u', 'edge_v': '_edge_v',
+    'edge_distance': '_edge_distance', 'edge_traffic': '_edge_traffic',
+}
+_SNAPSHOT_CSR = ('indptr', 'indices', 'distance', 'traffic', 'weight')
+
+
+class NodeView:
+    """Read-only, networkx-style view over the station nodes of a StationGraph."""
+
+    def __init__(self, graph: 'StationGraph'):
+        self._graph = graph
+
+    def __call__(self) -> 'NodeView':
+        return self
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._graph.ids.tolist())
+
+    def __len__(self) -> int:
+        return self._graph.number_of_nodes()
+
+    def __contains__(self, station_id) -> bool:
+        return station_id in self._graph
+
+    def __getitem__(self, station_id: int) -> Dict:
+        return self._graph.node_attributes(station_id)
+
+
+class StationGraph:
+    """
+    Compact undirected station graph.
+
+    Node attributes live in contiguous NumPy arrays indexed by a dense node
+    index; the station id -> index mapping is the only per-node dict. Edges are
+    appended to flat buffers and compiled lazily into a CSR adjacency
+    (indptr/indices/distance/traffic/weight) the first time a search needs it.
+    """
+
+    _INITIAL_CAPACITY = 64
+
+    def __init__(self):
+        self._index: Dict[int, int] = {}
+        self._names: List[str] = []
+        self._status_names: List[str] = [AVAILABLE]
+        self._status_codes: Dict[str, int] = {AVAILABLE: 0}
+        self._n = 0
+        self._m = 0
+
+        cap = self._INITIAL_CAPACITY
+        self._ids = np.empty(cap, dtype=np.int64)
+        self._lat = np.empty(cap, dtype=np.float64)
+        self._lng = np.empty(cap, dtype=np.float64)
+        self._capacity = np.empty(cap, dtype=np.int32)
+        self._current_load = np.empty(cap, dtype=np.float64)
+        self._status = np.empty(cap, dtype=np.int16)
+        self._charging_rate = np.empty(cap, dtype=np.float64)
+
+        self._edge_u = np.empty(cap, dtype=np.int64)
+        self._edge_v = np.empty(cap, dtype=np.int64)
+        self._edge_distance = np.empty(cap, dtype=np.float64)
+        self._edge_traffic = np.empty(cap, dtype=np.float64)
+
+        self._csr = None
+
+    # ------------------------------------------------------------------
+    # Construction
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _grown(array: np.ndarray, size: int) -> np.ndarray:
+        if size <= len(array):
+            return array
+        new = np.empty(max(size, 2 * len(array)), dtype=array.dtype)
+        new[:len(array)] = array
+        return new
+
+    def _status_code(self, status: str) -> int:
+        code = self._status_codes.get(status)
+        if code is None:
+            code = len(self._status_names)
+            self._status_names.append(status)
+            self._status_codes[status] = code
+        return code
+
+    def add_node(self, station_id: int, name: str, lat: float, lng: float,
+                 capacity: int, current_load: float, status: str,
+                 charging_rate: float):
+        """Add a node, or overwrite the attributes of an existing one."""
+        idx = self._index.get(station_id)
+        if idx is None:
+            idx = self._n
+            size = idx + 1
+            self._ids = self._grown(self._ids, size)
+            self._lat = self._grown(self._lat, size)
+            self._lng = self._grown(self._lng, size)
+            self._capacity = self._grown(self._capacity, size)
+            self._current_load = self._grown(self._current_load, size)
+            self._status = self._grown(self._status, size)
+            self._charging_rate = self._grown(self._charging_rate, size)
+            self._index[station_id] = idx
+            self._names.append(name)
+            self._n = size
+        else:
+            self._names[idx] = name
+        self._csr = None
+
+        self._ids[idx] = station_id
+        self._lat[idx] = lat
+        self._lng[idx] = lng
+        self._capacity[idx] = capacity
+        self._current_load[idx] = current_load
+        self._status[idx] = self._status_code(status)
+        self._charging_rate[idx] = charging_rate
+
+    def add_edge(self, station1_id: int, station2_id: int,
+                 distance: float, traffic_factor: float = 1.0):
+        """Add an undirected edge. Re-adding an edge replaces its attributes."""
+        u = self._index[station1_id]
+        v = self._index[station2_id]
+        size = self._m + 1
+        self._edge_u = self._grown(self._edge_u, size)
+        self._edge_v = self._grown(self._edge_v, size)
+        self._edge_distance = self._grown(self._edge_distance, size)
+        self._edge_traffic = self._grown(self._edge_traffic, size)
+        self._edge_u[self._m] = u
+        self._edge_v[self._m] = v
+        self._edge_distance[self._m] = distance
+        self._edge_traffic[self._m] = traffic_factor
+        self._m = size
+        self._csr = None
+
+    def add_edges(self, u: np.ndarray, v: np.ndarray, distance: np.ndarray,
+                  traffic: Optional[np.ndarray] = None):
+        """Bulk-append undirected edges given as dense node *indices*."""
+        size = self._m + len(u)
+        self._edge_u = self._grown(self._edge_u, size)
+        self._edge_v = self._grown(self._edge_v, size)
+        self._edge_distance = self._grown(self._edge_distance, size)
+        self._edge_traffic = self._grown(self._edge_traffic, size)
+        self._edge_u[self._m:size] = u
+        self._edge_v[self._m:size] = v
+        self._edge_distance[self._m:size] = distance
+        self._edge_traffic[self._m:size] = 1.0 if traffic is None else traffic
+        self._m = size
+        self._csr = None
+
+    def _build_csr(self):
+        n, m = self._n, self._m
+        src = np.concatenate([self._edge_u[:m], self._edge_v[:m]])
+        dst = np.concatenate([self._edge_v[:m], self._edge_u[:m]])
+        distance = np.concatenate([self._edge_distance[:m]] * 2)
+        traffic = np.concatenate([self._edge_traffic[:m]] * 2)
+        order = np.concatenate([np.arange(m)] * 2)
+
+        # Sort by (src, dst, insertion order) and keep the most recent copy of
+        # every directed pair, matching networkx's overwrite-on-re-add.
+        perm = np.lexsort((order, dst, src))
+        src, dst = src[perm], dst[perm]
+        keep = np.ones(len(src), dtype=bool)
+        keep[:-1] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+        perm = perm[keep]
+
+        src = src[keep]
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+        distance = distance[perm]
+        traffic = traffic[perm]
+        self._csr = {
+            'indptr': indptr,
+            'indices': dst[keep],
+            'distance': distance,
+            'traffic': traffic,
+            'weight': distance * traffic,
+        }
+
+    def _weight_per_km(self) -> float:
+        """Smallest edge weight per great-circle km over all edges."""
+        indptr, indices = self._csr['indptr'], self._csr['indices']
+        src = np.repeat(np.arange(self._n), np.diff(indptr))
+        great_circle = haversine(self.lat[src], self.lng[src], self.lat[indices], self.lng[indices])
+        positive = great_circle > 0
+        if not positive.any():
+            return 0.0
+        return float((self._csr['weight'][positive] / great_circle[positive]).min())
+
+    def _csr_array(self, name: str) -> np.ndarray:
+        if self._csr is None:
+            self._build_csr()
+        return self._csr[name]
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+    def save(self, directory: str, metadata: Optional[Dict[str, Any]] = None):
+        """
+        Write the graph to directory as one .npy file per array (node
+        attributes, raw edges and the compiled CSR) plus a JSON header holding
+        names, status names and the caller's metadata.
+
+        The files are written to a fresh directory next to ``directory``, and
+        ``directory`` becomes a symlink to it with a single rename, so a
+        reader opens either the previous snapshot or the new one, never a
+        mix. The previous snapshot is deleted afterwards; processes that
+        already mapped its arrays keep their pages.
+        """
+        parent, name = os.path.split(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        target = tempfile.mkdtemp(prefix=name + '.', dir=parent)
+        os.chmod(target, 0o755)
+        arrays = {}
+        for array_name, attr in _SNAPSHOT_ARRAYS.items():
+            count = self._m if array_name.startswith('edge') else self._n
+            arrays[array_name] = getattr(self, attr)[:count]
+        arrays.update({array_name: self._csr_array(array_name) for array_name in _SNAPSHOT_CSR})
+        arrays['names'] = np.array(self._names, dtype=str)
+        for array_name, array in arrays.items():
+            np.save(os.path.join(target, array_name + '.npy'), array)
+        header = {
+            'format_version': SNAPSHOT_FORMAT_VERSION,
+            'status_names': self._status_names,
+            'metadata': metadata or {},
+        }
+        with open(os.path.join(target, SNAPSHOT_META_FILE), 'w') as f:
+            json.dump(header, f)
+
+        previous = os.path.realpath(directory) if os.path.islink(directory) else None
+        if previous is None and os.path.isdir(directory):
+            # A plain directory cannot be replaced by a rename; move it aside once
+            previous = tempfile.mkdtemp(prefix=name + '.', dir=parent)
+            os.replace(directory, previous)
+        link = target + '.link'
+        os.symlink(os.path.basename(target), link)
+        os.replace(link, directory)
+        if previous is not None:
+            shutil.rmtree(previous, ignore_errors=True)
+
+    @staticmethod
+    def snapshot_metadata(directory: str) -> Optional[Dict[str, Any]]:
+        """Metadata saved with a snapshot, or None if there is no usable one."""
+        try:
+            with open(os.path.join(directory, SNAPSHOT_META_FILE)) as f:
+                header = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if header.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+            return None
+        return header['metadata']
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: Optional[str] = 'c') -> Tuple['StationGraph', Dict[str, Any]]:
+        """
+        Load a graph written by save(). Arrays are memory-mapped copy-on-write
+        by default, so processes share pages until they update a station.
+
+        Returns:
+            Tuple of (graph, metadata passed to save)
+        """
+        # Resolve the snapshot link once, so every file comes from one snapshot
+        directory = os.path.realpath(directory)
+        with open(os.path.join(directory, SNAPSHOT_META_FILE)) as f:
+            header = json.load(f)
+        if header.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported graph snapshot format in {directory}")
+
+        def read(name: str) -> np.ndarray:
+            return np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+
+        graph = cls()
+        for name, attr in _SNAPSHOT_ARRAYS.items():
+            setattr(graph, attr, read(name))
+        graph._csr = {name: read(name) for name in _SNAPSHOT_CSR}
+        graph._n = len(graph._ids)
+        graph._m = len(graph._edge_u)
+        graph._names = read('names').tolist()
+        graph._index = dict(zip(graph._ids.tolist(), range(graph._n)))
+        graph._status_names = header['status_names']
+        graph._status_codes = {status: code for code, status in enumerate(graph._status_names)}
+        return graph, header['metadata']
+
+    # ------------------------------------------------------------------
+    # Array views
+    # ------------------------------------------------------------------
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self._n]
+
+    @property
+    def lat(self) -> np.ndarray:
+        return self._lat[:self._n]
+
+    @property
+    def lng(self) -> np.ndarray:
+        return self._lng[:self._n]
+
+    @property
+    def capacity(self) -> np.ndarray:
+        return self._capacity[:self._n]
+
+    @property
+    def current_load(self) -> np.ndarray:
+        return self._current_load[:self._n]
+
+    @property
+    def charging_rate(self) -> np.ndarray:
+        return self._charging_rate[:self._n]
+
+    @property
+    def status_code(self) -> np.ndarray:
+        return self._status[:self._n]
+
+    @property
+    def available(self) -> np.ndarray:
+        """Boolean mask of nodes whose status is 'available'."""
+        return self.status_code == self._status_codes[AVAILABLE]
+
+    @property
+    def indptr(self) -> np.ndarray:
+        return self._csr_array('indptr')
+
+    @property
+    def indices(self) -> np.ndarray:
+        return self._csr_array('indices')
+
+    @property
+    def distance(self) -> np.ndarray:
+        return self._csr_array('distance')
+
+    @property
+    def traffic(self) -> np.ndarray:
+        return self._csr_array('traffic')
+
+    @property
+    def weight(self) -> np.ndarray:
+        return self._csr_array('weight')
+
+    @property
+    def weight_per_km(self) -> float:
+        """
+        Lower bound on edge weight per km of great-circle distance, so that
+        ``weight_per_km * haversine(u, t)`` never overestimates the remaining
+        weight from u to t. Used to scale A* heuristics.
+        """
+        if self._csr is None:
+            self._build_csr()
+        if 'weight_per_km' not in self._csr:
+            self._csr['weight_per_km'] = self._weight_per_km()
+        return self._csr['weight_per_km']
+
+    def edge_fingerprint(self) -> str:
+        """
+        sha256 of the station ids and the CSR edge set with its distances and
+        weights; precomputed structures store it to detect a different graph.
+        """
+        digest = hashlib.sha256()
+        for array in (self.ids, self.indptr, self.indices, self.distance, self.weight):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()
+
+    def find_edge(self, u: int, v: int) -> int:
+        """CSR position of edge (u, v) between dense node indices, or -1."""
+        indptr = self.indptr
+        lo, hi = indptr[u], indptr[u + 1]
+        # Rows are sorted by neighbour index when the CSR is built
+        pos = lo + int(np.searchsorted(self.indices[lo:hi], v))
+        return pos if pos < hi and self.indices[pos] == v else -1
+
+    def edge_source(self, edge: int) -> int:
+        """Node index owning a CSR edge position."""
+        return int(np.searchsorted(self.indptr, edge, side='right') - 1)
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    @property
+    def nodes(self) -> NodeView:
+        return NodeView(self)
+
+    def __contains__(self, station_id) -> bool:
+        return station_id in self._index
+
+    def __len__(self) -> int:
+        return self._n
+
+    def number_of_nodes(self) -> int:
+        return self._n
+
+    def number_of_edges(self) -> int:
+        return len(self.indices) // 2
+
+    def has_node(self, station_id: int) -> bool:
+        return station_id in self._index
+
+    def index_of(self, station_id: int) -> int:
+        """Dense node index of a station id. Raises KeyError if unknown."""
+        return self._index[station_id]
+
+    def has_edge(self, station1_id: int, station2_id: int) -> bool:
+        u = self._index.get(station1_id)
+        v = self._index.get(station2_id)
+        if u is None or v is None:
+            return False
+        indptr = self.indptr
+        return bool(np.any(self.indices[indptr[u]:indptr[u + 1]] == v))
+
+    def neighbors(self, station_id: int) -> List[int]:
+        u = self._index[station_id]
+        indptr = self.indptr
+        return self.ids[self.indices[indptr[u]:indptr[u + 1]]].tolist()
+
+    def node_attributes(self, station_id: int) -> Dict:
+        """Attribute dict of a node, as plain Python values."""
+        idx = self._index[station_id]
+        return {
+            'name': self._names[idx],
+            'lat': float(self._lat[idx]),
+            'lng': float(self._lng[idx]),
+            'capacity': int(self._capacity[idx]),
+            'current_load': float(self._current_load[idx]),
+            'status': self._status_names[self._status[idx]],
+            'charging_rate': float(self._charging_rate[idx]),
+        }
+
+    def set_status(self, station_id: int, current_load: float, status: str):
+        idx = self._index[station_id]
+        self._current_load[idx] = current_load
+        self._status[idx] = self._status_code(status)
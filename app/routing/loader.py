@@ -0,0 +1,74 @@
+import csv
+import hashlib
+from typing import List, Optional
+
+from .dijkstra import ChargingRouter, Station
+from .graph import StationGraph
+
+
+def read_stations_csv(csv_path: str) -> List[Station]:
+    """Parse the state station export into Station records with ids 1..N."""
+    stations = []
+    with open(csv_path, newline='', encoding='utf-8') as csvfile:
+        reader = csv.DictReader(csvfile)
+        station_id = 1
+        for row in reader:
+            # Parse coordinates from 'New Georeferenced Column'
+            try:
+                point = row['New Georeferenced Column']
+                lng, lat = point.replace('POINT (', '').replace(')', '').split()
+                lat, lng = float(lat), float(lng)
+            except Exception:
+                continue  # skip if coordinates are invalid
+
+            name = row['Station Name']
+            # Use Level 2 chargers as capacity, fallback to 1 if NONE
+            capacity = int(row['EV Level2 EVSE Num']) if row['EV Level2 EVSE Num'] != 'NONE' and row['EV Level2 EVSE Num'].isdigit() else 1
+            current_load = 0.0  # Assume empty for now
+            status = 'available'
+            charging_rate = 50  # Default value
+
+            stations.append(Station(
+                station_id, name, lat, lng, capacity, current_load, status, charging_rate
+            ))
+            station_id += 1
+    return stations
+
+
+def load_stations_from_csv(router: ChargingRouter, csv_path: str,
+                           k: Optional[int] = 6, radius_km: Optional[float] = None):
+    """Add every station in the CSV to the router and connect geographic neighbours."""
+    for station in read_stations_csv(csv_path):
+        router.add_station(station)
+
+    # Connect each station to its geographic neighbours
+    router.connect_nearest_stations(k=k, radius_km=radius_km)
+
+
+def file_checksum(path: str) -> str:
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_stations(router: ChargingRouter, csv_path: str, snapshot_dir: str,
+                  k: Optional[int] = 6, radius_km: Optional[float] = None) -> bool:
+    """
+    Load the station graph from the binary snapshot in snapshot_dir if it was
+    built from this exact CSV with the same neighbour settings; otherwise
+    parse the CSV and write a fresh snapshot.
+    
+    Returns:
+        True if the snapshot was used, False if the CSV was parsed
+    """
+    metadata = {'csv_sha256': file_checksum(csv_path), 'k': k, 'radius_km': radius_km}
+    if StationGraph.snapshot_metadata(snapshot_dir) == metadata:
+        router.load_snapshot(snapshot_dir)
+        return True
+    
+    load_stations_from_csv(router, csv_path, k=k, radius_km=radius_km)
+    router.save_snapshot(snapshot_dir, metadata)
+    return False
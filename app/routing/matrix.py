@@ -0,0 +1,100 @@
+import json
+import os
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
+from typing import Dict, Iterable, Optional
+
+from .geo import haversine
+from .graph import StationGraph
+
+IDS_FILE = 'station_ids.npy'
+ROAD_FILE = 'road_distance.npy'
+GREAT_CIRCLE_FILE = 'great_circle.npy'
+META_FILE = 'matrix.json'
+
+
+def compute_distance_matrices(graph: StationGraph, directory: str, block_size: int = 256,
+                              k: Optional[int] = None, radius_km: Optional[float] = None):
+    """
+    Write the all-pairs road distance and great-circle distance matrices of a
+    graph to ``directory`` as float32 .npy files.
+
+    Rows are computed a block of sources at a time (multi-source Dijkstra in
+    scipy's compiled csgraph for road distance, broadcast haversine for great
+    circle) and written straight into memory-mapped output, so peak memory is
+    one block rather than the full N x N matrix. Road distance is the length
+    of the shortest path by connection distance; unreachable pairs are inf.
+    The neighbour settings the graph was built with (k, radius_km) and its
+    edge fingerprint are saved alongside, for DistanceMatrix.matches.
+    """
+    os.makedirs(directory, exist_ok=True)
+    n = graph.number_of_nodes()
+    adjacency = csr_matrix((graph.distance, graph.indices, graph.indptr), shape=(n, n))
+    lat, lng = graph.lat, graph.lng
+
+    # Write to temporary files and rename at the end, so processes that have
+    # the previous matrices mapped never see a truncated file
+    paths = {name: os.path.join(directory, name) for name in (ROAD_FILE, GREAT_CIRCLE_FILE)}
+    road = np.lib.format.open_memmap(paths[ROAD_FILE] + '.tmp',
+                                     mode='w+', dtype=np.float32, shape=(n, n))
+    great_circle = np.lib.format.open_memmap(paths[GREAT_CIRCLE_FILE] + '.tmp',
+                                             mode='w+', dtype=np.float32, shape=(n, n))
+    for start in range(0, n, block_size):
+        rows = np.arange(start, min(start + block_size, n))
+        road[rows] = csgraph_dijkstra(adjacency, directed=False, indices=rows)
+        great_circle[rows] = haversine(lat[rows, None], lng[rows, None], lat[None, :], lng[None, :])
+    road.flush()
+    great_circle.flush()
+    del road, great_circle
+
+    meta_path = os.path.join(directory, META_FILE)
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump({'k': k, 'radius_km': radius_km, 'edges_sha256': graph.edge_fingerprint()}, f)
+    ids_path = os.path.join(directory, IDS_FILE)
+    np.save(ids_path + '.tmp.npy', graph.ids)
+    for path in paths.values():
+        os.replace(path + '.tmp', path)
+    os.replace(meta_path + '.tmp', meta_path)
+    os.replace(ids_path + '.tmp.npy', ids_path)
+
+
+class DistanceMatrix:
+    """
+    Read-only, memory-mapped station distance matrices written by
+    compute_distance_matrices. Every process mapping the same files shares
+    their pages, and a lookup is a single array index.
+    """
+
+    def __init__(self, directory: str):
+        self.ids = np.load(os.path.join(directory, IDS_FILE))
+        self.road = np.load(os.path.join(directory, ROAD_FILE), mmap_mode='r')
+        self.great_circle = np.load(os.path.join(directory, GREAT_CIRCLE_FILE), mmap_mode='r')
+        self._index: Dict[int, int] = {int(station_id): i for i, station_id in enumerate(self.ids)}
+        meta_path = os.path.join(directory, META_FILE)
+        self.metadata: Dict = {}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.metadata = json.load(f)
+
+    def matches(self, graph: StationGraph, k: Optional[int] = None,
+                radius_km: Optional[float] = None) -> bool:
+        """
+        Whether the matrices were computed for this graph's stations and
+        edges, built with the same neighbour settings. Matrices saved
+        without metadata never match.
+        """
+        return (np.array_equal(self.ids, graph.ids)
+                and self.metadata.get('k', -1) == k
+                and self.metadata.get('radius_km', -1) == radius_km
+                and self.metadata.get('edges_sha256') == graph.edge_fingerprint())
+
+    def index_of(self, station_ids: Iterable[int]) -> np.ndarray:
+        return np.array([self._index[station_id] for station_id in station_ids], dtype=np.int64)
+
+    def road_distance(self, station1_id: int, station2_id: int) -> float:
+        """Shortest road distance in km, inf if unreachable."""
+        return float(self.road[self._index[station1_id], self._index[station2_id]])
+
+    def great_circle_distance(self, station1_id: int, station2_id: int) -> float:
+        return float(self.great_circle[self._index[station1_id], self._index[station2_id]])
@@ -0,0 +1,359 @@
+import heapq
+import numpy as np
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from .geo import haversine
+from .graph import StationGraph
+
+INF = float('inf')
+MINUTES_PER_KM = 2.0  # driving time estimate used for arrival times
+
+
+@dataclass
+class SearchResult:
+    path: List[int]  # dense node indices, empty if unreachable
+    distance: float  # sum of edge distances along the path
+    cost: float  # sum of edge weights, i.e. the minimized objective
+    settled: int  # nodes permanently labelled by the search
+
+
+def _unreachable(settled: int) -> SearchResult:
+    return SearchResult([], INF, INF, settled)
+
+
+def _walk(graph: StationGraph, pred_edge: np.ndarray,
+          node: int, stop: int) -> Tuple[List[int], List[int]]:
+    """Follow predecessor edges from node to stop; returns (nodes, edges)."""
+    nodes = [node]
+    edges = []
+    while node != stop:
+        e = int(pred_edge[node])
+        edges.append(e)
+        node = graph.edge_source(e)
+        nodes.append(node)
+    return nodes, edges
+
+
+def heuristic_scale(graph: StationGraph, node_factor: np.ndarray) -> float:
+    """Largest factor k such that k * great-circle km is an admissible bound."""
+    finite = node_factor[np.isfinite(node_factor)]
+    if not len(finite):
+        return 0.0
+    return max(0.0, graph.weight_per_km * float(finite.min()))
+
+
+def distance_bound(graph: StationGraph, node: int,
+                   scale: float) -> Callable[[np.ndarray], np.ndarray]:
+    """Vectorized admissible lower bound on the remaining cost to node."""
+    lat, lng = graph.lat, graph.lng
+    lat_t, lng_t = lat[node], lng[node]
+
+    def bound(nodes: np.ndarray) -> np.ndarray:
+        return scale * haversine(lat[nodes], lng[nodes], lat_t, lng_t)
+    return bound
+
+
+def shortest_path_tree(graph: StationGraph,
+                       source: int,
+                       node_factor: np.ndarray,
+                       max_edge_distance: float = INF,
+                       targets: Optional[Iterable[int]] = None,
+                       heuristic: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+                       max_settled: Optional[int] = None
+                       ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+    """
+    Heap-based Dijkstra (or A* when a heuristic is given) over the CSR arrays
+    of a StationGraph.
+
+    The cost of edge (u, v) is ``weight[e] * node_factor[v]``; a node factor of
+    inf makes the node unreachable, and edges longer than ``max_edge_distance``
+    are skipped. The search stops early once every node in targets is settled,
+    or once max_settled nodes are; targets not settled by then are unreachable.
+
+    Returns:
+        Tuple of (dist, pred_edge, settled mask, settled count), all indexed
+        by dense node index
+    """
+    n = graph.number_of_nodes()
+    indptr = graph.indptr
+    indices = graph.indices
+    weight = graph.weight
+    distance = graph.distance
+    check_range = max_edge_distance < INF
+    remaining = None if targets is None else set(targets)
+
+    dist = np.full(n, np.inf)
+    pred_edge = np.full(n, -1, dtype=np.int64)
+    settled = np.zeros(n, dtype=bool)
+    count = 0
+    dist[source] = 0.0
+    heap = [(0.0, source)]
+
+    while heap:
+        _, u = heapq.heappop(heap)
+        if settled[u]:
+            continue
+        settled[u] = True
+        count += 1
+        if remaining is not None:
+            remaining.discard(u)
+            if not remaining:
+                break
+        if max_settled is not None and count >= max_settled:
+            break
+
+        lo, hi = indptr[u], indptr[u + 1]
+        if lo == hi:
+            continue
+        nbrs = indices[lo:hi]
+        cand = dist[u] + weight[lo:hi] * node_factor[nbrs]
+        if check_range:
+            cand[distance[lo:hi] > max_edge_distance] = np.inf
+        improved = np.flatnonzero(cand < dist[nbrs])
+        if not len(improved):
+            continue
+
+        vs = nbrs[improved]
+        costs = cand[improved]
+        dist[vs] = costs
+        pred_edge[vs] = lo + improved
+        keys = costs if heuristic is None else costs + heuristic(vs)
+        for key, v in zip(keys.tolist(), vs.tolist()):
+            heapq.heappush(heap, (key, v))
+
+    return dist, pred_edge, settled, count
+
+
+def tree_path(graph: StationGraph, dist: np.ndarray, pred_edge: np.ndarray,
+              settled: np.ndarray, source: int, target: int,
+              count: int) -> SearchResult:
+    """Extract the source -> target path from a shortest path tree."""
+    if not settled[target]:
+        return _unreachable(count)
+    nodes, edges = _walk(graph, pred_edge, target, source)
+    nodes.reverse()
+    return SearchResult(nodes, float(graph.distance[edges].sum()), float(dist[target]), count)
+
+
+def dijkstra(graph: StationGraph,
+             source: int,
+             target: int,
+             node_factor: np.ndarray,
+             max_edge_distance: float = INF,
+             heuristic: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+             max_settled: Optional[int] = None) -> SearchResult:
+    """Point-to-point Dijkstra, or A* when a heuristic is given."""
+    tree = shortest_path_tree(graph, source, node_factor, max_edge_distance,
+                              targets=[target], heuristic=heuristic, max_settled=max_settled)
+    return tree_path(graph, *tree[:3], source, target, tree[3])
+
+
+def one_to_many(graph: StationGraph,
+                source: int,
+                targets: List[int],
+                node_factor: np.ndarray,
+                max_edge_distance: float = INF) -> List[SearchResult]:
+    """
+    Routes from one source to many targets out of a single Dijkstra tree,
+    which stops once the last target is settled. Results are aligned with
+    targets; ``settled`` is the size of the shared tree.
+    """
+    tree = shortest_path_tree(graph, source, node_factor, max_edge_distance,
+                              targets=targets)
+    return [tree_path(graph, *tree[:3], source, target, tree[3]) for target in targets]
+
+
+def astar(graph: StationGraph,
+          source: int,
+          target: int,
+          node_factor: np.ndarray,
+          max_edge_distance: float = INF,
+          max_settled: Optional[int] = None) -> SearchResult:
+    """
+    A* with a scaled haversine lower bound towards the target; gives up
+    (unreachable) after settling max_settled nodes.
+    """
+    scale = heuristic_scale(graph, node_factor)
+    return dijkstra(graph, source, target, node_factor, max_edge_distance,
+                    heuristic=distance_bound(graph, target, scale), max_settled=max_settled)
+
+
+def bidirectional(graph: StationGraph,
+                  source: int,
+                  target: int,
+                  node_factor: np.ndarray,
+                  max_edge_distance: float = INF,
+                  use_heuristic: bool = False) -> SearchResult:
+    """
+    Bidirectional Dijkstra, or bidirectional A* with the average potential
+    ``p(v) = (h_t(v) - h_s(v)) / 2`` when use_heuristic is set.
+
+    The forward search charges ``node_factor`` of the node it enters; the
+    backward search charges the factor of the node it leaves, so both
+    directions price an edge identically. The search stops once the two
+    smallest queue keys together reach the best meeting cost.
+    """
+    if source == target:
+        return SearchResult([source], 0.0, 0.0, 1)
+
+    n = graph.number_of_nodes()
+    indptr = graph.indptr
+    indices = graph.indices
+    weight = graph.weight
+    distance = graph.distance
+    check_range = max_edge_distance < INF
+
+    if use_heuristic:
+        scale = heuristic_scale(graph, node_factor)
+        to_target = distance_bound(graph, target, scale)
+        to_source = distance_bound(graph, source, scale)
+
+        def potential(nodes):
+            return (to_target(nodes) - to_source(nodes)) / 2
+    else:
+        def potential(nodes):
+            return np.zeros(len(nodes))
+
+    # index 0 is the forward search from source, 1 the backward one from target
+    dist = (np.full(n, np.inf), np.full(n, np.inf))
+    pred_edge = (np.full(n, -1, dtype=np.int64), np.full(n, -1, dtype=np.int64))
+    settled = (np.zeros(n, dtype=bool), np.zeros(n, dtype=bool))
+    sign = (1.0, -1.0)
+    dist[0][source] = 0.0
+    dist[1][target] = 0.0
+    ends = np.array([source, target])
+    start_keys = potential(ends) * sign
+    heaps = ([(float(start_keys[0]), source)], [(float(start_keys[1]), target)])
+
+    best = INF
+    meeting = None  # (last forward node, first backward node, edge)
+    count = 0
+
+    while heaps[0] and heaps[1]:
+        if heaps[0][0][0] + heaps[1][0][0] >= best:
+            break
+        side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+        _, u = heapq.heappop(heaps[side])
+        if settled[side][u]:
+            continue
+        settled[side][u] = True
+        count += 1
+
+        lo, hi = indptr[u], indptr[u + 1]
+        if lo == hi:
+            continue
+        nbrs = indices[lo:hi]
+        if side == 0:
+            cost = weight[lo:hi] * node_factor[nbrs]
+        else:
+            cost = weight[lo:hi] * node_factor[u]
+        cand = dist[side][u] + cost
+        if check_range:
+            cand[distance[lo:hi] > max_edge_distance] = np.inf
+
+        total = cand + dist[1 - side][nbrs]
+        k = int(np.argmin(total))
+        if total[k] < best:
+            best = float(total[k])
+            v = int(nbrs[k])
+            meeting = (u, v, lo + k) if side == 0 else (v, u, lo + k)
+
+        improved = np.flatnonzero(cand < dist[side][nbrs])
+        if not len(improved):
+            continue
+        vs = nbrs[improved]
+        costs = cand[improved]
+        dist[side][vs] = costs
+        pred_edge[side][vs] = lo + improved
+        keys = costs + sign[side] * potential(vs)
+        for key, v in zip(keys.tolist(), vs.tolist()):
+            heapq.heappush(heaps[side], (key, v))
+
+    if meeting is None:
+        return _unreachable(count)
+
+    last_forward, first_backward, edge = meeting
+    head, head_edges = _walk(graph, pred_edge[0], last_forward, source)
+    tail, tail_edges = _walk(graph, pred_edge[1], first_backward, target)
+    head.reverse()
+    edges = head_edges + [edge] + tail_edges
+    return SearchResult(head + tail, float(distance[edges].sum()), best, count)
+
+
+def time_dependent(graph: StationGraph,
+                   source: int,
+                   target: int,
+                   load_profiles: np.ndarray,
+                   start_minute: float = 0.0,
+                   max_edge_distance: float = INF,
+                   minutes_per_km: float = MINUTES_PER_KM,
+                   bucket_minutes: float = 60.0) -> Tuple[SearchResult, List[float]]:
+    """
+    Dijkstra where the load penalty of entering v depends on when v is reached.
+
+    ``load_profiles[v, b]`` is the predicted load of node v during time bucket
+    b of the query window, and the departure is ``start_minute`` minutes into
+    bucket 0. Arrival times follow driving time (``weight * minutes_per_km``)
+    along the tree path; arrivals past the last bucket use the last bucket.
+    The cost of edge (u, v) is ``weight[e] * (1 + load_profiles[v, bucket])``,
+    and unavailable nodes are unreachable, as in the static search.
+
+    Each node keeps a single label, so with loads that change over the window
+    this is the standard time-dependent approximation rather than a
+    cost/time Pareto search.
+
+    Returns:
+        Tuple of (result, arrival minute after departure at each path node)
+    """
+    n = graph.number_of_nodes()
+    indptr = graph.indptr
+    indices = graph.indices
+    weight = graph.weight
+    distance = graph.distance
+    blocked = ~graph.available
+    last_bucket = load_profiles.shape[1] - 1
+    check_range = max_edge_distance < INF
+
+    dist = np.full(n, np.inf)
+    arrival = np.full(n, np.inf)
+    pred_edge = np.full(n, -1, dtype=np.int64)
+    settled = np.zeros(n, dtype=bool)
+    count = 0
+    dist[source] = 0.0
+    arrival[source] = 0.0
+    heap = [(0.0, source)]
+
+    while heap:
+        _, u = heapq.heappop(heap)
+        if settled[u]:
+            continue
+        settled[u] = True
+        count += 1
+        if u == target:
+            break
+
+        lo, hi = indptr[u], indptr[u + 1]
+        if lo == hi:
+            continue
+        nbrs = indices[lo:hi]
+        reach = arrival[u] + weight[lo:hi] * minutes_per_km
+        buckets = np.minimum(((start_minute + reach) // bucket_minutes).astype(np.int64), last_bucket)
+        cand = dist[u] + weight[lo:hi] * (1 + load_profiles[nbrs, buckets])
+        cand[blocked[nbrs]] = np.inf
+        if check_range:
+            cand[distance[lo:hi] > max_edge_distance] = np.inf
+        improved = np.flatnonzero(cand < dist[nbrs])
+        if not len(improved):
+            continue
+
+        vs = nbrs[improved]
+        costs = cand[improved]
+        dist[vs] = costs
+        arrival[vs] = reach[improved]
+        pred_edge[vs] = lo + improved
+        for cost, v in zip(costs.tolist(), vs.tolist()):
+            heapq.heappush(heap, (cost, v))
+
+    result = tree_path(graph, dist, pred_edge, settled, source, target, count)
+    return result, arrival[result.path].tolist()
@@ -1,7 +1,8 @@
 import networkx as nx
-from typing import Tuple, List, Optional
+from typing import Dict, Tuple, List, Optional
 import numpy as np
 from ..models import Station
+from .traffic import TrafficService, traffic_score
 
 def calculate_distance(point1: Tuple[float, float], point2: Tuple[float, float]) -> float:
     """Calculate Haversine distance between two points"""
@@ -28,18 +29,71 @@ def calculate_detour_score(source: Tuple[float, float],
     
     return via_station_distance - direct_distance
 
-def calculate_station_score(station: Station,
-                          source: Tuple[float, float],
-                          destination: Tuple[float, float],
-                          gmaps_client) -> float:
-    """Calculate overall score for a station based on multiple factors"""
-    station_coords = (station.latitude, station.longitude)
+KM_PER_DEGREE = 6371 * np.pi / 180  # along a meridian
+
+def corridor_bounds(source: Tuple[float, float],
+                    destination: Tuple[float, float],
+                    max_detour: float) -> Tuple[float, float, float, float]:
+    """
+    Bounding box (min_lat, max_lat, min_lng, max_lng) of every point whose
+    detour between source and destination is at most max_detour km.
     
-    # Calculate base scores
-    detour_score = calculate_detour_score(source, destination, station_coords)
-    availability_score = station.current_availability / station.capacity
+    Such points lie within direct + max_detour/2 km of both endpoints (the far
+    vertex of the detour ellipse), so the box is the intersection of the
+    boxes around those two circles.
+    """
+    radius = calculate_distance(source, destination) + max_detour / 2
+    boxes = []
+    for lat, lng in (source, destination):
+        dlat = radius / KM_PER_DEGREE
+        max_abs_lat = abs(lat) + dlat
+        if max_abs_lat >= 90:
+            dlng = 180.0  # box reaches a pole, so every longitude is in range
+        else:
+            dlng = min(180.0, dlat / np.cos(np.radians(max_abs_lat)))
+        boxes.append((lat - dlat, lat + dlat, lng - dlng, lng + dlng))
     
-    # Get real-time traffic data if available
+    min_lat = max(-90.0, max(box[0] for box in boxes))
+    max_lat = min(90.0, min(box[1] for box in boxes))
+    if any(box[2] < -180 or box[3] > 180 for box in boxes):
+        # A box wraps around the antimeridian, so the longitude ranges
+        # cannot be intersected as plain intervals
+        min_lng, max_lng = -180.0, 180.0
+    else:
+        min_lng = max(box[2] for box in boxes)
+        max_lng = min(box[3] for box in boxes)
+    return float(min_lat), float(max_lat), float(min_lng), float(max_lng)
+
+def corridor_filter(stations: List[Station],
+                    source: Tuple[float, float],
+                    destination: Tuple[float, float],
+                    max_detour: float) -> Tuple[List[Station], int]:
+    """
+    Keep the stations inside the detour ellipse around the trip, i.e. those
+    whose detour score is at most max_detour km.
+    
+    Returns:
+        Tuple of (stations kept, number of stations pruned)
+    """
+    if not stations:
+        return [], 0
+    lats = np.array([station.latitude for station in stations], dtype=np.float64)
+    lngs = np.array([station.longitude for station in stations], dtype=np.float64)
+    detours = (calculate_distance(source, (lats, lngs)) +
+               calculate_distance((lats, lngs), destination) -
+               calculate_distance(source, destination))
+    kept = [stations[i] for i in np.flatnonzero(detours <= max_detour)]
+    return kept, len(stations) - len(kept)
+
+# Weights for different factors
+DETOUR_WEIGHT = 0.4
+AVAILABILITY_WEIGHT = 0.3
+TRAFFIC_WEIGHT = 0.3
+
+def get_traffic_score(source: Tuple[float, float],
+                      station: Station,
+                      gmaps_client) -> float:
+    """Real-time traffic score (0-1, higher is faster) for driving to a station"""
     try:
         # Get driving time to station
         matrix = gmaps_client.distance_matrix(
@@ -50,17 +104,25 @@ def calculate_station_score(station: Station,
         )
         
         if matrix['rows'][0]['elements'][0]['status'] == 'OK':
-            duration_in_traffic = matrix['rows'][0]['elements'][0]['duration_in_traffic']['value']
-            traffic_score = 1 / (1 + duration_in_traffic/3600)  # Normalize to 0-1 range
-        else:
-            traffic_score = 1.0
+            return traffic_score(matrix['rows'][0]['elements'][0]['duration_in_traffic']['value'])
+        return 1.0
     except Exception:
-        traffic_score = 1.0
+        return 1.0
+
+def calculate_station_score(station: Station,
+                          source: Tuple[float, float],
+                          destination: Tuple[float, float],
+                          gmaps_client) -> float:
+    """Calculate overall score for a station based on multiple factors"""
+    station_coords = (station.latitude, station.longitude)
     
-    # Weights for different factors
-    DETOUR_WEIGHT = 0.4
-    AVAILABILITY_WEIGHT = 0.3
-    TRAFFIC_WEIGHT = 0.3
+    # Calculate base scores
+    detour_score = calculate_detour_score(source, destination, station_coords)
+    # A station without chargers counts as fully occupied
+    availability_score = station.current_availability / station.capacity if station.capacity else 0.0
+    
+    # Get real-time traffic data if available
+    traffic_score = get_traffic_score(source, station, gmaps_client)
     
     # Calculate final score (lower is better)
     final_score = (
@@ -71,19 +133,89 @@ def calculate_station_score(station: Station,
     
     return final_score
 
+def calculate_score_components(stations: List[Station],
+                               source: Tuple[float, float],
+                               destination: Tuple[float, float],
+                               traffic: TrafficService,
+                               deadline: Optional[float] = None) -> Dict[str, np.ndarray]:
+    """
+    Detour, availability and traffic terms and the combined score of many
+    stations at once, as arrays aligned with stations. The score equals
+    calculate_station_score for each station; traffic durations come from the
+    cached, batched traffic service, and lookups not finished by deadline
+    (time.monotonic()) score 1.0.
+    """
+    lats = np.array([station.latitude for station in stations], dtype=np.float64)
+    lngs = np.array([station.longitude for station in stations], dtype=np.float64)
+    available = np.array([station.current_availability for station in stations], dtype=np.float64)
+    capacity = np.array([station.capacity for station in stations], dtype=np.float64)
+    
+    # calculate_distance broadcasts over coordinate arrays
+    detour_scores = (calculate_distance(source, (lats, lngs)) +
+                     calculate_distance((lats, lngs), destination) -
+                     calculate_distance(source, destination))
+    availability_scores = np.divide(available, capacity, out=np.zeros(len(stations)),
+                                    where=capacity > 0)
+    traffic_scores = traffic.scores(source, stations, deadline)
+    
+    return {
+        'detour': detour_scores,
+        'availability': availability_scores,
+        'traffic': traffic_scores,
+        'score': (
+            DETOUR_WEIGHT * detour_scores +
+            AVAILABILITY_WEIGHT * (1 - availability_scores) +
+            TRAFFIC_WEIGHT * (1 - traffic_scores)
+        )
+    }
+
+def calculate_station_scores(stations: List[Station],
+                             source: Tuple[float, float],
+                             destination: Tuple[float, float],
+                             traffic: TrafficService,
+                             deadline: Optional[float] = None) -> np.ndarray:
+    """Scores of many stations at once (see calculate_score_components)"""
+    return calculate_score_components(stations, source, destination, traffic, deadline)['score']
+
+def find_top_stations(source: Tuple[float, float],
+                      destination: Tuple[float, float],
+                      stations: List[Station],
+                      traffic: TrafficService,
+                      limit: int = 1,
+                      deadline: Optional[float] = None) -> List[Tuple[Station, Dict[str, float]]]:
+    """
+    The limit best stations, best first, each with its component scores.
+    
+    Only the best limit are selected (argpartition) and sorted; ties are
+    broken by position in stations, so the first entry is the station
+    find_optimal_station returns.
+    """
+    if not stations or limit < 1:
+        return []
+    
+    components = calculate_score_components(stations, source, destination, traffic, deadline)
+    scores = components['score']
+    if limit < len(stations):
+        best = np.argpartition(scores, limit - 1)[:limit]
+        # Keep every station tied with the cut-off score so ties resolve by position
+        best = np.union1d(best, np.flatnonzero(scores == scores[best].max()))
+    else:
+        best = np.arange(len(stations))
+    best = best[np.lexsort((best, scores[best]))][:limit]
+    
+    return [(stations[i], {name: float(values[i]) for name, values in components.items()})
+            for i in best.tolist()]
+
 def find_optimal_station(source: Tuple[float, float],
                         destination: Tuple[float, float],
                         stations: List[Station],
-                        gmaps_client) -> Optional[Station]:
+                        traffic: TrafficService,
+                        deadline: Optional[float] = None) -> Optional[Station]:
     """Find the optimal charging station based on multiple factors"""
     if not stations:
         return None
     
-    # Calculate scores for each station
-    station_scores = [
-        (station, calculate_station_score(station, source, destination, gmaps_client))
-        for station in stations
-    ]
-    
-    # Sort by score (lower is better) and return the best station
-    return min(station_scores, key=lambda x: x[1])[0] 
\ No newline at end of file
+    # Score every station in one pass and return the best (lower is better);
+    # argmin keeps the first station on ties, like min()
+    station_scores = calculate_station_scores(stations, source, destination, traffic, deadline)
+    return stations[int(np.argmin(station_scores))]
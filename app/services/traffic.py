@@ -0,0 +1,192 @@
+import time
+from abc import ABC, abstractmethod
+import numpy as np
+from concurrent.futures import Executor, wait
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from ..routing.cache import TTLCache
+from ..routing.geo import haversine
+
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+MAX_DESTINATIONS = 25  # Distance Matrix API limit per request
+BUCKET_SECONDS = 15 * 60
+
+def geohash(lat: float, lng: float, precision: int = 6) -> str:
+    """Standard base32 geohash; precision 6 is a cell of about 1.2 x 0.6 km"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        mid = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= mid:
+            value |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+def traffic_score(duration: Optional[float]) -> float:
+    """Score in 0-1 from driving seconds in traffic; unknown durations score 1.0"""
+    if duration is None:
+        return 1.0
+    return 1 / (1 + duration/3600)  # Normalize to 0-1 range
+
+class TrafficProvider(ABC):
+    """Source of driving durations in traffic from one origin to many points"""
+
+    # Largest number of destinations a single durations() call may receive
+    max_destinations = MAX_DESTINATIONS
+
+    @abstractmethod
+    def durations(self,
+                  origin: Tuple[float, float],
+                  destinations: Sequence[Tuple[float, float]]) -> List[Optional[float]]:
+        """Seconds in traffic to each destination, None where unknown"""
+
+class GoogleMapsTrafficProvider(TrafficProvider):
+    """Durations from the Google Maps Distance Matrix API, many destinations per call"""
+
+    def __init__(self, gmaps_client):
+        self.gmaps_client = gmaps_client
+
+    def durations(self, origin, destinations):
+        try:
+            matrix = self.gmaps_client.distance_matrix(
+                origins=[f"{origin[0]},{origin[1]}"],
+                destinations=[f"{lat},{lng}" for lat, lng in destinations],
+                mode="driving",
+                departure_time="now"
+            )
+            elements = matrix['rows'][0]['elements']
+        except Exception:
+            return [None] * len(destinations)
+
+        results = [None] * len(destinations)
+        for i, element in enumerate(elements[:len(destinations)]):
+            if element.get('status') == 'OK' and 'duration_in_traffic' in element:
+                results[i] = float(element['duration_in_traffic']['value'])
+        return results
+
+class StubTrafficProvider(TrafficProvider):
+    """
+    Offline provider for tests and benchmarks: great-circle distance at a fixed
+    speed, with an optional simulated round trip per call.
+    """
+
+    def __init__(self, speed_kmh: float = 50.0, latency: float = 0.0):
+        self.speed_kmh = speed_kmh
+        self.latency = latency
+        self.calls = 0
+
+    def durations(self, origin, destinations):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        lats = np.array([lat for lat, _ in destinations], dtype=np.float64)
+        lngs = np.array([lng for _, lng in destinations], dtype=np.float64)
+        km = haversine(origin[0], origin[1], lats, lngs)
+        return (km / self.speed_kmh * 3600).tolist()
+
+class TrafficService:
+    """
+    Cached, batched traffic scores for charging station candidates.
+
+    Durations are cached per (origin geohash, station id, 15-minute bucket) in
+    a size-bounded TTL cache, so nearby origins within the same quarter hour
+    share lookups. Misses are sent to the provider in batches of up to
+    ``provider.max_destinations`` stations; with an executor the batches run
+    concurrently and a lookup can be cut off at a deadline.
+    """
+
+    def __init__(self, provider: TrafficProvider, maxsize: int = 50000,
+                 ttl: float = BUCKET_SECONDS, precision: int = 6,
+                 clock: Callable[[], float] = time.time,
+                 executor: Optional[Executor] = None):
+        self.provider = provider
+        self.precision = precision
+        self._clock = clock
+        self.executor = executor
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.timeouts = 0
+
+    def _keys(self, origin: Tuple[float, float], stations) -> List[Tuple]:
+        cell = geohash(origin[0], origin[1], self.precision)
+        bucket = int(self._clock() // BUCKET_SECONDS)
+        return [(cell, station.id, bucket) for station in stations]
+
+    def _fetch(self, origin: Tuple[float, float], points: List[Tuple[float, float]],
+               keys: List[Tuple]) -> List[Optional[float]]:
+        durations = self.provider.durations(origin, points)
+        # Failed lookups are retried on the next request
+        for key, duration in zip(keys, durations):
+            if duration is not None:
+                self.cache.put(key, duration)
+        return durations
+
+    def durations(self, origin: Tuple[float, float], stations,
+                  deadline: Optional[float] = None) -> List[Optional[float]]:
+        """
+        Seconds in traffic from origin to every station, None where unknown.
+
+        deadline is a time.monotonic() value; batches not back by then are
+        left as None. Batches that have not started are cancelled, so a
+        backlog of late requests does not hold up the pool; running ones
+        finish and fill the cache for later requests. It only applies when
+        the service has an executor.
+        """
+        keys = self._keys(origin, stations)
+        results: List[Optional[float]] = [None] * len(stations)
+        missing = []
+        for i, key in enumerate(keys):
+            cached = self.cache.get(key)
+            if cached is None:
+                missing.append(i)
+            else:
+                results[i] = cached
+
+        batch_size = self.provider.max_destinations
+        batches = [missing[start:start + batch_size] for start in range(0, len(missing), batch_size)]
+        jobs = [(batch,
+                 origin,
+                 [(stations[i].latitude, stations[i].longitude) for i in batch],
+                 [keys[i] for i in batch])
+                for batch in batches]
+
+        if self.executor is None:
+            for batch, *args in jobs:
+                for i, duration in zip(batch, self._fetch(*args)):
+                    results[i] = duration
+            return results
+
+        futures = {self.executor.submit(self._fetch, *args): batch for batch, *args in jobs}
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        done, pending = wait(futures, timeout=timeout)
+        self.timeouts += len(pending)
+        for future in pending:
+            future.cancel()
+        for future in done:
+            try:
+                durations = future.result()
+            except Exception:
+                continue
+            for i, duration in zip(futures[future], durations):
+                results[i] = duration
+        return results
+
+    def scores(self, origin: Tuple[float, float], stations,
+               deadline: Optional[float] = None) -> np.ndarray:
+        """traffic_score for every station, as an array aligned with stations"""
+        return np.array([traffic_score(duration)
+                         for duration in self.durations(origin, stations, deadline)],
+                        dtype=np.float64)
@@ -0,0 +1,62 @@
+"""Compare load model inference backends. Run from app/: python -m utils.benchmark_load_model"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from ml.load_predictor import BACKENDS, LoadPredictor
+
+
+def build_history(num_stations: int, days: int, seed: int = 42) -> pd.DataFrame:
+    """Hourly random loads for every station."""
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range('2024-01-01', periods=24 * days, freq='h')
+    return pd.DataFrame({
+        'station_id': np.repeat(np.arange(num_stations), len(timestamps)),
+        'timestamp': np.tile(timestamps, num_stations),
+        'load': rng.uniform(0, 1, num_stations * len(timestamps))
+    })
+
+
+def benchmark(predictor: LoadPredictor, history: pd.DataFrame, batch: int, repeats: int):
+    rng = np.random.default_rng(0)
+    station_ids = rng.choice(history['station_id'].unique(), size=batch)
+    timestamps = pd.Timestamp('2024-03-01') + pd.to_timedelta(rng.integers(0, 24 * 7, batch), unit='h')
+    features = predictor.build_features(station_ids, timestamps, history)
+
+    reference = None
+    for backend in BACKENDS:
+        predictor.set_backend(backend)
+        predictions = predictor._predict(station_ids, features)  # warm up, builds the flat forest
+        reference = predictions if reference is None else reference
+        start = time.perf_counter()
+        for _ in range(repeats):
+            predictor._predict(station_ids, features)
+        model_ms = (time.perf_counter() - start) / repeats * 1000
+        start = time.perf_counter()
+        for _ in range(repeats):
+            predictor.predict_loads(station_ids, timestamps, history)
+        total_ms = (time.perf_counter() - start) / repeats * 1000
+        print(f"{backend:>8} x{batch:>5}: {model_ms:8.3f} ms model, {total_ms:8.3f} ms with features, "
+              f"max diff {np.abs(predictions - reference).max():.1e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark load model inference backends')
+    parser.add_argument('--stations', type=int, default=50)
+    parser.add_argument('--days', type=int, default=28)
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+
+    history = build_history(args.stations, args.days)
+    predictor = LoadPredictor()
+    start = time.perf_counter()
+    predictor.train(history)
+    print(f"Trained on {len(history)} records in {time.perf_counter() - start:.1f}s")
+
+    for batch in (1, 1000):
+        benchmark(predictor, history, batch, args.repeats)
+
+
+if __name__ == '__main__':
+    main()
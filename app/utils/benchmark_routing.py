@@ -0,0 +1,57 @@
+"""Compare route search methods. Run from app/: python -m utils.benchmark_routing"""
+import argparse
+import time
+import numpy as np
+
+from routing.dijkstra import ChargingRouter, Station
+
+METHODS = ['dijkstra', 'astar', 'bidirectional_astar', 'ch']
+
+
+def build_router(num_stations: int, seed: int = 42) -> ChargingRouter:
+    """Build a router over randomly placed stations connected by kNN."""
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(40.9, 42.1, num_stations)  # roughly Connecticut
+    lngs = rng.uniform(-73.7, -71.8, num_stations)
+
+    router = ChargingRouter()
+    for i in range(num_stations):
+        router.add_station(Station(i + 1, f'Station {i + 1}', lats[i], lngs[i],
+                                   2, 0.0, 'available', 50))
+    router.connect_nearest_stations(k=6)
+    return router
+
+
+def benchmark(router: ChargingRouter, num_queries: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    ids = router.graph.ids
+    pairs = [(int(a), int(b)) for a, b in rng.choice(ids, size=(num_queries, 2))]
+
+    for method in METHODS:
+        settled = []
+        start = time.perf_counter()
+        for start_id, end_id in pairs:
+            result = router.search_route(start_id, end_id, 75, 100, 0.2, method=method)
+            settled.append(result.settled)
+        elapsed = (time.perf_counter() - start) / num_queries * 1000
+        print(f"{method:>20}: {elapsed:8.3f} ms/query, {np.mean(settled):8.1f} settled nodes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark route search methods')
+    parser.add_argument('--stations', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--save', help='write the contraction hierarchy to this .npz path')
+    args = parser.parse_args()
+
+    router = build_router(args.stations)
+    start = time.perf_counter()
+    router.build_contraction_hierarchy(args.save)
+    print(f"Contracted {args.stations} stations in {time.perf_counter() - start:.1f}s "
+          f"({len(router.hierarchy.indices)} upward edges)")
+
+    benchmark(router, args.queries)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+"""Precompute station distance matrices. Run from app/: python -m utils.build_distance_matrix"""
+import argparse
+import time
+
+from routing.dijkstra import ChargingRouter
+from routing.loader import load_stations_from_csv
+from routing.matrix import compute_distance_matrices
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute all-pairs station distance matrices')
+    parser.add_argument('--csv', default='../Electric_Vehicle_Charging_Stations.csv')
+    parser.add_argument('--output', default='models/distance_matrix')
+    parser.add_argument('--neighbors', type=int, default=6)
+    parser.add_argument('--radius-km', type=float, default=None)
+    parser.add_argument('--block-size', type=int, default=256)
+    args = parser.parse_args()
+
+    router = ChargingRouter()
+    load_stations_from_csv(router, args.csv, k=args.neighbors, radius_km=args.radius_km)
+
+    start = time.perf_counter()
+    compute_distance_matrices(router.graph, args.output, block_size=args.block_size,
+                              k=args.neighbors, radius_km=args.radius_km)
+    n = router.graph.number_of_nodes()
+    print(f"Wrote {n}x{n} distance matrices to {args.output} "
+          f"in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Training worker for the load prediction model. Run from app/:
+
+    python -m utils.update_load_model              # publish one new version
+    python -m utils.update_load_model --every 900  # keep publishing
+    python -m utils.update_load_model --rollback   # serve the previous version
+
+Nightly full retrains can fit one forest per station (or per region from a
+station_id,region CSV) in parallel:
+
+    python -m utils.update_load_model --retrain --partition station --workers 8
+"""
+import argparse
+import logging
+import time
+from functools import partial
+
+import pandas as pd
+
+from ml.load_predictor import LoadPredictor
+from ml.partitioned import PartitionedLoadPredictor
+from ml.training import current_version, rollback, update_model
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train and publish load prediction model versions')
+    parser.add_argument('--data', default='data/historical_loads.csv')
+    parser.add_argument('--model-dir', default='models')
+    parser.add_argument('--every', type=float, default=None,
+                        help='seconds between updates; runs once if omitted')
+    parser.add_argument('--rollback', action='store_true',
+                        help='switch back to the version the current one was trained from')
+    parser.add_argument('--retrain', action='store_true',
+                        help='train from the complete history instead of updating')
+    parser.add_argument('--partition', choices=['none', 'station', 'region'], default='none',
+                        help='fit one model per station or region when training from scratch')
+    parser.add_argument('--regions', default=None,
+                        help='CSV with station_id and region columns for --partition region')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='training processes for partitioned models (default: all cores)')
+    args = parser.parse_args()
+
+    new_predictor = LoadPredictor
+    if args.partition != 'none':
+        regions = None
+        if args.partition == 'region':
+            if args.regions is None:
+                parser.error('--partition region needs --regions')
+            table = pd.read_csv(args.regions)
+            regions = dict(zip(table['station_id'], table['region']))
+        new_predictor = partial(PartitionedLoadPredictor, regions=regions, workers=args.workers)
+
+    if args.rollback:
+        print(f"Serving model version {rollback(args.model_dir)} from {args.model_dir}")
+        return
+
+    while True:
+        start = time.perf_counter()
+        try:
+            consumed = update_model(args.data, args.model_dir, retrain=args.retrain,
+                                    new_predictor=new_predictor)
+        except Exception:
+            if args.every is None:
+                raise
+            # Keep the worker alive; the next iteration retries from the checkpoint
+            logger.exception('Model update failed; still serving %s',
+                             current_version(args.model_dir))
+            time.sleep(args.every)
+            continue
+        if consumed:
+            print(f"Published model version {current_version(args.model_dir)} "
+                  f"with {consumed} new records in {time.perf_counter() - start:.2f}s")
+        else:
+            print(f"No new records; still serving {current_version(args.model_dir)}")
+        if args.every is None:
+            break
+        time.sleep(args.every)
+
+
+if __name__ == '__main__':
+    main()
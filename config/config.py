@@ -27,6 +27,12 @@ class Config:
 
     # Route settings
     MAX_ROUTE_DISTANCE = 100  # km
+    MAX_DETOUR_KM = 50  # corridor width for charging station candidates
+    GRAPH_NEIGHBORS = 6  # k nearest stations connected in the road graph
+    GRAPH_RADIUS_KM = None  # optional cap on connection length
+    LOAD_PROFILE_HOURS = 6  # hourly load buckets for time-dependent routing
+    MAX_ALTERNATIVE_ROUTES = 5  # upper bound on the k parameter of /api/route
+    ALTERNATIVE_MAX_SETTLED = 20000  # search budget for alternative routes
     MIN_BATTERY_THRESHOLD = 20  # percentage
     DEFAULT_VEHICLE_EFFICIENCY = 0.2  # kWh/km
 
@@ -194,4 +194,29 @@ def test_get_user_profile(client, auth_headers, sample_user):
     assert response.status_code == 200
     data = json.loads(response.data)
     assert data['username'] == sample_user['username']
-    assert data['email'] == sample_user['email'] 
\ No newline at end of file
+    assert data['email'] == sample_user['email'] 
+
+def test_optimize_route_leaves_directions_time_after_slow_traffic(app, client, monkeypatch):
+    import time
+    from app.routes import route_routes
+    from app.services.traffic import StubTrafficProvider, TrafficService
+
+    # Traffic lookups never come back within the whole route budget
+    slow = TrafficService(StubTrafficProvider(latency=1.0), executor=route_routes.external_calls)
+    monkeypatch.setattr(route_routes, 'traffic', slow)
+    monkeypatch.setattr(route_routes, 'ROUTE_DEADLINE_SECONDS', 0.5)
+
+    def directions(**kwargs):
+        time.sleep(0.1)
+        return [{'summary': 'test'}]
+    monkeypatch.setattr(route_routes.gmaps, 'directions', directions)
+
+    db.session.add(Station(name='Midway', latitude=51.51, longitude=-0.12, current_availability=2))
+    db.session.commit()
+    response = client.post('/api/route', json={
+        'source_lat': 51.50, 'source_lng': -0.13, 'dest_lat': 51.52, 'dest_lng': -0.11
+    })
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['stations'][0]['traffic'] == 1.0  # cut off at the traffic deadline
+    assert data['route'] == {'summary': 'test'}
@@ -0,0 +1,68 @@
+import importlib.util
+import json
+import os
+import pytest
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    # A row of 20 stations about 0.84 km apart, in the CSV layout app.py reads
+    rows = ['Station Name,EV Level2 EVSE Num,New Georeferenced Column']
+    rows += [f'S{i},2,POINT (-73.{i:02d} 41.0)' for i in range(1, 21)]
+    (tmp_path / 'Electric_Vehicle_Charging_Stations.csv').write_text('\n'.join(rows) + '\n')
+    workdir = tmp_path / 'app'
+    workdir.mkdir()
+    monkeypatch.chdir(workdir)
+    monkeypatch.syspath_prepend(APP_DIR)
+
+    spec = importlib.util.spec_from_file_location('ev_app', os.path.join(APP_DIR, 'app.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    yield module
+    module.load_refresher.stop()
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+def test_route_cache_separates_vehicles_in_one_battery_bucket(client):
+    request = {'start_id': 1, 'end_id': 20, 'battery_capacity': 75,
+               'vehicle_efficiency': 0.2, 'plan_charging': True}
+    first = client.post('/api/route', json=dict(request, current_charge=21)).get_json()
+    second = client.post('/api/route', json=dict(request, current_charge=24)).get_json()
+    assert second['arrival_charge'] == pytest.approx(first['arrival_charge'] + 3)
+
+    # Plain routes only share an entry when the hop limit is the same
+    plain = {'start_id': 1, 'end_id': 20, 'battery_capacity': 75, 'vehicle_efficiency': 0.2}
+    assert client.post('/api/route', json=dict(plain, current_charge=0.1)).status_code == 404
+    assert client.post('/api/route', json=dict(plain, current_charge=4.9)).status_code == 200
+
+@pytest.mark.parametrize("body", [
+    {'pairs': [{'start_id': 1, 'end_id': 2, 'battery_capacity': 'big'}]},
+    {'pairs': [{'start_id': 1, 'end_id': 2}, {'start_id': 1, 'end_id': 3, 'current_charge': None}]},
+    {'pairs': [{'start_id': 1, 'end_id': 2}], 'vehicle_efficiency': 0},
+    {'pairs': [{'start_id': [1], 'end_id': 2}]},
+])
+def test_batch_rejects_invalid_pairs_before_streaming(client, body):
+    response = client.post('/api/routes/batch', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+def test_batch_coerces_numeric_strings(client):
+    response = client.post('/api/routes/batch', json={
+        'pairs': [{'start_id': 1, 'end_id': 5, 'current_charge': '20'}, {'start_id': 1, 'end_id': 99}],
+        'battery_capacity': '75'})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert response.status_code == 200
+    assert [line['index'] for line in lines] == [0, 1]
+    assert lines[0]['route'][0] == 1 and lines[0]['route'][-1] == 5
+    assert lines[1]['error'] == 'Station not found'
+
+@pytest.mark.parametrize("ids", [{'start_id': 1, 'end_id': 99}, {'start_id': 0, 'end_id': 5},
+                                 {'end_id': 5}, {'start_id': [1], 'end_id': 5}])
+def test_route_to_unknown_station_is_not_found(client, ids):
+    for extra in ({}, {'plan_charging': True}, {'k': 2}):
+        response = client.post('/api/route', json=dict(ids, **extra))
+        assert response.status_code == 404
+        assert response.get_json()['error'] == 'Station not found'
@@ -1,6 +1,15 @@
+import os
 import pytest
 import numpy as np
-from app.ml.load_predictor import LoadPredictor
+import pandas as pd
+from app.ml.load_predictor import (LoadIndex, LoadPredictor, N_ESTIMATORS,
+                                   UPDATE_ESTIMATORS)
+from app.ml.flat_forest import FlatForest
+from app.ml.load_snapshot import LoadRefresher, StaticModel
+from app.ml.partitioned import PartitionedLoadPredictor
+from app.ml.training import (CHECKPOINT_FILE, MODEL_FILE, SCALER_FILE, ModelStore,
+                             TrainingCheckpoint, current_version, load_model, rollback,
+                             update_model, version_dir)
 from datetime import datetime, timedelta
 
 @pytest.fixture
@@ -112,4 +121,289 @@ def test_feature_importance(predictor, sample_data):
     
     assert len(importance) == 5  # Should have importance for all features
     assert all(0 <= imp <= 1 for imp in importance.values())  # Importance should be between 0 and 1
-    assert sum(importance.values()) == pytest.approx(1.0)  # Should sum to 1 
\ No newline at end of file
+    assert sum(importance.values()) == pytest.approx(1.0)  # Should sum to 1 
+
+
+@pytest.fixture
+def historical_loads():
+    rng = np.random.default_rng(0)
+    timestamps = pd.date_range('2024-01-01', periods=24 * 21, freq='h')
+    return pd.DataFrame({
+        'station_id': np.repeat([3, 1, 2], len(timestamps)),
+        'timestamp': np.tile(timestamps, 3),
+        'load': rng.uniform(0, 1, 3 * len(timestamps))
+    })
+
+def test_load_index_matches_dataframe_filter(predictor, historical_loads):
+    timestamp = datetime(2024, 1, 30, 17)
+    features = predictor.prepare_features(2, timestamp, historical_loads)
+    assert features.shape == (1, 11)
+    assert list(features[0, :4]) == [17, timestamp.weekday(), 1, 30]
+    
+    for i in range(1, 8):
+        prev_time = timestamp - timedelta(days=i)
+        expected = historical_loads[
+            (historical_loads['station_id'] == 2) &
+            (historical_loads['timestamp'].dt.hour == prev_time.hour) &
+            (historical_loads['timestamp'].dt.weekday == prev_time.weekday())
+        ]['load'].mean()
+        assert features[0, 3 + i] == pytest.approx(expected)
+    
+    # Stations without history get zero historical load
+    assert not predictor.prepare_features(99, timestamp, historical_loads)[0, 4:].any()
+
+def test_load_index_skips_missing_loads(historical_loads):
+    gappy = historical_loads.copy()
+    gappy.loc[::5, 'load'] = np.nan
+    gappy.loc[1, 'load'] = np.inf
+    index = LoadIndex(gappy)
+    assert np.isfinite(index.mean_load).all()
+    np.testing.assert_allclose(index.mean_load,
+                               LoadIndex(gappy[np.isfinite(gappy['load'])]).mean_load)
+
+def test_train_with_load_index(predictor, historical_loads):
+    predictor.train(historical_loads)
+    assert 0 <= predictor.predict_load(1, datetime(2024, 1, 22, 8), historical_loads) <= 1
+    
+    profiles = predictor.predict_load_profiles([1, 2, 3], datetime(2024, 1, 22, 8, 40), 4,
+                                               historical_loads)
+    assert profiles.shape == (3, 4)
+    assert profiles[1, 2] == pytest.approx(
+        predictor.predict_load(2, datetime(2024, 1, 22, 10), historical_loads))
+
+def test_batched_predictions_match_single(predictor, historical_loads):
+    predictor.train(historical_loads)
+    start = datetime(2024, 1, 22, 8)
+    station_ids = [3, 1, 99, 2]
+    
+    loads = predictor.predict_loads(station_ids, start, historical_loads)
+    assert loads.shape == (4,)
+    for station_id, load in zip(station_ids, loads):
+        assert load == pytest.approx(predictor.predict_load(station_id, start, historical_loads))
+    
+    route_loads = predictor.predict_loads_for_route(station_ids, start, historical_loads)
+    assert route_loads[2] == pytest.approx(
+        predictor.predict_load(2, start + timedelta(minutes=90), historical_loads))
+    assert len(predictor.predict_loads([], start, historical_loads)) == 0
+
+def test_load_refresher_publishes_immutable_snapshots(predictor, historical_loads):
+    predictor.train(historical_loads)
+    now = [datetime(2024, 1, 22, 8, 40)]
+    station_ids = [3, 1, 2]
+    refresher = LoadRefresher(StaticModel(predictor, historical_loads), lambda: station_ids,
+                              hours=4, clock=lambda: now[0])
+    assert refresher.snapshot.load(1) is None
+    
+    assert refresher.refresh()
+    snapshot = refresher.snapshot
+    assert snapshot.start == datetime(2024, 1, 22, 8)
+    assert snapshot.loads.shape == (3, 4)
+    assert snapshot.load(2, 2) == pytest.approx(
+        predictor.predict_load(2, datetime(2024, 1, 22, 10), historical_loads))
+    assert snapshot.current[1] == pytest.approx(snapshot.load(1))
+    assert (snapshot.profiles([2, 99])[0] == snapshot.loads[1]).all()
+    assert not snapshot.profiles([2, 99])[1].any()
+    with pytest.raises(ValueError):
+        snapshot.loads[0, 0] = 1
+    
+    # Same hour and stations: nothing to recompute
+    now[0] = datetime(2024, 1, 22, 8, 59)
+    assert not refresher.refresh()
+    assert refresher.snapshot is snapshot
+    
+    now[0] = datetime(2024, 1, 22, 9, 1)
+    assert refresher.refresh()
+    assert refresher.snapshot.version != snapshot.version
+    assert snapshot.start == datetime(2024, 1, 22, 8)
+    
+    # A failing refresh keeps serving the last snapshot
+    refresher.models = StaticModel(predictor, None)
+    refresher.invalidate()
+    published = refresher.snapshot
+    assert not refresher.refresh()
+    assert refresher.snapshot is published and refresher.failures == 1
+
+def test_load_refresher_waits_quietly_for_a_model(historical_loads, tmp_path, caplog):
+    data_path = str(tmp_path / 'loads.csv')
+    model_dir = str(tmp_path / 'models')
+    historical_loads.to_csv(data_path, index=False)
+    refresher = LoadRefresher(ModelStore(model_dir), lambda: [1, 2, 3], hours=2)
+    
+    # Nothing published yet: no failure and nothing logged, every interval
+    assert not refresher.refresh() and not refresher.refresh()
+    assert refresher.failures == 0 and refresher.snapshot.version == 'empty'
+    assert not [record for record in caplog.records if record.levelname == 'ERROR']
+    
+    update_model(data_path, model_dir)
+    assert refresher.refresh()
+    assert refresher.snapshot.model_version == current_version(model_dir)
+
+def test_incremental_update_reads_only_new_records(historical_loads, tmp_path):
+    data_path = str(tmp_path / 'loads.csv')
+    model_dir = str(tmp_path / 'models')
+    first, second = historical_loads.iloc[:1000], historical_loads.iloc[1000:]
+    first.to_csv(data_path, index=False)
+    
+    assert update_model(data_path, model_dir) == 1000
+    assert update_model(data_path, model_dir) == 0
+    
+    # Append new records plus a line that is still being written
+    with open(data_path, 'a') as f:
+        second.to_csv(f, index=False, header=False)
+        f.write('1,2024-01-')
+    assert update_model(data_path, model_dir) == len(second)
+    
+    predictor, index, version = load_model(model_dir)
+    assert len(predictor.model.estimators_) == N_ESTIMATORS + UPDATE_ESTIMATORS
+    np.testing.assert_allclose(index.mean_load, LoadIndex(historical_loads).mean_load)
+    checkpoint = TrainingCheckpoint.load(
+        os.path.join(version_dir(model_dir, version), CHECKPOINT_FILE), data_path)
+    assert checkpoint.rows == len(historical_loads) and checkpoint.updates == 2
+    assert 0 <= predictor.predict_load(1, datetime(2024, 1, 22, 8), index) <= 1
+    
+    # A rewritten file is trained from scratch
+    first.to_csv(data_path, index=False)
+    assert update_model(data_path, model_dir) == 1000
+    assert len(load_model(model_dir)[0].model.estimators_) == N_ESTIMATORS
+
+def test_model_versions_swap_and_roll_back(historical_loads, tmp_path):
+    data_path = str(tmp_path / 'loads.csv')
+    model_dir = str(tmp_path / 'models')
+    historical_loads.iloc[:1000].to_csv(data_path, index=False)
+    
+    store = ModelStore(model_dir)
+    refresher = LoadRefresher(store, lambda: [1, 2, 3], hours=2,
+                              clock=lambda: datetime(2024, 1, 22, 8))
+    assert not refresher.refresh() and store.active.version is None
+    
+    update_model(data_path, model_dir)
+    first = current_version(model_dir)
+    assert refresher.refresh()
+    assert refresher.snapshot.model_version == first
+    
+    # The server keeps its loaded model while a new version is written
+    active = store.active
+    with open(data_path, 'a') as f:
+        historical_loads.iloc[1000:].to_csv(f, index=False, header=False)
+    update_model(data_path, model_dir)
+    second = current_version(model_dir)
+    assert second != first and store.active is active
+    
+    assert refresher.refresh()
+    assert store.active.version == second and store.swaps == 2
+    assert len(store.active.predictor.model.estimators_) > len(active.predictor.model.estimators_)
+    
+    assert rollback(model_dir) == first
+    assert refresher.refresh()
+    assert refresher.snapshot.model_version == first
+    with pytest.raises(ValueError):
+        rollback(model_dir)
+    
+    # A version that cannot be loaded is skipped, the served model kept
+    os.remove(os.path.join(version_dir(model_dir, second), 'load_predictor.joblib'))
+    with open(os.path.join(model_dir, 'CURRENT'), 'w') as f:
+        f.write(second)
+    assert not store.poll()
+    assert store.active.version == first and store.failures == 1
+
+def test_baseline_model_is_migrated(historical_loads, tmp_path):
+    data_path = str(tmp_path / 'loads.csv')
+    historical_loads.iloc[:1000].to_csv(data_path, index=False)
+    
+    # Releases before versioning saved only a model and scaler in model_dir
+    model_dir = tmp_path / 'models'
+    model_dir.mkdir()
+    predictor = LoadPredictor()
+    predictor.train(historical_loads.iloc[:1000])
+    predictor.save_model(str(model_dir / MODEL_FILE), str(model_dir / SCALER_FILE))
+    
+    # Without the training data the load index cannot be rebuilt
+    assert ModelStore(str(model_dir), data_path=str(tmp_path / 'missing.csv')).active.version is None
+    
+    store = ModelStore(str(model_dir), data_path=data_path)
+    assert store.active.version == current_version(str(model_dir)) is not None
+    assert store.active.predictor.is_trained
+    assert store.active.historical_data.counts.sum() == 1000
+    # Appended records update the migrated model instead of retraining it
+    with open(data_path, 'a') as f:
+        historical_loads.iloc[1000:].to_csv(f, index=False, header=False)
+    assert update_model(data_path, str(model_dir)) == len(historical_loads) - 1000
+    assert len(load_model(str(model_dir))[0].model.estimators_) == N_ESTIMATORS + UPDATE_ESTIMATORS
+
+def test_train_reuses_fingerprinted_artifacts(historical_loads, tmp_path):
+    cache_dir = str(tmp_path / 'artifacts')
+    first = LoadPredictor()
+    assert first.train(historical_loads, cache_dir=cache_dir)
+    
+    cached = LoadPredictor()
+    cached.model.fit = None  # must not be called
+    assert not cached.train(historical_loads.copy(), cache_dir=cache_dir)
+    timestamp = datetime(2024, 1, 22, 8)
+    assert cached.predict_loads([1, 2, 3], timestamp, historical_loads) == pytest.approx(
+        first.predict_loads([1, 2, 3], timestamp, historical_loads))
+    
+    changed = historical_loads.copy()
+    changed.loc[0, 'load'] += 0.1
+    assert first.fingerprint(changed) != first.fingerprint(historical_loads)
+    deeper = LoadPredictor()
+    deeper.model.set_params(max_depth=12)
+    assert deeper.fingerprint(historical_loads) != first.fingerprint(historical_loads)
+
+def test_partitioned_training_routes_to_station_models(historical_loads, tmp_path):
+    partitioned = PartitionedLoadPredictor(min_rows=100, workers=2)
+    partitioned.train(historical_loads)
+    assert sorted(partitioned.model.models) == [1, 2, 3]
+    
+    # Each station's sub-model is the model trained on that station alone
+    timestamp = datetime(2024, 1, 22, 8)
+    station = LoadPredictor()
+    station.train(historical_loads[historical_loads['station_id'] == 2])
+    assert partitioned.predict_load(2, timestamp, historical_loads) == pytest.approx(
+        station.predict_load(2, timestamp, historical_loads))
+    
+    # Regions share a model; unknown stations use the default partition
+    regional = PartitionedLoadPredictor(regions={1: 'north', 3: 'north'}, min_rows=600, workers=1)
+    regional.train(historical_loads)
+    assert sorted(map(str, regional.model.models)) == ['__default__', 'north']
+    loads = regional.predict_loads([1, 2, 3, 99], timestamp, historical_loads)
+    assert loads[3] == pytest.approx(regional.model.models['__default__'].predict_load(
+        99, timestamp, historical_loads))
+    
+    # Saved partitioned versions are updated partition by partition
+    data_path = str(tmp_path / 'loads.csv')
+    model_dir = str(tmp_path / 'models')
+    historical_loads.iloc[:1200].to_csv(data_path, index=False)
+    update_model(data_path, model_dir,
+                 new_predictor=lambda: PartitionedLoadPredictor(min_rows=100, workers=1))
+    with open(data_path, 'a') as f:
+        historical_loads.iloc[1200:].to_csv(f, index=False, header=False)
+    update_model(data_path, model_dir)
+    predictor, index, _ = load_model(model_dir)
+    assert isinstance(predictor, PartitionedLoadPredictor)
+    assert len(predictor.model.models[2].model.estimators_) == N_ESTIMATORS + UPDATE_ESTIMATORS
+    assert len(predictor.model.models[3].model.estimators_) == N_ESTIMATORS
+
+def test_flat_forest_matches_sklearn(predictor, historical_loads):
+    predictor.train(historical_loads)
+    forest = FlatForest(predictor.model)
+    assert len(forest) == N_ESTIMATORS
+    
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(500, 11))
+    # Rows sitting exactly on split thresholds must branch like scikit-learn
+    X[:50, forest.feature[forest.roots]] = forest.threshold[forest.roots]
+    np.testing.assert_allclose(forest.predict(X), predictor.model.predict(X), rtol=1e-12)
+    
+    timestamps = pd.date_range('2024-01-22', periods=48, freq='h')
+    station_ids = np.tile([1, 2, 3, 99], 12)
+    expected = predictor.predict_loads(station_ids, timestamps, historical_loads)
+    predictor.set_backend('flat')
+    np.testing.assert_allclose(predictor.predict_loads(station_ids, timestamps, historical_loads),
+                               expected, rtol=1e-12)
+    assert predictor.predict_load(2, timestamps[5], historical_loads) == pytest.approx(expected[5])
+    
+    # The flat forest follows model updates
+    predictor.update(historical_loads.iloc[:200], historical_loads)
+    assert len(predictor.flat_forest()) == N_ESTIMATORS + UPDATE_ESTIMATORS
+    with pytest.raises(ValueError):
+        predictor.set_backend('onnx')
@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+from types import SimpleNamespace
+from app.services.route_optimizer import (calculate_distance, calculate_station_score,
+                                          calculate_station_scores, corridor_bounds,
+                                          corridor_filter, find_optimal_station,
+                                          find_top_stations)
+from app.services.traffic import GoogleMapsTrafficProvider, StubTrafficProvider, TrafficService
+
+SOURCE = (41.0, -73.0)
+DESTINATION = (41.5, -72.5)
+
+class StubMapsClient:
+    """Distance Matrix stub with a fixed duration per destination; others fail"""
+
+    def __init__(self, durations):
+        self.durations = durations
+
+    def distance_matrix(self, origins, destinations, **kwargs):
+        elements = []
+        for destination in destinations:
+            duration = self.durations.get(destination)
+            elements.append({'status': 'NOT_FOUND'} if duration is None else
+                            {'status': 'OK', 'duration_in_traffic': {'value': duration}})
+        return {'rows': [{'elements': elements}]}
+
+@pytest.fixture
+def stations():
+    def station(i, lat, lng, available, capacity):
+        return SimpleNamespace(id=i, latitude=lat, longitude=lng,
+                               current_availability=available, capacity=capacity)
+    return [
+        station(0, 41.2, -72.8, 2, 4),
+        station(1, 41.3, -72.9, 1, 2),
+        station(2, 41.2, -72.8, 2, 4),  # ties with station 0
+        station(3, 41.1, -72.7, 0, 0),  # no chargers
+        station(4, 41.4, -72.6, 3, 3),  # no traffic data
+        station(5, 41.25, -72.75, 0, 2),
+    ]
+
+@pytest.fixture
+def client(stations):
+    durations = {f"{s.latitude},{s.longitude}": 600.0 * (s.id + 1) for s in stations if s.id != 4}
+    return StubMapsClient(durations)
+
+def test_vectorized_scores_match_scalar_scores(stations, client):
+    traffic = TrafficService(GoogleMapsTrafficProvider(client))
+    expected = [calculate_station_score(s, SOURCE, DESTINATION, client) for s in stations]
+    assert calculate_station_scores(stations, SOURCE, DESTINATION, traffic) == pytest.approx(expected)
+
+def test_optimal_station_matches_scalar_minimum(stations, client):
+    traffic = TrafficService(GoogleMapsTrafficProvider(client))
+    for subset in (stations, stations[1:], stations[3:]):
+        expected = min(subset, key=lambda s: calculate_station_score(s, SOURCE, DESTINATION, client))
+        assert find_optimal_station(SOURCE, DESTINATION, subset, traffic) is expected
+    
+    # Stations 0 and 2 are identical: the first one wins, like min()
+    assert find_optimal_station(SOURCE, DESTINATION, [stations[2], stations[0]], traffic) is stations[2]
+    assert find_optimal_station(SOURCE, DESTINATION, [], traffic) is None
+
+def in_bounds(bounds, lat, lng):
+    min_lat, max_lat, min_lng, max_lng = bounds
+    return (min_lat <= lat) & (lat <= max_lat) & (min_lng <= lng) & (lng <= max_lng)
+
+def detours(source, destination, lats, lngs):
+    return (calculate_distance(source, (lats, lngs)) + calculate_distance((lats, lngs), destination)
+            - calculate_distance(source, destination))
+
+@pytest.mark.parametrize("source, destination, max_detour", [
+    ((41.0, -73.0), (41.5, -72.5), 10.0),
+    ((41.0, -73.0), (41.0, -73.0), 20.0),  # round trip
+    ((-33.9, 151.2), (-37.8, 145.0), 50.0),
+    ((10.0, 179.9), (10.0, -179.9), 5.0),  # across the antimeridian
+    ((89.5, 0.0), (89.5, 180.0), 5.0),  # over the north pole
+    ((-89.0, 45.0), (-88.5, 30.0), 20.0),
+])
+def test_corridor_bounds_contain_detour_ellipse(source, destination, max_detour):
+    bounds = corridor_bounds(source, destination, max_detour)
+    rng = np.random.default_rng(0)
+    lats = np.concatenate([rng.uniform(-90, 90, 20000),
+                           rng.normal(source[0], 1, 20000).clip(-90, 90),
+                           rng.normal(destination[0], 1, 20000).clip(-90, 90)])
+    lngs = np.concatenate([rng.uniform(-180, 180, 20000),
+                           (rng.normal(source[1], 1, 20000) + 180) % 360 - 180,
+                           (rng.normal(destination[1], 1, 20000) + 180) % 360 - 180])
+    inside = detours(source, destination, lats, lngs) <= max_detour
+    assert inside.any()
+    assert in_bounds(bounds, lats[inside], lngs[inside]).all()
+
+def test_corridor_bounds_are_tight_away_from_the_antimeridian():
+    min_lat, max_lat, min_lng, max_lng = corridor_bounds((41.0, -73.0), (41.5, -72.5), 10.0)
+    assert -74 < min_lng < max_lng < -72
+    assert 40 < min_lat < max_lat < 42
+
+def test_corridor_filter_counts_pruned_candidates():
+    source, destination = (41.0, -73.0), (41.0, -72.0)
+    stations = [SimpleNamespace(id=i, latitude=lat, longitude=lng) for i, (lat, lng) in enumerate([
+        (41.0, -72.5),  # on the way
+        (41.15, -72.5),  # a few km out of the way
+        (42.0, -72.5),  # far off
+        (41.05, -73.0),
+        (40.0, -74.0),
+    ])]
+    lats = np.array([s.latitude for s in stations])
+    lngs = np.array([s.longitude for s in stations])
+    within = detours(source, destination, lats, lngs) <= 15.0
+    
+    kept, pruned = corridor_filter(stations, source, destination, 15.0)
+    assert kept == [s for s, ok in zip(stations, within) if ok]
+    assert [s.id for s in kept] == [0, 1, 3]
+    assert pruned == 2
+    assert corridor_filter([], source, destination, 15.0) == ([], 0)
+
+@pytest.fixture
+def tied_stations():
+    # 40 stations on 5 sites with 2 availability levels: many exact ties
+    sites = [(41.2, -72.8), (41.3, -72.9), (41.1, -72.7), (41.25, -72.75), (41.4, -72.6)]
+    return [SimpleNamespace(id=i, latitude=sites[i % 5][0], longitude=sites[i % 5][1],
+                            current_availability=(i // 5) % 2 + 1, capacity=2)
+            for i in range(40)]
+
+@pytest.mark.parametrize("limit", [0, 1, 2, 7, 8, 39, 40, 100])
+def test_top_stations_match_full_sort(tied_stations, limit):
+    traffic = TrafficService(StubTrafficProvider())
+    scores = calculate_station_scores(tied_stations, SOURCE, DESTINATION, traffic)
+    # Stable full sort: ties keep their position in the list
+    expected = sorted(range(len(tied_stations)), key=lambda i: scores[i])[:limit]
+    
+    ranked = find_top_stations(SOURCE, DESTINATION, tied_stations, traffic, limit=limit)
+    assert [station.id for station, _ in ranked] == expected
+    for station, components in ranked:
+        assert components['score'] == scores[station.id]
+    if limit:
+        assert ranked[0][0] is find_optimal_station(SOURCE, DESTINATION, tied_stations, traffic)
+
+def test_top_stations_of_no_stations():
+    assert find_top_stations(SOURCE, DESTINATION, [], TrafficService(StubTrafficProvider()), limit=3) == []
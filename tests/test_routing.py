@@ -1,5 +1,12 @@
+import numpy as np
 import pytest
+from app.routing.cache import TTLCache
 from app.routing.dijkstra import ChargingRouter, Station
+from app.routing.dynamic import ShortestPathTree
+from app.routing.geo import haversine
+from app.routing.loader import load_stations
+from app.routing.matrix import DistanceMatrix, compute_distance_matrices
+from app.routing.search import shortest_path_tree
 
 @pytest.fixture
 def sample_stations():
@@ -94,4 +101,467 @@ def test_update_station_status(router):
     router.update_station_status(1, 0.8, "occupied")
     station_info = router.get_station_info(1)
     assert station_info['current_load'] == 0.8
-    assert station_info['status'] == "occupied" 
\ No newline at end of file
+    assert station_info['status'] == "occupied" 
+
+
+def test_csr_adjacency(router):
+    graph = router.graph
+    assert graph.number_of_nodes() == 5
+    assert graph.number_of_edges() == 5
+    assert len(graph.indptr) == 6
+    assert sorted(graph.neighbors(1)) == [2, 5]
+
+def test_readding_connection_overwrites_distance(router):
+    router.add_connection(1, 5, 0.5)
+    route, distance = router.find_optimal_route(
+        start_id=1,
+        end_id=5,
+        battery_capacity=75,
+        current_charge=80,
+        vehicle_efficiency=0.2
+    )
+    assert route == [1, 5]
+    assert distance == 0.5
+    assert router.graph.number_of_edges() == 5
+
+def test_predicted_loads_steer_route(router):
+    route, _ = router.find_optimal_route(1, 4, 75, 80, 0.2)
+    assert route == [1, 2, 3, 4]
+    
+    route, distance = router.find_optimal_route(
+        1, 4, 75, 80, 0.2,
+        predicted_loads={2: 0.9}
+    )
+    assert route == [1, 5, 4]
+    assert distance == 5.0
+
+def test_time_dependent_route_uses_arrival_hour(router):
+    # Station 2 is busy for the first hour of the window only
+    profiles = np.zeros((5, 3))
+    profiles[1, 0] = 0.9
+    
+    early = router.find_time_dependent_route(1, 4, 75, 80, 0.2, profiles, start_minute=0)
+    assert early.route == [1, 5, 4]
+    assert early.arrival_minutes == [0.0, 8.0, 10.0]
+    
+    # Leaving a minute before the hour ends, station 2 is reached after it
+    late = router.find_time_dependent_route(1, 4, 75, 80, 0.2, profiles, start_minute=59)
+    assert late.route == [1, 2, 3, 4]
+    assert late.total_distance == 4.5
+
+def test_unreachable_station_returns_empty_route(router):
+    router.update_station_status(5, 0.5, "maintenance")
+    route, distance = router.find_optimal_route(1, 5, 75, 80, 0.2)
+    assert route == []
+    assert distance == float('inf')
+
+def test_connect_nearest_stations_uses_geography():
+    router = ChargingRouter()
+    # Rows deliberately out of geographic order along a meridian
+    for station_id, lat in [(1, 51.0), (2, 51.3), (3, 51.1), (4, 51.2)]:
+        router.add_station(Station(station_id, f"S{station_id}", lat, 0.0, 2, 0.0, "available", 50))
+    
+    added = router.connect_nearest_stations(k=1)
+    assert added == 3
+    assert router.graph.has_edge(1, 3)
+    assert router.graph.has_edge(3, 4)
+    assert router.graph.has_edge(4, 2)
+    assert not router.graph.has_edge(1, 2)
+    
+    route, distance = router.find_optimal_route(1, 2, 75, 80, 0.2)
+    assert route == [1, 3, 4, 2]
+    assert distance == pytest.approx(33.36, abs=0.05)
+
+def test_connect_nearest_stations_within_radius():
+    router = ChargingRouter()
+    for station_id, lat in [(1, 51.0), (2, 51.05), (3, 52.0)]:
+        router.add_station(Station(station_id, f"S{station_id}", lat, 0.0, 2, 0.0, "available", 50))
+    
+    router.connect_nearest_stations(k=None, radius_km=10)
+    assert router.graph.has_edge(1, 2)
+    assert router.graph.number_of_edges() == 1
+
+def test_connect_nearest_stations_rejects_k_below_one(router):
+    with pytest.raises(ValueError):
+        router.connect_nearest_stations(k=0)
+
+@pytest.fixture
+def grid_router():
+    router = ChargingRouter()
+    size = 20
+    for row in range(size):
+        for col in range(size):
+            station_id = row * size + col
+            router.add_station(Station(station_id, f"S{station_id}", 41.0 + 0.05 * row,
+                                       -73.0 + 0.05 * col, 2, 0.0, "available", 50))
+    router.connect_nearest_stations(k=4)
+    return router
+
+def test_time_dependent_route_matches_static_loads(grid_router):
+    loads = {station_id: (station_id % 7) / 10 for station_id in grid_router.graph.ids.tolist()}
+    profiles = np.repeat(np.array([loads[i] for i in grid_router.graph.ids.tolist()])[:, None], 4, axis=1)
+    static = grid_router.search_route(0, 399, 75, 80, 0.2, predicted_loads=loads)
+    timed = grid_router.find_time_dependent_route(0, 399, 75, 80, 0.2, profiles)
+    assert timed.total_distance == pytest.approx(static.total_distance)
+    assert len(timed.arrival_minutes) == len(timed.route)
+
+@pytest.mark.parametrize("method", ["dijkstra", "astar", "bidirectional", "bidirectional_astar"])
+def test_search_methods_agree(router, method):
+    route, distance = router.find_optimal_route(1, 4, 75, 80, 0.2, method=method)
+    assert route == [1, 2, 3, 4]
+    assert distance == 4.5
+
+@pytest.mark.parametrize("method", ["astar", "bidirectional", "bidirectional_astar"])
+def test_search_methods_settle_fewer_nodes(grid_router, method):
+    baseline = grid_router.search_route(0, 399, 75, 80, 0.2, method="dijkstra")
+    result = grid_router.search_route(0, 399, 75, 80, 0.2, method=method)
+    assert result.total_distance == pytest.approx(baseline.total_distance)
+    assert result.route[0] == 0 and result.route[-1] == 399
+    assert 0 < result.settled < baseline.settled
+
+def test_unknown_search_method(router):
+    with pytest.raises(ValueError):
+        router.find_optimal_route(1, 5, 75, 80, 0.2, method="teleport")
+
+@pytest.fixture
+def corridor_router():
+    # 1 -- 2 -- 3 -- 4, 100 km hops; only station 3 can charge
+    router = ChargingRouter()
+    for station_id, status, rate in [(1, "available", 0), (2, "available", 0),
+                                     (3, "available", 100), (4, "available", 0)]:
+        router.add_station(Station(station_id, f"S{station_id}", 41.0, -73.0 + station_id,
+                                   2, 0.0, status, rate))
+    router.add_connection(1, 2, 100.0)
+    router.add_connection(2, 3, 100.0)
+    router.add_connection(3, 4, 100.0)
+    return router
+
+def test_plan_charging_route_without_stops(corridor_router):
+    plan = corridor_router.plan_charging_route(1, 4, 100, 80, 0.2)
+    assert plan.route == [1, 2, 3, 4]
+    assert plan.charging_stops == []
+    assert plan.arrival_charge == pytest.approx(20)
+    assert plan.total_minutes == pytest.approx(600)
+
+def test_plan_charging_route_recharges_when_needed(corridor_router):
+    # 40 kWh usable, 60 kWh needed: charge 20 kWh at station 3
+    plan = corridor_router.plan_charging_route(1, 4, 100, 40, 0.2)
+    assert plan.route == [1, 2, 3, 4]
+    assert len(plan.charging_stops) == 1
+    stop = plan.charging_stops[0]
+    assert stop['station_id'] == 3
+    assert stop['energy_kwh'] == pytest.approx(20)
+    assert stop['minutes'] == pytest.approx(12)
+    assert plan.arrival_charge == pytest.approx(0)
+    # 600 driving + 5 stop overhead + 12 charging
+    assert plan.total_minutes == pytest.approx(617)
+
+def test_plan_charging_route_minutes_exclude_load_penalty(corridor_router):
+    plan = corridor_router.plan_charging_route(1, 4, 100, 40, 0.2,
+                                               predicted_loads={2: 0.5, 3: 0.5, 4: 0.5})
+    assert plan.route == [1, 2, 3, 4]
+    assert plan.total_minutes == pytest.approx(617)
+
+def test_plan_charging_route_respects_reserve(corridor_router):
+    plan = corridor_router.plan_charging_route(1, 4, 100, 50, 0.2)
+    assert plan.charging_stops[0]['energy_kwh'] == pytest.approx(10)
+    
+    plan = corridor_router.plan_charging_route(1, 4, 100, 50, 0.2, min_charge=10)
+    assert plan.charging_stops[0]['energy_kwh'] == pytest.approx(20)
+    assert plan.arrival_charge == pytest.approx(10)
+
+def test_plan_charging_route_infeasible(corridor_router):
+    plan = corridor_router.plan_charging_route(1, 4, 100, 30, 0.2)
+    assert plan.route == []
+    assert plan.total_minutes == float('inf')
+
+@pytest.fixture
+def chain_router():
+    # 101 stations in a row, 1.25 km apart (125 km in all); every station can charge
+    router = ChargingRouter()
+    for station_id in range(101):
+        router.add_station(Station(station_id, f"S{station_id}", 41.0, -73.0 + station_id / 100,
+                                   2, 0.0, "available", 50))
+    for station_id in range(100):
+        router.add_connection(station_id, station_id + 1, 1.25)
+    return router
+
+def test_plan_charging_route_does_not_round_up_short_edges(chain_router):
+    # 25 kWh of 75 over 100 short edges
+    plan = chain_router.plan_charging_route(0, 100, 75, 100, 0.2)
+    assert plan.charging_stops == []
+    assert plan.arrival_charge == pytest.approx(100 * 50 / 75)
+
+def test_plan_charging_route_charges_once_for_the_rest_of_the_trip(chain_router):
+    # 22.5 kWh on board, 25 kWh needed: one stop for the missing 2.5 kWh
+    plan = chain_router.plan_charging_route(0, 100, 75, 30, 0.2)
+    assert plan.route == list(range(101))
+    assert len(plan.charging_stops) == 1
+    assert plan.charging_stops[0]['energy_kwh'] == pytest.approx(2.5)
+    assert plan.arrival_charge == pytest.approx(0, abs=1e-6)
+
+@pytest.mark.parametrize("pair", [(0, 399), (5, 250), (399, 20), (123, 123)])
+def test_contraction_hierarchy_matches_dijkstra(grid_router, pair):
+    grid_router.build_contraction_hierarchy()
+    expected = grid_router.search_route(*pair, 75, 80, 0.2, method="dijkstra")
+    result = grid_router.search_route(*pair, 75, 80, 0.2, method="ch")
+    assert result.total_distance == pytest.approx(expected.total_distance)
+    assert result.route[0] == pair[0] and result.route[-1] == pair[1]
+    for u, v in zip(result.route[:-1], result.route[1:]):
+        assert grid_router.graph.has_edge(u, v)
+
+def test_contraction_hierarchy_falls_back_on_unavailable_station(grid_router):
+    grid_router.build_contraction_hierarchy()
+    route = grid_router.find_optimal_route(0, 399, 75, 80, 0.2, method="ch")[0]
+    blocked = route[len(route) // 2]
+    grid_router.update_station_status(blocked, 0.0, "maintenance")
+    
+    route, distance = grid_router.find_optimal_route(0, 399, 75, 80, 0.2, method="ch")
+    expected = grid_router.find_optimal_route(0, 399, 75, 80, 0.2, method="dijkstra")
+    assert blocked not in route
+    assert distance == pytest.approx(expected[1])
+
+def test_contraction_hierarchy_save_and_load(grid_router, tmp_path):
+    path = str(tmp_path / "hierarchy.npz")
+    grid_router.build_contraction_hierarchy(path)
+    grid_router.hierarchy = None
+    grid_router.load_contraction_hierarchy(path)
+    assert grid_router.find_optimal_route(0, 399, 75, 80, 0.2, method="ch")[0]
+    
+    other = ChargingRouter()
+    other.add_station(Station(1, "S1", 41.0, -73.0, 2, 0.0, "available", 50))
+    with pytest.raises(ValueError):
+        other.load_contraction_hierarchy(path)
+
+def test_contraction_hierarchy_rejects_other_edges(grid_router, tmp_path):
+    path = str(tmp_path / "hierarchy.npz")
+    grid_router.build_contraction_hierarchy(path)
+    
+    # Same stations, more neighbours: the edge set differs
+    denser = ChargingRouter()
+    for station_id in grid_router.graph.ids.tolist():
+        info = grid_router.get_station_info(station_id)
+        denser.add_station(Station(station_id, info['name'], info['lat'], info['lng'],
+                                   2, 0.0, "available", 50))
+    denser.connect_nearest_stations(k=8)
+    with pytest.raises(ValueError):
+        denser.load_contraction_hierarchy(path)
+
+def test_contraction_hierarchy_falls_back_on_missing_edge(grid_router):
+    grid_router.build_contraction_hierarchy()
+    route = grid_router.find_optimal_route(0, 399, 75, 80, 0.2, method="ch")[0]
+    # Pretend an edge on the unpacked path does not exist in the graph
+    graph = grid_router.graph
+    real_find_edge = graph.find_edge
+    missing = (graph.index_of(route[1]), graph.index_of(route[2]))
+    graph.find_edge = lambda u, v: -1 if (u, v) == missing else real_find_edge(u, v)
+    
+    result = grid_router.search_route(0, 399, 75, 80, 0.2, method="ch")
+    expected = grid_router.search_route(0, 399, 75, 80, 0.2, method="astar")
+    assert result.total_distance == pytest.approx(expected.total_distance)
+
+def test_contraction_hierarchy_invalidated_by_new_station(grid_router):
+    grid_router.build_contraction_hierarchy()
+    grid_router.add_station(Station(1000, "New", 41.0, -72.0, 2, 0.0, "available", 50))
+    with pytest.raises(ValueError):
+        grid_router.find_optimal_route(0, 399, 75, 80, 0.2, method="ch")
+
+def test_router_version_bumps_on_changes(router):
+    version = router.version
+    router.add_station(Station(6, "Station 6", 51.5079, -0.1283, 2, 0.0, "available", 50))
+    router.add_connection(5, 6, 1.0)
+    assert router.version == version + 2
+
+def test_update_station_status_reports_availability_changes(router):
+    version = router.version
+    assert router.update_station_status(1, 0.9, "occupied")
+    assert not router.update_station_status(1, 0.5, "occupied")  # load only
+    assert router.update_station_status(1, 0.5, "available")
+    assert not router.update_station_status(999, 0.5, "occupied")  # unknown station
+    assert router.version == version
+
+def test_ttl_cache_lru_ttl_and_counters():
+    now = [0.0]
+    cache = TTLCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)  # evicts 'b', the least recently used
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+    
+    now[0] = 11
+    assert cache.get('a') is None
+    
+    stats = cache.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 2
+    assert stats['evictions'] == 1
+    assert stats['expirations'] == 1
+    assert stats['size'] == 1
+
+def test_ttl_cache_evict():
+    cache = TTLCache(maxsize=4)
+    cache.put('a', {1, 2})
+    cache.put('b', {2, 3})
+    cache.put('c', {4})
+    assert cache.evict(lambda key, stations: 2 in stations) == 2
+    assert cache.get('a') is None and cache.get('b') is None
+    assert cache.get('c') == {4}
+
+def test_find_routes_from_matches_single_queries(grid_router):
+    end_ids = [399, 20, 0, 215]
+    results = grid_router.find_routes_from(0, end_ids, 75, 80, 0.2)
+    assert len(results) == len(end_ids)
+    for end_id, result in zip(end_ids, results):
+        route, distance = grid_router.find_optimal_route(0, end_id, 75, 80, 0.2)
+        assert result.route == route
+        assert result.total_distance == pytest.approx(distance)
+    # One shared tree for the whole group
+    assert len({result.settled for result in results}) == 1
+
+def test_find_routes_from_reports_unreachable(router):
+    router.update_station_status(5, 0.5, "maintenance")
+    results = router.find_routes_from(1, [5, 4], 75, 80, 0.2)
+    assert results[0].route == []
+    assert results[1].route == [1, 2, 3, 4]
+
+def test_distance_matrices(grid_router, tmp_path):
+    compute_distance_matrices(grid_router.graph, str(tmp_path), block_size=64, k=4)
+    matrix = DistanceMatrix(str(tmp_path))
+    assert matrix.matches(grid_router.graph, k=4)
+    assert not matrix.matches(grid_router.graph, k=6)
+    assert not matrix.matches(grid_router.graph, k=4, radius_km=10.0)
+    assert isinstance(matrix.road, np.memmap)
+    assert matrix.road.shape == (400, 400)
+    
+    for start_id, end_id in [(0, 399), (5, 250), (17, 17)]:
+        _, distance = grid_router.find_optimal_route(start_id, end_id, 75, 100, 0.0)
+        assert matrix.road_distance(start_id, end_id) == pytest.approx(distance, rel=1e-5)
+        assert matrix.road_distance(end_id, start_id) == pytest.approx(distance, rel=1e-5)
+    
+    graph = grid_router.graph
+    expected = haversine(graph.lat[0], graph.lng[0], graph.lat[399], graph.lng[399])
+    assert matrix.great_circle_distance(0, 399) == pytest.approx(expected, rel=1e-5)
+    
+    grid_router.add_connection(0, 399, 1.0)
+    assert not matrix.matches(grid_router.graph, k=4)
+
+def test_shortest_path_tree_repair_matches_recompute(grid_router):
+    graph = grid_router.graph
+    rng = np.random.default_rng(0)
+    load_factor = 1 + rng.uniform(0, 1, graph.number_of_nodes())
+    tree = ShortestPathTree(graph, 0, load_factor, max_edge_distance=6.0)
+    
+    for station_id in [21, 42, 21, 210, 399, 42, 210, 1]:
+        available = graph.nodes[station_id]['status'] != 'available'
+        graph.set_status(station_id, 0.0, 'available' if available else 'offline')
+        tree.set_available(graph, graph.index_of(station_id), available)
+        
+        node_factor = np.where(graph.available, load_factor, np.inf)
+        expected = shortest_path_tree(graph, 0, node_factor, max_edge_distance=6.0)[0]
+        np.testing.assert_allclose(tree.dist, expected)
+        route = tree.path(graph, 399)
+        if np.isfinite(expected[399]):
+            assert route.cost == pytest.approx(expected[399])
+
+def test_hot_origin_tree_follows_status_changes(grid_router):
+    router = ChargingRouter(hot_trees=4, hot_threshold=2)
+    router.graph = grid_router.graph
+    
+    first = router.search_route(0, 399, 75, 80, 0.2)
+    hot = router.search_route(0, 399, 75, 80, 0.2)
+    assert first.method == 'dijkstra' and hot.method == 'tree'
+    assert hot.total_distance == pytest.approx(first.total_distance)
+    
+    blocked = hot.route[len(hot.route) // 2]
+    router.update_station_status(blocked, 0.0, 'maintenance')
+    repaired = router.search_route(0, 399, 75, 80, 0.2)
+    assert repaired.method == 'tree' and blocked not in repaired.route
+    assert router.trees.stats()['repairs'] == 1
+    
+    router.update_station_status(blocked, 0.0, 'available')
+    restored = router.find_routes_from(0, [399], 75, 80, 0.2)[0]
+    assert restored.total_distance == pytest.approx(first.total_distance)
+
+def test_alternative_routes_are_diverse(grid_router):
+    best = grid_router.search_route(0, 399, 75, 80, 0.2)
+    routes = grid_router.find_alternative_routes(0, 399, 75, 80, 0.2, k=3)
+    assert 1 < len(routes) <= 3
+    assert routes[0].total_distance == pytest.approx(best.total_distance)
+    
+    first_edges = set(zip(routes[0].route[:-1], routes[0].route[1:]))
+    for other in routes[1:]:
+        assert other.route[0] == 0 and other.route[-1] == 399
+        shared = set(zip(other.route[:-1], other.route[1:])) & first_edges
+        assert len(shared) < len(other.route) - 1
+        assert other.total_distance <= best.total_distance * 1.5
+
+def test_alternative_routes_respect_settled_budget(grid_router, router):
+    best = grid_router.search_route(0, 399, 75, 80, 0.2, method="astar")
+    capped = grid_router.find_alternative_routes(0, 399, 75, 80, 0.2, k=5,
+                                                 max_settled=best.settled)
+    assert len(capped) == 1 and capped[0].settled == best.settled
+    
+    # The optimum itself is cut off by a budget it cannot be found in
+    assert grid_router.find_alternative_routes(0, 399, 75, 80, 0.2, k=5, max_settled=1) == []
+    
+    # The budget also cuts off a later search in progress
+    budget = best.settled + best.settled // 2
+    routes = grid_router.find_alternative_routes(0, 399, 75, 80, 0.2, k=5, max_settled=budget)
+    assert routes[0].settled <= budget
+    
+    # The small fixture only has one other way round
+    routes = router.find_alternative_routes(1, 4, 75, 80, 0.2, k=3)
+    assert [r.route for r in routes] == [[1, 2, 3, 4], [1, 5, 4]]
+
+def test_graph_snapshot_round_trip(grid_router, tmp_path):
+    grid_router.update_station_status(42, 0.3, 'maintenance')
+    grid_router.save_snapshot(str(tmp_path), {'source': 'grid'})
+    expected = grid_router.search_route(0, 399, 75, 80, 0.2)
+    
+    router = ChargingRouter()
+    assert router.load_snapshot(str(tmp_path)) == {'source': 'grid'}
+    assert router.graph.number_of_edges() == grid_router.graph.number_of_edges()
+    assert router.get_station_info(42) == grid_router.get_station_info(42)
+    result = router.search_route(0, 399, 75, 80, 0.2)
+    assert result.route == expected.route
+    
+    # Mapped arrays are copy-on-write: updates stay in this process
+    router.update_station_status(42, 0.0, 'available')
+    router.add_station(Station(1000, "New", 41.0, -72.0, 2, 0.0, "available", 50))
+    router.add_connection(1000, 399, 3.0)
+    assert router.find_optimal_route(0, 1000, 75, 80, 0.2)[0][-2:] == [399, 1000]
+    reloaded = ChargingRouter()
+    reloaded.load_snapshot(str(tmp_path))
+    assert reloaded.get_station_info(42)['status'] == 'maintenance'
+
+def test_graph_snapshot_save_swaps_whole_directory(grid_router, tmp_path):
+    snapshot = tmp_path / 'snapshot'
+    grid_router.save_snapshot(str(snapshot), {'run': 1})
+    first = snapshot.resolve()
+    grid_router.save_snapshot(str(snapshot), {'run': 2})
+    assert snapshot.is_symlink()
+    assert snapshot.resolve() != first and not first.exists()
+    assert ChargingRouter().load_snapshot(str(snapshot)) == {'run': 2}
+    # Only the current snapshot is left next to the link
+    names = sorted(path.name for path in tmp_path.iterdir())
+    assert names == sorted(['snapshot', snapshot.resolve().name])
+
+def test_load_stations_rebuilds_snapshot_on_csv_change(tmp_path):
+    csv_path = tmp_path / 'stations.csv'
+    rows = ['Station Name,EV Level2 EVSE Num,New Georeferenced Column']
+    rows += [f'S{i},2,POINT (-72.{i} 41.{i})' for i in range(1, 6)]
+    csv_path.write_text('\n'.join(rows) + '\n')
+    snapshot = str(tmp_path / 'snapshot')
+    
+    assert not load_stations(ChargingRouter(), str(csv_path), snapshot, k=2)
+    router = ChargingRouter()
+    assert load_stations(router, str(csv_path), snapshot, k=2)
+    assert router.graph.number_of_nodes() == 5
+    assert not load_stations(ChargingRouter(), str(csv_path), snapshot, k=3)
+    
+    csv_path.write_text('\n'.join(rows[:-1]) + '\n')
+    router = ChargingRouter()
+    assert not load_stations(router, str(csv_path), snapshot, k=3)
+    assert router.graph.number_of_nodes() == 4
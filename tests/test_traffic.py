@@ -0,0 +1,81 @@
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from app.services.traffic import (GoogleMapsTrafficProvider, StubTrafficProvider,
+                                  TrafficProvider, TrafficService, geohash, traffic_score)
+
+@pytest.fixture
+def stations():
+    return [SimpleNamespace(id=i, latitude=41.0 + 0.01 * i, longitude=-72.0)
+            for i in range(60)]
+
+def test_geohash_known_value():
+    assert geohash(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+
+def test_traffic_provider_requires_durations():
+    class Incomplete(TrafficProvider):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_traffic_service_batches_and_caches(stations):
+    provider = StubTrafficProvider(speed_kmh=60)
+    now = [1000.0]
+    service = TrafficService(provider, clock=lambda: now[0])
+
+    durations = service.durations((41.0, -72.0), stations)
+    assert provider.calls == 3  # 60 stations in batches of 25
+    assert durations[0] == pytest.approx(0.0)
+    assert durations[1] == pytest.approx(1.11195 / 60 * 3600, rel=1e-4)
+
+    # A nearby origin in the same geohash cell and quarter hour is served from cache
+    service.durations((41.0001, -72.0001), stations)
+    assert provider.calls == 3
+
+    now[0] += 15 * 60
+    service.durations((41.0, -72.0), stations[:10])
+    assert provider.calls == 4
+
+def test_google_provider_falls_back_to_unknown():
+    class Client:
+        def distance_matrix(self, **kwargs):
+            elements = [{'status': 'OK', 'duration_in_traffic': {'value': 1800}},
+                        {'status': 'ZERO_RESULTS'}]
+            return {'rows': [{'elements': elements}]}
+
+    class FailingClient:
+        def distance_matrix(self, **kwargs):
+            raise RuntimeError('network down')
+
+    destinations = [(41.0, -72.0), (41.1, -72.1)]
+    assert GoogleMapsTrafficProvider(Client()).durations((41.2, -72.2), destinations) == [1800.0, None]
+    assert GoogleMapsTrafficProvider(FailingClient()).durations((41.2, -72.2), destinations) == [None, None]
+    assert traffic_score(None) == 1.0
+    assert traffic_score(1800) == pytest.approx(1 / 1.5)
+
+def test_traffic_service_runs_batches_concurrently_within_deadline(stations):
+    provider = StubTrafficProvider(latency=0.2)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        service = TrafficService(provider, executor=executor)
+        start = time.monotonic()
+        durations = service.durations((41.0, -72.0), stations)
+        assert time.monotonic() - start < 0.35  # 3 batches in parallel, not 0.6s
+        assert None not in durations
+
+        slow = TrafficService(StubTrafficProvider(latency=0.5), executor=executor)
+        start = time.monotonic()
+        scores = slow.scores((41.0, -72.0), stations, deadline=time.monotonic() + 0.1)
+        assert time.monotonic() - start < 0.3
+        assert (scores == 1.0).all()
+        assert slow.timeouts == 3
+
+def test_traffic_service_cancels_batches_not_started_by_deadline(stations):
+    provider = StubTrafficProvider(latency=0.2)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        service = TrafficService(provider, executor=executor)
+        durations = service.durations((41.0, -72.0), stations, deadline=time.monotonic() + 0.05)
+        assert durations == [None] * len(stations)
+    # Only the batch already running when the deadline passed was sent
+    assert provider.calls == 1